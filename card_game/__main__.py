@@ -1,72 +1,44 @@
 #!/usr/bin/env python3
 
 import argparse
+import atexit
+import concurrent.futures
 import datetime
-import os
+import functools
+import io
+import itertools
 import pathlib
 import pprint
 import shutil
-import tempfile
-from typing import Optional
+import time
+from typing import Dict, List, Optional, Tuple
 
 import flask
 from PIL import Image, ImageDraw, ImageFont
 
-from . import body_text, card_art, colors, gsheets, icons, upload, util
+from . import (atlas, body_text, card_art, card_template, coalesce, colors,
+               encoding, gsheets, icons, job_queue, memory, profiling,
+               render_context, text_cache, upload, util, watch, worker_pool)
 
 #pylint: disable=too-many-arguments
 
-# Constants
-
-# Unless specified, all sizes are in pixels.
-CARD_WIDTH = int(2.7 * util.PIXELS_PER_INCH)
-CARD_HEIGHT = int(3.7 * util.PIXELS_PER_INCH)
-CARD_MARGIN = int(0.25 * util.PIXELS_PER_INCH)
-CARD_PADDING = int(0.05 * util.PIXELS_PER_INCH)
-BORDER_WIDTH = int(0.1 * util.PIXELS_PER_INCH)
-CORNDER_RADIUS = int(1 / 8 * util.PIXELS_PER_INCH)
-
-# Default icon params
-ICON_HEIGHT = ICON_WIDTH = int(0.3 * util.PIXELS_PER_INCH)
-ICON_FONT = ImageFont.truetype(str(util.LATO_FONT_PATH), int(ICON_WIDTH * 0.75))
-COST_ICON_FONT = ImageFont.truetype(str(util.LATO_FONT_PATH),
-                                    int(ICON_WIDTH * 0.9))
+# Colors of the card chrome. Sizes and fonts come from a RenderContext, since
+# they depend on the output resolution.
 ICON_FONT_COLOR = colors.WHITE
 
-TOP_ICON_X = TOP_ICON_Y = CARD_MARGIN + ICON_HEIGHT // 2
-
-# Cost parameters
-COST_COORD = (TOP_ICON_X, TOP_ICON_Y)
-
-# Describes the max width of card contents
-CONTENT_WIDTH = CARD_WIDTH - 2 * CARD_MARGIN
-
-# Card image parameters
-# Width and height of card image
-CARD_IMAGE_BOTTOM = int(2 * util.PIXELS_PER_INCH)
-CARD_IMAGE_BB = [
-    CARD_MARGIN,
-    CARD_MARGIN,
-    CARD_WIDTH - CARD_MARGIN,
-    CARD_IMAGE_BOTTOM,
-]
-
-# Body text
-BODY_TEXT_BG_BB = [
-    CARD_MARGIN,
-    CARD_IMAGE_BOTTOM + CARD_PADDING,
-    CARD_MARGIN + CONTENT_WIDTH,
-    CARD_HEIGHT - CARD_MARGIN,
-]
-
-BOTTOM_ICON_Y = CARD_HEIGHT - ICON_WIDTH // 2 - CARD_MARGIN
-
-ICON_HOR_MARGIN = ICON_WIDTH // 2 + CARD_MARGIN
-STRENGTH_COORD = (ICON_HOR_MARGIN, BOTTOM_ICON_Y)
+TITLE_BG_COLOR = colors.GREY_50
+TITLE_BG_OUTLINE_COLOR = colors.BLACK
+TITLE_FONT_COLOR = colors.BLACK
 
-HEALTH_COORD = (CARD_WIDTH - ICON_HOR_MARGIN, BOTTOM_ICON_Y)
+ATTRIBUTE_ANCHOR = "mm"
+ATTRIBUTE_TEXT_COLOR = colors.BLACK
+ATTRIBUTE_BG_COLOR = colors.GREY_50
+ATTRIBUTE_BG_OUTLINE_COLOR = colors.BLACK
 
-MANA_COORD = (CARD_WIDTH // 2, BOTTOM_ICON_Y)
+# Resolutions the render server renders at. Each one loads its own fonts,
+# icons and masks, so clients cannot pick arbitrary ones.
+RENDER_SERVER_PIXELS_PER_INCH = sorted(
+    {50, 100, 150, 300, util.PIXELS_PER_INCH})
 
 # Layout functions
 
@@ -74,172 +46,366 @@ MANA_COORD = (CARD_WIDTH // 2, BOTTOM_ICON_Y)
 # We may need to shrink
 def _get_scaled_font(text: str, font: ImageFont.ImageFont, max_width: int):
   while font.getsize(text)[0] > max_width:
-    font = ImageFont.truetype(font.path, font.size - 1)
+    font = render_context.get_font(pathlib.Path(font.path), font.size - 1)
   return font
 
 
-TITLE_BG_HEIGHT = int(0.28 * util.PIXELS_PER_INCH)
-MAX_TITLE_WIDTH = int(CARD_WIDTH * 0.75)
-DEFAULT_TITLE_FONT = ImageFont.truetype(str(util.LEAGUE_GOTHIC_FONT_PATH),
-                                        int(util.PIXELS_PER_INCH * 0.2))
-TITLE_BG_COLOR = colors.GREY_50
-TITLE_BG_RADIUS = int(0.05 * util.PIXELS_PER_INCH)
-TITLE_BG_OUTLINE_COLOR = colors.BLACK
-TITLE_BG_OUTLINE_WIDTH = int(0.025 * util.PIXELS_PER_INCH)
-TITLE_FONT_COLOR = colors.BLACK
-
-
-def render_title(draw: ImageDraw.Draw, desc: util.CardDesc):
-  scaled_font = _get_scaled_font(desc.title, DEFAULT_TITLE_FONT,
-                                 MAX_TITLE_WIDTH)
+def render_title(draw: ImageDraw.Draw, desc: util.CardDesc,
+                 ctx: render_context.RenderContext):
+  scaled_font = _get_scaled_font(desc.title, ctx.title_font,
+                                 ctx.max_title_width)
   text_width, _ = scaled_font.getsize(desc.title)
   if desc.cost is None:
-    text_coord = (CARD_WIDTH // 2, CARD_MARGIN + TITLE_BG_HEIGHT // 2)
-    bg_width = text_width + 4 * CARD_PADDING
-    bg_bb = util.get_centered_bb(text_coord, bg_width, TITLE_BG_HEIGHT)
+    text_coord = (ctx.card_width // 2,
+                  ctx.card_margin + ctx.title_bg_height // 2)
+    bg_width = text_width + 4 * ctx.card_padding
+    bg_bb = util.get_centered_bb(text_coord, bg_width, ctx.title_bg_height)
     text_anchor = "mm"
   else:
-    bg_width = text_width + 4 * CARD_PADDING + ICON_WIDTH
+    bg_width = text_width + 4 * ctx.card_padding + ctx.icon_width
     bg_bb = [
-        CARD_MARGIN, CARD_MARGIN, bg_width + CARD_MARGIN,
-        TITLE_BG_HEIGHT + CARD_MARGIN
+        ctx.card_margin, ctx.card_margin, bg_width + ctx.card_margin,
+        ctx.title_bg_height + ctx.card_margin
     ]
-    text_coord = (CARD_MARGIN +
-                  CARD_PADDING if desc.cost is None else CARD_MARGIN +
-                  CARD_PADDING + ICON_WIDTH, TOP_ICON_Y)
+    text_coord = (ctx.card_margin + ctx.card_padding + ctx.icon_width,
+                  ctx.top_icon_y)
     text_anchor = "lm"
   if desc.card_type == util.CardType.MEMORY:
     draw.rectangle(bg_bb,
                    fill=TITLE_BG_COLOR,
-                   width=TITLE_BG_OUTLINE_WIDTH,
+                   width=ctx.title_bg_outline_width,
                    outline=TITLE_BG_OUTLINE_COLOR)
   else:
     draw.rounded_rectangle(bg_bb,
                            fill=TITLE_BG_COLOR,
-                           radius=TITLE_BG_HEIGHT // 2,
-                           width=TITLE_BG_OUTLINE_WIDTH,
+                           radius=ctx.title_bg_height // 2,
+                           width=ctx.title_bg_outline_width,
                            outline=TITLE_BG_OUTLINE_COLOR)
-  draw.text(text_coord,
-            desc.title,
-            TITLE_FONT_COLOR,
-            font=scaled_font,
-            anchor=text_anchor)
+  text_cache.draw_text(draw,
+                       text_coord,
+                       desc.title,
+                       TITLE_FONT_COLOR,
+                       font=scaled_font,
+                       anchor=text_anchor)
 
 
-# Card Attributes
-ATTRIBUTE_FONT = ImageFont.truetype(str(util.LATO_FONT_PATH),
-                                    int(util.PIXELS_PER_INCH * 0.1))
-ATTRIBUTE_ANCHOR = "mm"
-ATTRIBUTE_HEIGHT = int(0.12 * util.PIXELS_PER_INCH)
-ATTRIBUTE_BG_OUTLINE_WIDTH = int(0.015 * util.PIXELS_PER_INCH)
-ATTRIBUTE_BOTTOM = CARD_HEIGHT
-ATTRIBUTE_COORD = (CARD_WIDTH / 2, CARD_IMAGE_BOTTOM + CARD_PADDING // 2)
-ATTRIBUTE_TEXT_COLOR = colors.BLACK
-MAX_ATTRIBUTE_WIDTH = int(CARD_WIDTH * 0.6)
-ATTRIBUTE_BG_COLOR = colors.GREY_50
-ATTRIBUTE_BG_RADIUS = int(0.1 * util.PIXELS_PER_INCH)
-ATTRIBUTE_BG_OUTLINE_COLOR = colors.BLACK
-
-
-def render_attributes(draw: ImageDraw.Draw, desc: util.CardDesc):
+def render_attributes(draw: ImageDraw.Draw, desc: util.CardDesc,
+                      ctx: render_context.RenderContext):
   text = desc.card_type.value
   if desc.attributes is not None:
     text += f"— {desc.attributes}"
-  font = _get_scaled_font(text, ATTRIBUTE_FONT, MAX_ATTRIBUTE_WIDTH)
+  font = _get_scaled_font(text, ctx.attribute_font, ctx.max_attribute_width)
   width, height = font.getsize(text)
-  width += 2 * CARD_PADDING
-  height += CARD_PADDING
-  bb = util.get_centered_bb(ATTRIBUTE_COORD, width, height)
+  width += 2 * ctx.card_padding
+  height += ctx.card_padding
+  bb = util.get_centered_bb(ctx.attribute_coord, width, height)
   if desc.card_type == util.CardType.MEMORY:
     draw.rectangle(bb,
                    fill=ATTRIBUTE_BG_COLOR,
-                   width=ATTRIBUTE_BG_OUTLINE_WIDTH,
+                   width=ctx.attribute_bg_outline_width,
                    outline=ATTRIBUTE_BG_OUTLINE_COLOR)
   else:
     draw.rounded_rectangle(bb,
                            fill=ATTRIBUTE_BG_COLOR,
-                           radius=ATTRIBUTE_BG_RADIUS,
-                           width=ATTRIBUTE_BG_OUTLINE_WIDTH,
+                           radius=ctx.attribute_bg_radius,
+                           width=ctx.attribute_bg_outline_width,
                            outline=ATTRIBUTE_BG_OUTLINE_COLOR)
-  draw.text(ATTRIBUTE_COORD,
-            text,
-            ATTRIBUTE_TEXT_COLOR,
-            font=font,
-            anchor=ATTRIBUTE_ANCHOR)
-
-
-def render_card_back(output_dir: pathlib.Path):
-  output_path = output_dir.joinpath("card_back.png")
-  im = Image.new(mode="RGBA", size=(CARD_WIDTH, CARD_HEIGHT))
+  text_cache.draw_text(draw,
+                       ctx.attribute_coord,
+                       text,
+                       ATTRIBUTE_TEXT_COLOR,
+                       font=font,
+                       anchor=ATTRIBUTE_ANCHOR)
+
+
+def render_card_back(output_dir: pathlib.Path,
+                     output_profile: encoding.OutputProfile,
+                     ctx: render_context.RenderContext):
+  output_path = output_dir.joinpath(f"card_back{output_profile.suffix}")
+  im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
   draw = ImageDraw.Draw(im)
-  card_art.render_card_back(im, draw)
+  card_art.render_card_back(im, draw, ctx)
   print("Saving card:", output_path)
-  im.save(output_path)
+  encoding.save_image(im, output_path, output_profile)
 
 
-def render_card(desc: util.CardDesc,
-                output_dir: Optional[pathlib.Path] = None,
-                output_path: Optional[pathlib.Path] = None,
-                crop_border: bool = True):
-  assert (output_path is None) != (
-      output_dir is
-      None), "Must call render_card with only output_dir or output_path."
-  if output_path is None:
-    output_path = util.get_output_path(output_dir, desc)
-  if output_path.exists():
-    print(f"Image already exists: {output_path}")
-    return
-  im = Image.new(mode="RGBA", size=(CARD_WIDTH, CARD_HEIGHT))
+def render_card_image(desc: util.CardDesc,
+                      ctx: render_context.RenderContext,
+                      crop_border: bool = True) -> Image:
+  im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
   draw = ImageDraw.Draw(im)
 
-  card_art.render_background(im, draw, desc, [0, 0, CARD_WIDTH, CARD_HEIGHT])
+  with memory.stage("background"):
+    card_art.render_background(im, desc, ctx.card_bb, ctx)
+    card_template.get_panel_layer(desc, ctx).draw(im)
 
-  card_art.render_card_art(im, desc, CARD_IMAGE_BB)
+  with memory.stage("art"):
+    card_art.render_card_art(im, desc, ctx.card_image_bb, ctx)
 
-  render_title(draw, desc)
+  with memory.stage("title"):
+    render_title(draw, desc, ctx)
 
-  body_text.render_body_text(im, draw, desc, BODY_TEXT_BG_BB)
+  with memory.stage("body text"):
+    body_text.render_body_text(im, draw, desc, ctx.body_text_bg_bb, ctx)
 
-  render_attributes(draw, desc)
+  with memory.stage("attributes"):
+    render_attributes(draw, desc, ctx)
 
   # Draw icons
-  if desc.cost is not None:
-    icons.draw_cost_icon(im, draw, COST_COORD, int(ICON_WIDTH * 1.2),
-                         int(ICON_HEIGHT * 1.2), desc.cost, COST_ICON_FONT,
-                         ICON_FONT_COLOR, desc.primary_element,
-                         desc.secondary_element)
-  if desc.health is not None:
-    icons.draw_heart_with_text(im, draw, HEALTH_COORD, ICON_HEIGHT, ICON_WIDTH,
-                               desc.health, ICON_FONT, ICON_FONT_COLOR)
-  if desc.strength is not None:
-    icons.draw_strength_with_text(im, draw, STRENGTH_COORD, ICON_HEIGHT,
-                                  ICON_WIDTH, desc.strength, ICON_FONT,
-                                  ICON_FONT_COLOR)
-  if desc.card_type == util.CardType.MEMORY:
-    icons.draw_cost_icon(im, draw, MANA_COORD, ICON_HEIGHT, ICON_WIDTH, "1",
-                         ICON_FONT, ICON_FONT_COLOR, desc.primary_element,
-                         desc.secondary_element)
-
-  card_art.render_boarder(im, draw, desc, [0, 0, CARD_WIDTH, CARD_HEIGHT])
+  with memory.stage("icons"):
+    if desc.cost is not None:
+      icons.draw_cost_icon(im, draw, ctx.cost_coord, int(ctx.icon_width * 1.2),
+                           int(ctx.icon_height * 1.2), desc.cost,
+                           ctx.cost_icon_font, ICON_FONT_COLOR,
+                           desc.primary_element, desc.secondary_element)
+    if desc.health is not None:
+      icons.draw_heart_with_text(im, draw, ctx.health_coord, ctx.icon_height,
+                                 ctx.icon_width, desc.health, ctx.icon_font,
+                                 ICON_FONT_COLOR)
+    if desc.strength is not None:
+      icons.draw_strength_with_text(im, draw, ctx.strength_coord,
+                                    ctx.icon_height, ctx.icon_width,
+                                    desc.strength, ctx.icon_font,
+                                    ICON_FONT_COLOR)
+
+  with memory.stage("border"):
+    card_template.get_frame_layer(desc, ctx).draw(im)
 
-  print("Saving card:", output_path)
   if crop_border:
-    im = card_art.crop_image_border(im, BORDER_WIDTH, CORNDER_RADIUS)
-  im.save(output_path)
-
-
-def _render_all_cards(db: gsheets.CardDatabase, output_dir: pathlib.Path):
-  for card_desc in db:
-    pprint.pprint(card_desc)
-    render_card(card_desc, output_dir)
-
-
-def _start_render_server(image_dir: pathlib.Path, port: int,
-                         enable_debug: bool):
+    with memory.stage("crop"):
+      im = card_art.crop_image_border(im, ctx.crop_border_width,
+                                      ctx.crop_corner_radius)
+  return im
+
+
+def render_card(
+    desc: util.CardDesc,
+    output_dir: Optional[pathlib.Path] = None,
+    output_path: Optional[pathlib.Path] = None,
+    crop_border: bool = True,
+    output_profile: encoding.OutputProfile = encoding.PROFILES["png"],
+    ctx: Optional[render_context.RenderContext] = None,
+) -> pathlib.Path:
+  """Renders and saves the card, returning where it was written.
+
+  The suffix of output_path is replaced to match the output profile. Without a
+  ctx, the card is rendered at the resolution from config.json.
+  """
+  if ctx is None:
+    ctx = render_context.get_default_render_context()
+  assert (output_path is None) != (
+      output_dir is
+      None), "Must call render_card with only output_dir or output_path."
+  if output_path is None:
+    output_path = util.get_output_path(output_dir, desc, output_profile.suffix)
+  output_path = output_path.with_suffix(output_profile.suffix)
+  if output_path.exists():
+    print(f"Image already exists: {output_path}")
+    return output_path
+  im = render_card_image(desc, ctx, crop_border)
+  print("Saving card:", output_path)
+  with memory.stage("encode"):
+    encoding.save_image(im, output_path, output_profile)
+  return output_path
+
+
+@profiling.profiled
+def _render_card_job(desc: util.CardDesc, output_path: pathlib.Path,
+                     output_profile: encoding.OutputProfile,
+                     pixels_per_inch: int):
+  pprint.pprint(desc)
+  with memory.stage("card", desc.title):
+    render_card(desc,
+                output_path=output_path,
+                output_profile=output_profile,
+                ctx=render_context.get_render_context(pixels_per_inch))
+
+
+@profiling.profiled
+def _render_image_job(desc: util.CardDesc, pixels_per_inch: int) -> Image:
+  pprint.pprint(desc)
+  with memory.stage("card", desc.title):
+    return render_card_image(desc,
+                             render_context.get_render_context(pixels_per_inch))
+
+
+@profiling.profiled
+def _render_encoded_job(desc: util.CardDesc, pixels_per_inch: int,
+                        output_profile: encoding.OutputProfile) -> bytes:
+  im = render_card_image(desc,
+                         render_context.get_render_context(pixels_per_inch))
+  with memory.stage("encode"):
+    return encoding.encode_image(im, output_profile)
+
+
+@profiling.profiled
+def _render_atlas_cell_job(desc: util.CardDesc, pixels_per_inch: int,
+                           layout: atlas.AtlasLayout) -> Image:
+  pprint.pprint(desc)
+  with memory.stage("card", desc.title):
+    return atlas.fit_cell(
+        render_card_image(desc,
+                          render_context.get_render_context(pixels_per_inch)),
+        layout)
+
+
+def _open_render_pool(jobs: int,
+                      pixels_per_inch: List[int]) -> worker_pool.RenderPool:
+  return worker_pool.RenderPool(
+      jobs,
+      functools.partial(worker_pool.warm_up, render_card_image,
+                        pixels_per_inch))
+
+
+def _queue_render_tasks(
+    cards: List[Tuple[util.CardDesc, pathlib.Path]],
+    queue: job_queue.JobQueue) -> Dict[str, Tuple[util.CardDesc, pathlib.Path]]:
+  """Records the cards in queue, returning those to render now by task key."""
+  tasks: Dict[str, Tuple[util.CardDesc, pathlib.Path]] = {}
+  for card_desc, output_path in cards:
+    key = str(output_path.resolve())
+    if key not in tasks and queue.add(key, card_desc.hash_all(),
+                                      card_desc.title, output_path.exists()):
+      # Anything already there is stale or was only partly written.
+      output_path.unlink(missing_ok=True)
+      tasks[key] = (card_desc, output_path)
+  return tasks
+
+
+def _start_render_task(
+    card_desc: util.CardDesc, output_path: pathlib.Path,
+    pool: worker_pool.RenderPool, output_profile: encoding.OutputProfile,
+    ctx: render_context.RenderContext,
+    writer: Optional[encoding.ImageWriter]) -> concurrent.futures.Future:
+  if writer is None:
+    return pool.submit(_render_card_job, card_desc, output_path, output_profile,
+                       ctx.pixels_per_inch)
+  return pool.submit(_render_image_job, card_desc, ctx.pixels_per_inch)
+
+
+def _finish_render_task(queue: job_queue.JobQueue, key: str, title: str,
+                        start: float, future: concurrent.futures.Future):
+  seconds = time.perf_counter() - start
+  try:
+    future.result()
+    queue.finish(key, seconds)
+  except Exception as e:
+    print(f"Failed to render '{title}': {e!r}")
+    queue.fail(key, repr(e), seconds)
+
+
+def _run_render_tasks(tasks: Dict[str, Tuple[util.CardDesc, pathlib.Path]],
+                      pool: worker_pool.RenderPool,
+                      output_profile: encoding.OutputProfile,
+                      ctx: render_context.RenderContext,
+                      queue: job_queue.JobQueue,
+                      writer: Optional[encoding.ImageWriter]):
+  """Runs the tasks on the workers, handing the images to writer if given."""
+  next_keys = iter(tasks)
+  # future -> (key, start time), of the renders and of the writes.
+  rendering: Dict[concurrent.futures.Future, Tuple[str, float]] = {}
+  writing: Dict[concurrent.futures.Future, Tuple[str, float]] = {}
+  while True:
+    # Hands out tasks only as workers free up, so the status stays accurate.
+    for key in itertools.islice(next_keys, pool.jobs - len(rendering)):
+      queue.start(key)
+      start = time.perf_counter()
+      future = _start_render_task(*tasks[key], pool, output_profile, ctx,
+                                  writer)
+      rendering[future] = (key, start)
+    if len(rendering) == 0 and len(writing) == 0:
+      return
+    done, _ = concurrent.futures.wait(
+        [*rendering, *writing], return_when=concurrent.futures.FIRST_COMPLETED)
+    for future in done:
+      if future in writing:
+        key, start = writing.pop(future)
+      else:
+        key, start = rendering.pop(future)
+        if writer is not None and future.exception() is None:
+          # Blocks while the writer is full, which holds back the renders.
+          print("Saving card:", tasks[key][1])
+          writing[writer.submit(future.result(), tasks[key][1],
+                                output_profile)] = (key, start)
+          continue
+      _finish_render_task(queue, key, tasks[key][0].title, start, future)
+
+
+def _report_render_tasks(cards: List[Tuple[util.CardDesc, pathlib.Path]],
+                         queue: job_queue.JobQueue):
+  keys = [str(output_path.resolve()) for _, output_path in cards]
+  tally = queue.get_tally(keys)
+  print("Render tasks: " + ", ".join(
+      f"{count} {status}" for status, count in sorted(tally.items())))
+  for title, attempts, error in queue.get_failures(keys):
+    print(f"FAILED {title} after {attempts} attempts: {error}")
+  assert tally[job_queue.STATUS_FAILED] == 0, \
+    (f"{tally[job_queue.STATUS_FAILED]} cards failed to render. Rerun to retry "
+     f"those with fewer than {queue.max_attempts} attempts.")
+
+
+def _render_cards(cards: List[Tuple[util.CardDesc, pathlib.Path]],
+                  pool: worker_pool.RenderPool,
+                  output_profile: encoding.OutputProfile,
+                  ctx: render_context.RenderContext, queue: job_queue.JobQueue,
+                  write_threads: int):
+  """Renders each (desc, output_path) pair that is not done on the workers.
+
+  Every task is recorded in queue as it starts and finishes, so an interrupted
+  or failed build resumes on the next run. Each card seeds its own random
+  generator, so the output does not depend on the number of jobs. When this
+  process renders, i.e. with one job, and write_threads, cards are encoded and
+  written on that many threads while the next ones render, and a task finishes
+  once its card is written. Worker processes save their own cards, as sending
+  whole images back would hold memory that the budget of --jobs misses.
+  """
+  tasks = _queue_render_tasks(cards, queue)
+  print(f"Running {len(tasks)} of {len(cards)} render tasks.")
+  start = time.perf_counter()
+  if pool.jobs > 1 and write_threads > 0:
+    print("Saving in each job; --write_threads only applies to --jobs 1. "
+          "`python -m card_game.benchmark --benchmark save` compares saving "
+          "with and without overlapping the renders.")
+    write_threads = 0
+  if write_threads == 0:
+    _run_render_tasks(tasks, pool, output_profile, ctx, queue, None)
+    saving = "saving in each job"
+  else:
+    writer = encoding.ImageWriter(write_threads)
+    try:
+      _run_render_tasks(tasks, pool, output_profile, ctx, queue, writer)
+    finally:
+      # Write errors are already recorded in queue.
+      writer.close()
+    saving = f"saving on {write_threads} threads"
+  if len(tasks) > 0:
+    seconds = time.perf_counter() - start
+    print(f"Rendered {len(tasks)} cards in {seconds:.1f}s, "
+          f"{len(tasks) / seconds:.1f} cards/s, {saving}.")
+  _report_render_tasks(cards, queue)
+
+
+def _render_all_cards(db: gsheets.CardDatabase, output_dir: pathlib.Path,
+                      pool: worker_pool.RenderPool,
+                      output_profile: encoding.OutputProfile,
+                      ctx: render_context.RenderContext,
+                      queue: job_queue.JobQueue, write_threads: int):
+  _render_cards(
+      [(card_desc,
+        util.get_output_path(output_dir, card_desc, output_profile.suffix))
+       for card_desc in db], pool, output_profile, ctx, queue, write_threads)
+
+
+def _start_render_server(image_dir: pathlib.Path, port: int, enable_debug: bool,
+                         output_profile: encoding.OutputProfile,
+                         pool: worker_pool.RenderPool):
   app = flask.Flask(__name__)
+  # Identical cards requested at the same time are rendered once.
+  renders = coalesce.Coalescer()
 
-  # we want to disable caching for the render server. Its not worth it.
-  temp_dir = pathlib.Path(tempfile.mkdtemp())
+  @app.route("/stats")
+  def _stats():
+    return flask.jsonify(renders.get_stats())
 
   @app.route("/<name>")
   def _retrieve_card(name: str):
@@ -252,16 +418,27 @@ def _start_render_server(image_dir: pathlib.Path, port: int,
       return str(exception), 405
 
   @app.route("/", methods=["POST"])
+  @profiling.profiled
   def _render_card():
     try:
       fields = flask.request.get_json(silent=True)
       util.assert_valid_card_desc(fields)
       card_desc = util.field_dict_to_card_desc(fields)
-      output_path = util.get_output_path(temp_dir, card_desc)
-      render_card(card_desc, output_path=output_path)
-      response = flask.send_file(output_path.resolve(), as_attachment=True)
-      os.remove(output_path)
-      return response
+      # Clients may ask for a different resolution, e.g. for thumbnails.
+      pixels_per_inch = flask.request.args.get("pixels_per_inch",
+                                               default=util.PIXELS_PER_INCH,
+                                               type=int)
+      assert pixels_per_inch in RENDER_SERVER_PIXELS_PER_INCH, \
+        f"pixels_per_inch must be one of {RENDER_SERVER_PIXELS_PER_INCH}."
+      # We want to disable caching for the render server. Its not worth it.
+      data = renders.run(
+          (card_desc.hash_all(), pixels_per_inch),
+          lambda: pool.submit(_render_encoded_job, card_desc, pixels_per_inch,
+                              output_profile).result())
+      return flask.send_file(
+          io.BytesIO(data),
+          as_attachment=True,
+          download_name=f"{card_desc.hash_all()}{output_profile.suffix}")
     except Exception as e:
       print(e)
       return str(e), 405
@@ -269,27 +446,57 @@ def _start_render_server(image_dir: pathlib.Path, port: int,
   app.run(host='0.0.0.0', port=port, debug=enable_debug)
 
 
-def _render_and_upload_all_cards(db: gsheets.CardDatabase,
-                                 output_dir: pathlib.Path,
-                                 selenium_driver_path: pathlib.Path,
-                                 card_set_name: str, untap_username: str,
-                                 untap_password: str):
-
-  card_metadata = []
-  for desc in db:
-    output_path = util.get_output_path(output_dir, desc)
-    pprint.pprint(desc)
-    render_card(desc, output_path=output_path)
-    card_metadata.append(
-        upload.UploadCardMetadata(image_path=output_path, desc=desc))
-
-  upload.upload_cards(card_metadata, selenium_driver_path, card_set_name,
-                      untap_username, untap_password)
-
+def _render_and_upload_all_cards(
+    db: gsheets.CardDatabase, output_dir: pathlib.Path,
+    selenium_driver_path: pathlib.Path, card_set_name: str, untap_username: str,
+    untap_password: str, output_profile: encoding.OutputProfile,
+    ctx: render_context.RenderContext, pool: worker_pool.RenderPool,
+    pipelined: bool, browser: upload.BrowserOptions):
+  """Renders every card on the workers and adds them to untap."""
+  if pipelined:
+    # Cards are rendered straight into memory, nothing goes to output_dir.
+    def _render(desc: util.CardDesc) -> bytes:
+      pprint.pprint(desc)
+      return pool.submit(_render_encoded_job, desc, ctx.pixels_per_inch,
+                         output_profile).result()
+
+    upload.upload_cards_pipelined(db,
+                                  _render,
+                                  output_profile.suffix,
+                                  selenium_driver_path,
+                                  card_set_name,
+                                  untap_username,
+                                  untap_password,
+                                  browser=browser,
+                                  render_threads=pool.jobs)
+    return
 
-def _render_deck(decklist: pathlib.Path, db: gsheets.CardDatabase,
-                 output_dir: pathlib.Path, ignore_decklist_counts: bool):
-  card_idx = 0
+  descs = list(db)
+  output_paths = [
+      util.get_output_path(output_dir, desc, output_profile.suffix)
+      for desc in descs
+  ]
+  # Raises the first error, before anything is uploaded.
+  for _ in pool.map(_render_card_job, descs, output_paths,
+                    itertools.repeat(output_profile),
+                    itertools.repeat(ctx.pixels_per_inch)):
+    pass
+  card_metadata = [
+      upload.UploadCardMetadata(image_path=output_path, desc=desc)
+      for desc, output_path in zip(descs, output_paths)
+  ]
+  upload.upload_cards(card_metadata,
+                      selenium_driver_path,
+                      card_set_name,
+                      untap_username,
+                      untap_password,
+                      browser=browser)
+
+
+def _load_decklist(decklist: pathlib.Path, db: gsheets.CardDatabase,
+                   ignore_decklist_counts: bool) -> List[util.CardDesc]:
+  """Returns the cards of the deck, with one entry per copy."""
+  cards = []
   assert decklist.is_file(), f"File not found: {decklist}"
   with decklist.open() as f:
     for row in f:
@@ -300,25 +507,153 @@ def _render_deck(decklist: pathlib.Path, db: gsheets.CardDatabase,
       count = 1 if ignore_decklist_counts else int(count)
       assert count > 0
       assert title in db, f"Card not found: {title}"
-      card_desc = db[title]
-      pprint.pprint(card_desc)
-      for _ in range(count):
-        output_path = output_dir.joinpath(f"card_{card_idx}.png")
-        render_card(card_desc, output_path=output_path)
-        card_idx += 1
+      cards.extend([db[title]] * count)
+  return cards
 
 
-def main():
+def _render_deck(decklist: pathlib.Path, db: gsheets.CardDatabase,
+                 output_dir: pathlib.Path, ignore_decklist_counts: bool,
+                 pool: worker_pool.RenderPool,
+                 output_profile: encoding.OutputProfile,
+                 ctx: render_context.RenderContext, queue: job_queue.JobQueue,
+                 write_threads: int):
+  cards = [(card_desc,
+            output_dir.joinpath(f"card_{idx}{output_profile.suffix}"))
+           for idx, card_desc in enumerate(
+               _load_decklist(decklist, db, ignore_decklist_counts))]
+  _render_cards(cards, pool, output_profile, ctx, queue, write_threads)
+
+
+def _render_deck_atlases(decklist: pathlib.Path, db: gsheets.CardDatabase,
+                         output_dir: pathlib.Path, ignore_decklist_counts: bool,
+                         pool: worker_pool.RenderPool,
+                         output_profile: encoding.OutputProfile,
+                         ctx: render_context.RenderContext,
+                         layout: atlas.AtlasLayout):
+  """Writes the deck as tabletop atlases named after the deck file."""
+  cards = _load_decklist(decklist, db, ignore_decklist_counts)
+  render_cell = functools.partial(_render_atlas_cell_job,
+                                  pixels_per_inch=ctx.pixels_per_inch,
+                                  layout=layout)
+  with Image.open(util.MAIN_CARD_BACK_IMG_PATH) as card_back:
+    atlases = atlas.build_atlases(cards, render_cell, card_back, layout,
+                                  pool.map)
+  atlas.save_atlases(atlases, cards, layout, output_dir, decklist.stem,
+                     output_profile)
+
+
+def _get_jobs(jobs: int, memory_budget_mb: Optional[int],
+              ctx: render_context.RenderContext) -> int:
+  """Lowers jobs until concurrent renders fit within the memory budget."""
+  if memory_budget_mb is None:
+    return jobs
+  sample_desc = util.load_card_descs(util.SAMPLE_CARDS_PATH)[0]
+  card_bytes = memory.estimate_card_bytes(
+      ctx, lambda: render_card_image(sample_desc, ctx))
+  return memory.limit_jobs(jobs, memory_budget_mb * memory.MIB, card_bytes)
+
+
+def _get_output_profile(name: Optional[str],
+                        default_name: str) -> encoding.OutputProfile:
+  return encoding.PROFILES[default_name if name is None else name]
+
+
+def _get_render_contexts(
+    output_dir: pathlib.Path, pixels_per_inch: List[int]
+) -> List[Tuple[pathlib.Path, render_context.RenderContext]]:
+  """Pairs each requested resolution with where its cards are written.
+
+  A single resolution writes straight into output_dir. Several resolutions each
+  get a subdirectory, e.g. img/300ppi and img/100ppi.
+  """
+  assert len(pixels_per_inch) == len(set(pixels_per_inch)), \
+    "Resolutions must be unique."
+  assert all(ppi > 0 for ppi in pixels_per_inch), \
+    "Resolutions must be positive."
+  if len(pixels_per_inch) == 1:
+    return [(output_dir, render_context.get_render_context(pixels_per_inch[0]))]
+  contexts = []
+  for ppi in pixels_per_inch:
+    ppi_dir = output_dir.joinpath(f"{ppi}ppi")
+    ppi_dir.mkdir(parents=True, exist_ok=True)
+    contexts.append((ppi_dir, render_context.get_render_context(ppi)))
+  return contexts
+
+
+def _parse_args() -> argparse.Namespace:
   parser = argparse.ArgumentParser()
   parser.add_argument("--render_card", type=str, default=None)
   parser.add_argument("--render_decklist", type=pathlib.Path, default=None)
+  # Packs each deck into tabletop atlases instead of one image per card.
+  parser.add_argument("--render_atlas",
+                      type=pathlib.Path,
+                      nargs="+",
+                      default=None)
+  parser.add_argument("--atlas_grid",
+                      type=int,
+                      nargs=2,
+                      metavar=("COLUMNS", "ROWS"),
+                      default=[atlas.ATLAS_COLUMNS, atlas.ATLAS_ROWS])
+  parser.add_argument("--atlas_max_texture_size",
+                      type=int,
+                      default=atlas.MAX_TEXTURE_SIZE)
   parser.add_argument("--remove_outdir", action="store_true")
   parser.add_argument("--ignore_decklist_counts", action="store_true")
   parser.add_argument("--render_all", action="store_true")
   parser.add_argument("--render_card_back", action="store_true")
   parser.add_argument("--render_server", action="store_true")
+  # Re-renders every deck in --deck_dir whenever a deck, config.json or the
+  # --card_snapshot changes. Resolution comes from config.json.
+  parser.add_argument("--watch", action="store_true")
+  parser.add_argument("--deck_dir",
+                      type=pathlib.Path,
+                      default=pathlib.Path("./decks"))
+  # A json list of cards, like resources/sample_cards.json. Without it, the
+  # card database is downloaded once.
+  parser.add_argument("--card_snapshot", type=pathlib.Path, default=None)
+  # Profiles the chosen behavior, including its worker threads and processes.
+  # Writes profile.pstats and profile.collapsed, for flamegraphs, to
+  # --profile_dir and prints the hottest rendering functions.
+  parser.add_argument("--profile", action="store_true")
+  parser.add_argument("--profile_dir",
+                      type=pathlib.Path,
+                      default=pathlib.Path("./profile"))
   parser.add_argument("--render_server_port", type=int, default=5000)
   parser.add_argument("--render_server_debug", action="store_true")
+  # Number of cards rendered concurrently by the bulk render modes, the watch
+  # mode and the render server. Each job is a worker process that starts with
+  # the fonts and icons already loaded and stays up for the whole run.
+  parser.add_argument("--jobs", type=int, default=1)
+  # Records the status, attempts, error and time of every card rendered by
+  # --render_decklist and --render_all, so that a rerun resumes where the last
+  # one stopped and retries failed cards up to --max_attempts times.
+  parser.add_argument("--job_queue",
+                      type=pathlib.Path,
+                      default=job_queue.JOB_QUEUE_PATH)
+  parser.add_argument("--max_attempts",
+                      type=int,
+                      default=job_queue.MAX_ATTEMPTS)
+  # Threads that encode and write the cards of --render_decklist and
+  # --render_all while the next ones render, with --jobs 1. With more jobs, or
+  # with 0, each job saves its own cards before taking the next.
+  parser.add_argument("--write_threads",
+                      type=int,
+                      default=encoding.WRITE_THREADS)
+  # Caps --jobs so that the bulk render modes stay within this many MiB.
+  parser.add_argument("--memory_budget_mb", type=int, default=None)
+  # Reports the peak memory of each render stage and the largest cards, over
+  # this process and its render workers, and the peak of each worker.
+  parser.add_argument("--memory_report", action="store_true")
+  # How images are encoded. Each behavior picks a sensible default.
+  parser.add_argument("--output_profile",
+                      type=str,
+                      choices=sorted(encoding.PROFILES),
+                      default=None)
+  # Render every card once per resolution, in this one process.
+  parser.add_argument("--pixels_per_inch",
+                      type=int,
+                      nargs="+",
+                      default=[util.PIXELS_PER_INCH])
   parser.add_argument("--output_dir",
                       type=pathlib.Path,
                       default=pathlib.Path("./img"))
@@ -335,8 +670,103 @@ def main():
   # Specify these for imgur upload
   parser.add_argument("--untap_username", type=str, default=None)
   parser.add_argument("--untap_password", type=str, default=None)
+  # Render, upload and add cards to untap concurrently, without writing images
+  # to disk.
+  parser.add_argument("--pipelined_upload", action="store_true")
+  # Number of browsers adding cards to untap at the same time.
+  parser.add_argument("--untap_sessions",
+                      type=int,
+                      default=upload.UNTAP_SESSIONS)
+  parser.add_argument("--headless", action="store_true")
+  # Keeps untap logged in between runs, unless --fresh_browser_profile is set.
+  parser.add_argument("--browser_profile_dir",
+                      type=pathlib.Path,
+                      default=upload.BROWSER_PROFILE_DIR)
+  parser.add_argument("--fresh_browser_profile", action="store_true")
+
+  return parser.parse_args()
+
 
-  args = parser.parse_args()
+def _run_render_server(args: argparse.Namespace):
+  ctx = render_context.get_render_context(util.PIXELS_PER_INCH)
+  with _open_render_pool(_get_jobs(args.jobs, args.memory_budget_mb, ctx),
+                         [ctx.pixels_per_inch]) as pool:
+    _start_render_server(args.output_dir, args.render_server_port,
+                         args.render_server_debug,
+                         _get_output_profile(args.output_profile,
+                                             "fast_png"), pool)
+
+
+def _run_watch(args: argparse.Namespace, db: Optional[gsheets.CardDatabase]):
+  ctx = render_context.get_default_render_context()
+  with _open_render_pool(_get_jobs(args.jobs, args.memory_budget_mb, ctx),
+                         [ctx.pixels_per_inch]) as pool:
+    watch.DeckWatcher(args.deck_dir, args.output_dir, _load_decklist,
+                      _render_encoded_job, args.card_snapshot, db,
+                      _get_output_profile(args.output_profile, "fast_png"),
+                      pool, args.ignore_decklist_counts).run()
+
+
+def _run_upload(args: argparse.Namespace, db: gsheets.CardDatabase):
+  assert len(args.pixels_per_inch) == 1, \
+    "Cards are uploaded at a single resolution."
+  ctx = render_context.get_render_context(args.pixels_per_inch[0])
+  output_profile = _get_output_profile(args.output_profile, "optimized_png")
+  browser = upload.BrowserOptions(
+      sessions=args.untap_sessions,
+      headless=args.headless,
+      profile_dir=(None
+                   if args.fresh_browser_profile else args.browser_profile_dir))
+  with _open_render_pool(_get_jobs(args.jobs, args.memory_budget_mb, ctx),
+                         [ctx.pixels_per_inch]) as pool:
+    _render_and_upload_all_cards(db, args.output_dir, args.selenium_driver_path,
+                                 args.upload_card_set_name, args.untap_username,
+                                 args.untap_password, output_profile, ctx, pool,
+                                 args.pipelined_upload, browser)
+
+
+def _run_atlases(args: argparse.Namespace, db: gsheets.CardDatabase,
+                 output_dir: pathlib.Path, pool: worker_pool.RenderPool,
+                 output_profile: encoding.OutputProfile,
+                 ctx: render_context.RenderContext):
+  # Cells hold the cards as rendered, with the border cropped.
+  layout = atlas.get_layout(ctx.cropped_card_width, ctx.cropped_card_height,
+                            *args.atlas_grid, args.atlas_max_texture_size)
+  for decklist in args.render_atlas:
+    _render_deck_atlases(decklist, db, output_dir, args.ignore_decklist_counts,
+                         pool, output_profile, ctx, layout)
+
+
+def _run_renders(args: argparse.Namespace, db: gsheets.CardDatabase):
+  """Runs --render_card, --render_decklist, --render_atlas or --render_all."""
+  output_profile = _get_output_profile(args.output_profile, "png")
+  queue = None
+  if args.render_decklist is not None or args.render_all:
+    queue = job_queue.JobQueue(args.job_queue, args.max_attempts)
+  for output_dir, ctx in _get_render_contexts(args.output_dir,
+                                              args.pixels_per_inch):
+    if args.render_card is not None:
+      assert args.render_card in db
+      render_card(db[args.render_card],
+                  output_dir,
+                  output_profile=output_profile,
+                  ctx=ctx)
+      continue
+    jobs = _get_jobs(args.jobs, args.memory_budget_mb, ctx)
+    with _open_render_pool(jobs, [ctx.pixels_per_inch]) as pool:
+      if args.render_decklist is not None:
+        _render_deck(args.render_decklist, db, output_dir,
+                     args.ignore_decklist_counts, pool, output_profile, ctx,
+                     queue, args.write_threads)
+      elif args.render_atlas is not None:
+        _run_atlases(args, db, output_dir, pool, output_profile, ctx)
+      elif args.render_all:
+        _render_all_cards(db, output_dir, pool, output_profile, ctx, queue,
+                          args.write_threads)
+
+
+def main():
+  args = _parse_args()
 
   if args.output_dir.is_dir() and args.remove_outdir:
     print("Deleting directory:", args.output_dir)
@@ -349,41 +779,41 @@ def main():
 
   num_behavior_options = sum([
       args.render_card is not None, args.render_decklist is not None,
-      args.render_all, args.untap_username is not None, args.render_server,
-      args.render_card_back
+      args.render_atlas is not None, args.render_all, args.watch,
+      args.untap_username is not None, args.render_server, args.render_card_back
   ])
   assert (num_behavior_options == 1), "Must specify exactly one behavior."
 
-  if args.render_server:
-    _start_render_server(args.output_dir, args.render_server_port,
-                         args.render_server_debug)
-    return
+  atexit.register(encoding.STATS.report)
+  atexit.register(text_cache.CACHE.report)
+  if args.profile:
+    # Also reports when the render server or watch mode is interrupted.
+    atexit.register(profiling.start(args.profile_dir).finish)
+  if args.memory_report:
+    atexit.register(memory.start().report)
 
-  db = gsheets.CardDatabase(args.card_database_gsheets_id)
-
-  if args.render_card is not None:
-    assert args.render_card in db
-    render_card(db[args.render_card], args.output_dir)
-    return
-
-  if args.render_decklist is not None:
-    _render_deck(args.render_decklist, db, args.output_dir,
-                 args.ignore_decklist_counts)
+  if args.render_server:
+    _run_render_server(args)
     return
 
-  if args.render_all:
-    _render_all_cards(db, args.output_dir)
+  if args.render_card_back:
+    for output_dir, ctx in _get_render_contexts(args.output_dir,
+                                                args.pixels_per_inch):
+      render_card_back(output_dir,
+                       _get_output_profile(args.output_profile, "png"), ctx)
     return
 
-  if args.untap_username is not None and args.untap_password is not None:
-    _render_and_upload_all_cards(db, args.output_dir, args.selenium_driver_path,
-                                 args.upload_card_set_name, args.untap_username,
-                                 args.untap_password)
-    return
+  if args.watch and args.card_snapshot is not None:
+    db = None
+  else:
+    db = gsheets.CardDatabase(args.card_database_gsheets_id)
 
-  if args.render_card_back:
-    render_card_back(args.output_dir)
-    return
+  if args.watch:
+    _run_watch(args, db)
+  elif args.untap_username is not None:
+    _run_upload(args, db)
+  else:
+    _run_renders(args, db)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+# Packs a deck into grid atlases, the format digital tabletops import decks in.
+#
+# Each atlas is a grid of equally sized cells, filled row by row. The last cell
+# of every atlas holds the hidden card, shown for cards in a hidden zone such
+# as a hand. Decks larger than one grid are split across several atlases.
+
+import dataclasses
+import json
+import pathlib
+from typing import Callable, Dict, Iterable, List
+
+from PIL import Image
+
+from . import encoding, util
+
+#pylint: disable=too-many-arguments
+#pylint: disable=too-many-locals
+
+ATLAS_COLUMNS = 10
+ATLAS_ROWS = 7
+# Largest texture width or height that tabletops load reliably.
+MAX_TEXTURE_SIZE = 4096
+
+
+@dataclasses.dataclass(frozen=True)
+class AtlasLayout:
+  columns: int
+  rows: int
+  cell_width: int
+  cell_height: int
+
+  @property
+  def cards_per_atlas(self) -> int:
+    # The last cell is kept for the hidden card.
+    return self.columns * self.rows - 1
+
+  @property
+  def size(self) -> util.Coord:
+    return (self.columns * self.cell_width, self.rows * self.cell_height)
+
+  def get_cell_coord(self, index: int) -> util.Coord:
+    row, column = divmod(index, self.columns)
+    return (column * self.cell_width, row * self.cell_height)
+
+
+def get_layout(card_width: int,
+               card_height: int,
+               columns: int = ATLAS_COLUMNS,
+               rows: int = ATLAS_ROWS,
+               max_texture_size: int = MAX_TEXTURE_SIZE) -> AtlasLayout:
+  """Picks the largest cell, up to the card size, that fits the texture."""
+  assert columns > 0 and rows > 0, "Atlas grid must have cells."
+  assert columns * rows > 1, "Atlas grid needs a card and a hidden card cell."
+  scale = min(1, max_texture_size / (columns * card_width),
+              max_texture_size / (rows * card_height))
+  cell_width = int(card_width * scale)
+  cell_height = int(card_height * scale)
+  assert cell_width > 0 and cell_height > 0, \
+    f"Max texture size {max_texture_size} is too small for {columns}x{rows}."
+  return AtlasLayout(columns, rows, cell_width, cell_height)
+
+
+def fit_cell(im: Image, layout: AtlasLayout) -> Image:
+  if im.size == (layout.cell_width, layout.cell_height):
+    return im
+  return im.resize((layout.cell_width, layout.cell_height), Image.LANCZOS)
+
+
+def build_atlases(
+    cards: List[util.CardDesc],
+    render: Callable[[util.CardDesc], Image],
+    hidden_image: Image,
+    layout: AtlasLayout,
+    map_function: Callable[[Callable, List[util.CardDesc]], Iterable] = map
+) -> List[Image]:
+  """Renders the cards in order straight into as many atlases as needed.
+
+  Each distinct card is rendered once, through map_function such as
+  RenderPool.map, and only its downscaled cell is kept. render may return the
+  card already fit to the cell, so that workers send back less. No per-card
+  image is written.
+  """
+  assert len(cards) > 0, "Must have cards to pack."
+  unique_cards = list({desc.title: desc for desc in cards}.values())
+  cells: Dict[str, Image] = {
+      desc.title: fit_cell(im, layout)
+      for desc, im in zip(unique_cards, map_function(render, unique_cards))
+  }
+
+  hidden_cell = fit_cell(hidden_image, layout)
+  atlases = []
+  for start in range(0, len(cards), layout.cards_per_atlas):
+    atlas = Image.new("RGBA", layout.size)
+    atlas_cards = cards[start:start + layout.cards_per_atlas]
+    for index, desc in enumerate(atlas_cards):
+      atlas.paste(cells[desc.title], layout.get_cell_coord(index))
+    atlas.paste(hidden_cell, layout.get_cell_coord(layout.cards_per_atlas))
+    atlases.append(atlas)
+  return atlases
+
+
+def save_atlases(atlases: List[Image], cards: List[util.CardDesc],
+                 layout: AtlasLayout, output_dir: pathlib.Path, name: str,
+                 output_profile: encoding.OutputProfile) -> List[pathlib.Path]:
+  """Writes <name>_<i> atlases and a <name>.json listing the cards in each."""
+  output_dir.mkdir(parents=True, exist_ok=True)
+  paths = []
+  index = []
+  for atlas_idx, atlas in enumerate(atlases):
+    path = output_dir.joinpath(f"{name}_{atlas_idx}{output_profile.suffix}")
+    print("Saving atlas:", path)
+    encoding.save_image(atlas, path, output_profile)
+    paths.append(path)
+    start = atlas_idx * layout.cards_per_atlas
+    titles = [
+        desc.title for desc in cards[start:start + layout.cards_per_atlas]
+    ]
+    index.append({
+        "image": path.name,
+        "columns": layout.columns,
+        "rows": layout.rows,
+        "hidden_card_cell": layout.cards_per_atlas,
+        "cards": titles,
+    })
+  index_path = output_dir.joinpath(f"{name}.json")
+  with index_path.open("w", encoding="utf-8") as json_file:
+    json.dump(index, json_file, indent=2)
+  return paths
@@ -0,0 +1,200 @@
+# Benchmarks for the slow parts of the card pipeline.
+#
+# Run from the project root, for instance:
+#   python -m card_game.benchmark --benchmark background
+
+import argparse
+import pathlib
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+from PIL import Image, ImageDraw
+
+from . import __main__ as card_game_main
+from . import (body_text, card_art, encoding, local_ftp, render_context,
+               text_cache, upload, util)
+
+
+def _median_seconds(function: Callable[[], None], repeats: int) -> float:
+  timings = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    function()
+    timings.append(time.perf_counter() - start)
+  return statistics.median(timings)
+
+
+def benchmark_background(cards: List[util.CardDesc],
+                         ctx: render_context.RenderContext, repeats: int):
+
+  def _render_backgrounds():
+    for desc in cards:
+      im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
+      card_art.draw_background_mesh(im, desc, ctx.card_bb, ctx.bg_pattern_size)
+
+  seconds = _median_seconds(_render_backgrounds, repeats) / len(cards)
+  print(f"background @ {ctx.pixels_per_inch} PPI: "
+        f"{seconds * 1000:.2f} ms/card")
+
+
+def benchmark_art(cards: List[util.CardDesc], ctx: render_context.RenderContext,
+                  repeats: int):
+
+  def _render_art():
+    for desc in cards:
+      im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
+      card_art.render_card_art(im, desc, ctx.card_image_bb, ctx)
+
+  seconds = _median_seconds(_render_art, repeats) / len(cards)
+  print(f"art @ {ctx.pixels_per_inch} PPI: {seconds * 1000:.2f} ms/card")
+
+
+def benchmark_encode(cards: List[util.CardDesc],
+                     ctx: render_context.RenderContext, repeats: int):
+  images = [card_game_main.render_card_image(desc, ctx) for desc in cards]
+  for name, profile in sorted(encoding.PROFILES.items()):
+    num_bytes = sum(len(encoding.encode_image(im, profile)) for im in images)
+
+    def _encode(profile=profile):
+      for im in images:
+        encoding.encode_image(im, profile)
+
+    seconds = _median_seconds(_encode, repeats) / len(images)
+    print(f"encode {name} @ {ctx.pixels_per_inch} PPI: "
+          f"{seconds * 1000:.1f} ms/card, "
+          f"{num_bytes / len(images) / 1024:.1f} KiB/card")
+
+
+def benchmark_save(cards: List[util.CardDesc],
+                   ctx: render_context.RenderContext, repeats: int):
+  """Renders and saves cards, with and without overlapping the writes."""
+  profile = encoding.PROFILES["png"]
+  with tempfile.TemporaryDirectory() as temp_dir:
+    output_paths = [
+        pathlib.Path(temp_dir).joinpath(f"{i}.png") for i in range(len(cards))
+    ]
+
+    def _save_in_turn():
+      for desc, output_path in zip(cards, output_paths):
+        encoding.save_image(card_game_main.render_card_image(desc, ctx),
+                            output_path, profile)
+
+    def _save_overlapped(num_threads: int):
+      with encoding.ImageWriter(num_threads) as writer:
+        for desc, output_path in zip(cards, output_paths):
+          writer.submit(card_game_main.render_card_image(desc, ctx),
+                        output_path, profile)
+
+    for name, function in [("in turn", _save_in_turn)] + [
+        (f"overlapped on {num_threads} threads",
+         lambda num_threads=num_threads: _save_overlapped(num_threads))
+        for num_threads in sorted({1, encoding.WRITE_THREADS})
+    ]:
+      seconds = _median_seconds(function, repeats) / len(cards)
+      print(f"save {name} @ {ctx.pixels_per_inch} PPI: "
+            f"{seconds * 1000:.1f} ms/card, {1 / seconds:.1f} cards/s")
+
+
+def benchmark_text(cards: List[util.CardDesc],
+                   ctx: render_context.RenderContext, repeats: int):
+  """Times the title, body text and attributes with and without cached runs."""
+
+  def _render_text():
+    for desc in cards:
+      im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
+      draw = ImageDraw.Draw(im)
+      card_game_main.render_title(draw, desc, ctx)
+      body_text.render_body_text(im, draw, desc, ctx.body_text_bg_bb, ctx)
+      card_game_main.render_attributes(draw, desc, ctx)
+
+  def _render_text_uncached():
+    max_bytes = text_cache.CACHE.max_bytes
+    text_cache.CACHE.max_bytes = 0
+    text_cache.CACHE.clear()
+    try:
+      _render_text()
+    finally:
+      text_cache.CACHE.max_bytes = max_bytes
+
+  def _render_text_cold():
+    text_cache.CACHE.clear()
+    _render_text()
+
+  for name, function in [("uncached", _render_text_uncached),
+                         ("cold cache", _render_text_cold),
+                         ("warm cache", _render_text)]:
+    num_hits = text_cache.CACHE.num_hits
+    num_misses = text_cache.CACHE.num_misses
+    seconds = _median_seconds(function, repeats) / len(cards)
+    num_hits = text_cache.CACHE.num_hits - num_hits
+    num_lookups = num_hits + text_cache.CACHE.num_misses - num_misses
+    print(f"text {name} @ {ctx.pixels_per_inch} PPI: "
+          f"{seconds * 1000:.2f} ms/card, {num_hits / num_lookups:.1%} hits")
+
+
+def benchmark_upload(cards: List[util.CardDesc],
+                     ctx: render_context.RenderContext, repeats: int):
+  """Uploads rendered cards to a local FTP stand-in with added latency."""
+  with tempfile.TemporaryDirectory() as temp_dir:
+    temp_dir = pathlib.Path(temp_dir)
+    image_paths = [
+        card_game_main.render_card(desc,
+                                   output_path=temp_dir.joinpath(f"{i}.png"),
+                                   ctx=ctx) for i, desc in enumerate(cards)
+    ]
+    for pool_size in sorted({1, upload.FTP_POOL_SIZE}):
+      with local_ftp.LocalFtpServer(temp_dir.joinpath("ftp"),
+                                    latency=0.05) as server:
+        with upload.FtpSessionPool(local_ftp.DEFAULT_PASSWORD,
+                                   host="127.0.0.1",
+                                   port=server.port,
+                                   size=pool_size) as ftp_pool:
+
+          def _upload(ftp_pool=ftp_pool):
+            ftp_pool.upload_all(image_paths)
+
+          seconds = _median_seconds(_upload, repeats) / len(image_paths)
+      print(f"upload over {pool_size} sessions @ {ctx.pixels_per_inch} PPI: "
+            f"{seconds * 1000:.1f} ms/card")
+
+
+BENCHMARKS = {
+    "art": benchmark_art,
+    "background": benchmark_background,
+    "encode": benchmark_encode,
+    "save": benchmark_save,
+    "text": benchmark_text,
+    "upload": benchmark_upload,
+}
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--benchmark",
+                      type=str,
+                      nargs="+",
+                      choices=sorted(BENCHMARKS),
+                      default=sorted(BENCHMARKS))
+  parser.add_argument("--pixels_per_inch",
+                      type=int,
+                      nargs="+",
+                      default=[100, 300])
+  parser.add_argument("--repeats", type=int, default=5)
+  parser.add_argument("--cards",
+                      type=pathlib.Path,
+                      default=util.SAMPLE_CARDS_PATH)
+  args = parser.parse_args()
+
+  cards = util.load_card_descs(args.cards)
+  assert len(cards) > 0, f"No cards in {args.cards}"
+  for name in args.benchmark:
+    for pixels_per_inch in args.pixels_per_inch:
+      BENCHMARKS[name](cards,
+                       render_context.get_render_context(pixels_per_inch),
+                       args.repeats)
+
+
+if __name__ == "__main__":
+  main()
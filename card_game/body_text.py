@@ -1,71 +1,54 @@
 import enum
-import pathlib
 import re
 from typing import List
 
 from PIL import Image, ImageDraw, ImageFont
 
-from . import colors, icons, util
+from . import colors, icons, render_context, text_cache, util
 
 #pylint: disable=too-few-public-methods
 #pylint: disable=too-many-instance-attributes
 #pylint: disable=too-many-locals
 
-# Customizations of the body text area.
+# Customizations of the body text area. Sizes and fonts come from the
+# RenderContext.
 
 FONT_COLOR = colors.BLACK
-BG_RADIUS = int(util.PIXELS_PER_INCH * 0.1)
 BG_COLOR = colors.GREY_50
-BODY_TEXT_MARGIN = int(util.PIXELS_PER_INCH * 0.08)
-FLAVOR_TEXT_MARGIN = int(util.PIXELS_PER_INCH * 0.42)
-
-TEXT_HEIGHT = int(util.PIXELS_PER_INCH * 0.125)
-FONT = ImageFont.truetype(str(util.EB_GARAMOND_FONT_PATH), TEXT_HEIGHT)
-FLAVOR_TEXT_HEIGHT = int(util.PIXELS_PER_INCH * 0.12)
-FLAVOR_TEXT_FONT = ImageFont.truetype(str(util.GARAMOND_ITALIC_FONT_PATH),
-                                      FLAVOR_TEXT_HEIGHT)
-TOKEN_PADDING_Y = int(util.PIXELS_PER_INCH * 0.02)
-TOKEN_PADDING_X = int(util.PIXELS_PER_INCH * 0.02)
 
 COST_BG_COLOR = colors.AMBER_400
-COST_PADDING_X = int(util.PIXELS_PER_INCH * 0.05)
 
-TEXT_SEGMENT_PADDING_Y = int(0.03 * util.PIXELS_PER_INCH)
 TEXT_SEGMENT_BORDER_COLOR = colors.BLACK
-TEXT_SEGMENT_BORDER_WIDTH = int(0.01 * util.PIXELS_PER_INCH)
-TEXT_SEGMENT_FONT = ImageFont.truetype(str(util.EB_GARAMOND_FONT_PATH),
-                                       int(util.PIXELS_PER_INCH * 0.09))
 TEXT_SEGMENT_FONT_COLOR = colors.BLACK
-TEXT_SEGMENT_FONT_PADDING_Y = int(1.2 * TEXT_SEGMENT_FONT.size)
 
 UNKNOWN_TEXT = "[?]"
 
-ACTION_ICON_PADDING = int(util.PIXELS_PER_INCH * 0.075)
-
 
 class Token():
 
-  def __init__(self, desc: util.CardDesc, text: str, font: ImageFont.ImageFont):
+  def __init__(self, desc: util.CardDesc, text: str, font: ImageFont.ImageFont,
+               ctx: render_context.RenderContext):
     self.text = text
     self.desc = desc
     self.font = font
+    self.ctx = ctx
 
   def render(self, _: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
     """Renders the token.
 
     Assume that cursor_x is the left-hand side, while cursor_y is the
-    middle-line. Assume that you are allowed to render at most TEXT_HEIGHT tall
+    middle-line. Assume that you are allowed to render at most text_height tall
     (centered at cursor_y), and self.width() wide. You can also assume that the
     cursor location has been placed such that this rendering will stay within
     the border of the card.
     """
     print(f"Warning, unidentified token: `{self.text}`")
-    draw.text((cursor_x, cursor_y),
-              UNKNOWN_TEXT,
-              FONT_COLOR,
-              font=self.font,
-              anchor="lm")
+    text_cache.draw_text(draw, (cursor_x, cursor_y),
+                         UNKNOWN_TEXT,
+                         FONT_COLOR,
+                         font=self.font,
+                         anchor="lm")
 
   def width(self):
     #pylint: disable=no-self-use
@@ -103,11 +86,11 @@ class TextToken(Token):
   def render(self, _: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
     #pylint: disable=unused-argument
-    draw.text((cursor_x, cursor_y),
-              self.text,
-              FONT_COLOR,
-              font=self.font,
-              anchor="lm")
+    text_cache.draw_text(draw, (cursor_x, cursor_y),
+                         self.text,
+                         FONT_COLOR,
+                         font=self.font,
+                         anchor="lm")
 
   def width(self):
     return self.font.getsize(self.text)[0]
@@ -127,9 +110,6 @@ class SpaceToken(TextToken):
     return text in [" ", ""]
 
 
-ICON_WIDTH = TEXT_HEIGHT
-ICON_HEIGHT = ICON_WIDTH
-ICON_FONT = ImageFont.truetype(str(util.LATO_FONT_PATH), int(TEXT_HEIGHT * 0.8))
 ICON_FONT_COLOR = colors.WHITE
 
 ALL_ELEMENT_CHARS = "".join(e.value for e in util.Element)
@@ -153,13 +133,13 @@ class ManaToken(Token):
 
   def render(self, im: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
-    center = cursor_x + int(ICON_WIDTH / 2), cursor_y
-    icons.draw_cost_icon(im, draw, center, ICON_WIDTH, ICON_HEIGHT,
-                         self.icon_text, ICON_FONT, ICON_FONT_COLOR,
-                         self.element)
+    center = cursor_x + int(self.ctx.text_icon_width / 2), cursor_y
+    icons.draw_cost_icon(im, draw, center, self.ctx.text_icon_width,
+                         self.ctx.text_icon_height, self.icon_text,
+                         self.ctx.text_icon_font, ICON_FONT_COLOR, self.element)
 
   def width(self):
-    return ICON_WIDTH
+    return self.ctx.text_icon_width
 
   @classmethod
   def is_token(cls, text: str) -> bool:
@@ -179,12 +159,13 @@ class HealthToken(Token):
 
   def render(self, im: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
-    center = cursor_x + int(ICON_WIDTH / 2), cursor_y
-    icons.draw_heart_with_text(im, draw, center, ICON_WIDTH, ICON_HEIGHT,
-                               self.icon_text, ICON_FONT, ICON_FONT_COLOR)
+    center = cursor_x + int(self.ctx.text_icon_width / 2), cursor_y
+    icons.draw_heart_with_text(im, draw, center, self.ctx.text_icon_width,
+                               self.ctx.text_icon_height, self.icon_text,
+                               self.ctx.text_icon_font, ICON_FONT_COLOR)
 
   def width(self):
-    return ICON_WIDTH
+    return self.ctx.text_icon_width
 
   @classmethod
   def is_token(cls, text: str) -> bool:
@@ -204,12 +185,13 @@ class StrengthToken(Token):
 
   def render(self, im: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
-    center = cursor_x + int(ICON_WIDTH / 2), cursor_y
-    icons.draw_strength_with_text(im, draw, center, ICON_WIDTH, ICON_HEIGHT,
-                                  self.icon_text, ICON_FONT, ICON_FONT_COLOR)
+    center = cursor_x + int(self.ctx.text_icon_width / 2), cursor_y
+    icons.draw_strength_with_text(im, draw, center, self.ctx.text_icon_width,
+                                  self.ctx.text_icon_height, self.icon_text,
+                                  self.ctx.text_icon_font, ICON_FONT_COLOR)
 
   def width(self):
-    return ICON_WIDTH
+    return self.ctx.text_icon_width
 
   @classmethod
   def is_token(cls, text: str) -> bool:
@@ -219,8 +201,6 @@ class StrengthToken(Token):
 DAMAGE_ICON_REGEX = "<([0-9X]+)_DAMAGE>"
 DAMAGE_ICON_COLOR = colors.RED_A400
 DAMAGE_ICON_FONT_COLOR = colors.WHITE
-DAMAGE_ICON_FONT = ImageFont.truetype(str(util.LATO_FONT_PATH),
-                                      int(TEXT_HEIGHT * 0.8))
 
 
 class DamageToken(Token):
@@ -233,36 +213,33 @@ class DamageToken(Token):
 
   def render(self, im: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
-    center = cursor_x + int(ICON_WIDTH / 2), cursor_y
-    icons.draw_target_with_text(im, draw, center, ICON_WIDTH, ICON_HEIGHT,
-                                self.icon_text, ICON_FONT, ICON_FONT_COLOR)
+    center = cursor_x + int(self.ctx.text_icon_width / 2), cursor_y
+    icons.draw_target_with_text(im, draw, center, self.ctx.text_icon_width,
+                                self.ctx.text_icon_height, self.icon_text,
+                                self.ctx.text_icon_font, ICON_FONT_COLOR)
 
   def width(self):
-    return ICON_WIDTH
+    return self.ctx.text_icon_width
 
   @classmethod
   def is_token(cls, text: str) -> bool:
     return bool(re.match(DAMAGE_ICON_REGEX, text))
 
 
-def _load_image(img_path: pathlib.Path) -> Image:
-  assert img_path.is_file(), str(img_path)
-  return Image.open(img_path).convert("RGBA").resize((ICON_WIDTH, TEXT_HEIGHT))
-
-
+# Maps each icon token to its file in the icon dir.
 ICONS = {
-    "<END_COST>": _load_image(util.ICON_DIR.joinpath("end_cost.png")),
-    "<EXHAUST>": _load_image(util.ICON_DIR.joinpath("exhaust.png")),
-    "<READY>": _load_image(util.ICON_DIR.joinpath("ready.png")),
-    "<DRAW_CARD>": _load_image(util.ICON_DIR.joinpath("draw_card.png")),
-    "<SACRIFICE>": _load_image(util.ICON_DIR.joinpath("sacrifice.png")),
-    "<MEMORY_ACTION>": _load_image(util.ICON_DIR.joinpath("memory_action.png")),
-    "<SUMMON_ACTION>": _load_image(util.ICON_DIR.joinpath("summon_action.png")),
-    "<COMBAT_ACTION>": _load_image(util.ICON_DIR.joinpath("combat_action.png")),
-    "<RANGED_ACTION>": _load_image(util.ICON_DIR.joinpath("ranged_action.png")),
-    "<ANY_ACTION>": _load_image(util.ICON_DIR.joinpath("any_action.png")),
-    "<BREAK_ACTION>": _load_image(util.ICON_DIR.joinpath("break_action.png")),
-    "<REVEAL_ACTION>": _load_image(util.ICON_DIR.joinpath("reveal.png")),
+    "<END_COST>": "end_cost",
+    "<EXHAUST>": "exhaust",
+    "<READY>": "ready",
+    "<DRAW_CARD>": "draw_card",
+    "<SACRIFICE>": "sacrifice",
+    "<MEMORY_ACTION>": "memory_action",
+    "<SUMMON_ACTION>": "summon_action",
+    "<COMBAT_ACTION>": "combat_action",
+    "<RANGED_ACTION>": "ranged_action",
+    "<ANY_ACTION>": "any_action",
+    "<BREAK_ACTION>": "break_action",
+    "<REVEAL_ACTION>": "reveal",
 }
 
 
@@ -274,12 +251,15 @@ class IconToken(Token):
 
   def render(self, im: Image, draw: ImageDraw.Draw, cursor_x: int,
              cursor_y: int):
-    bb = util.get_centered_bb((cursor_x + ICON_WIDTH // 2, cursor_y),
-                              ICON_WIDTH, ICON_HEIGHT)
-    im.paste(ICONS[self.text], bb, ICONS[self.text])
+    icon_width = self.ctx.text_icon_width
+    icon_height = self.ctx.text_icon_height
+    bb = util.get_centered_bb((cursor_x + icon_width // 2, cursor_y),
+                              icon_width, icon_height)
+    icon = icons.load_icon(ICONS[self.text], icon_width, icon_height)
+    im.paste(icon, bb, icon)
 
   def width(self):
-    return ICON_WIDTH
+    return self.ctx.text_icon_width
 
   @classmethod
   def is_token(cls, text: str) -> bool:
@@ -289,7 +269,7 @@ class IconToken(Token):
 class EndCostToken(IconToken):
 
   def width(self):
-    return ICON_WIDTH // 2
+    return self.ctx.text_icon_width // 2
 
   @classmethod
   def is_token(cls, text: str) -> bool:
@@ -303,16 +283,16 @@ class ActionToken(IconToken):
     return text in ICONS and re.match("<[A-Z]+_ACTION>", text)
 
 
-def _get_token(desc: util.CardDesc, text: str,
-               font: ImageFont.ImageFont) -> Token:
+def _get_token(desc: util.CardDesc, text: str, font: ImageFont.ImageFont,
+               ctx: render_context.RenderContext) -> Token:
   for token_class in [
       SpaceToken, Newline, EndCostToken, ActionToken, IconToken, ManaToken,
       DamageToken, HealthToken, StrengthToken, TextToken,
       StartTetherSegmentToken, EndTetherSegmentToken, Token
   ]:
     if token_class.is_token(text):
-      return token_class(desc, text, font)
-  return Token(desc, text, font)
+      return token_class(desc, text, font, ctx)
+  return Token(desc, text, font, ctx)
 
 
 class TextSegmentType(enum.Enum):
@@ -374,8 +354,8 @@ def _get_logical_lines(text_segment: TextSegment) -> List[Token]:
   return lines
 
 
-def _parse_text(desc: util.CardDesc, text: str,
-                font: ImageFont.ImageFont) -> List[Token]:
+def _parse_text(desc: util.CardDesc, text: str, font: ImageFont.ImageFont,
+                ctx: render_context.RenderContext) -> List[Token]:
   text = text.replace("<THIS>", desc.title)
   text = text.strip()
   text = re.sub(r"\s+", " ", text)
@@ -386,23 +366,26 @@ def _parse_text(desc: util.CardDesc, text: str,
     token_texts[-1] += c
     if c in " >":
       token_texts.append("")
-  return [_get_token(desc, t, font) for t in token_texts]
+  return [_get_token(desc, t, font, ctx) for t in token_texts]
 
 
 class BodyTextWriter():
 
   def __init__(self, im: Image, draw: ImageDraw.Draw,
-               body_text_bb: util.BoundingBox, font: ImageFont.ImageFont):
+               body_text_bb: util.BoundingBox, font: ImageFont.ImageFont,
+               ctx: render_context.RenderContext):
     util.assert_valid_bb(body_text_bb)
     self.im = im
     self.draw = draw
     self.left, self.top, self.right, self.bottom = body_text_bb
+    self.ctx = ctx
     self.cursor_x = self.left
-    self.cursor_y = self.top + int(TEXT_HEIGHT / 2)
+    self.cursor_y = self.top + int(ctx.text_height / 2)
     self.font = font
 
   def render_text(self, desc: util.CardDesc, text: str):
-    for segment in _get_logical_segments(_parse_text(desc, text, self.font)):
+    for segment in _get_logical_segments(
+        _parse_text(desc, text, self.font, self.ctx)):
       self._render_segment(segment)
 
   def _render_segment(self, text_segment: TextSegment):
@@ -413,46 +396,47 @@ class BodyTextWriter():
         self._render_line(line)
     else:
       # Add some vertical space for the segment header text.
-      self.cursor_y += TEXT_SEGMENT_FONT_PADDING_Y
+      self.cursor_y += self.ctx.text_segment_font_padding_y
       # Measure how much vertical space this segment is going to take.
       init_y_pos = self.cursor_y
-      segment_bb_top = self.cursor_y - TEXT_HEIGHT // 2
-      self.cursor_y += TEXT_SEGMENT_PADDING_Y
+      segment_bb_top = self.cursor_y - self.ctx.text_height // 2
+      self.cursor_y += self.ctx.text_segment_padding_y
       for line in lines:
         self._render_line(line, dry_run=True)
-      segment_bb_bottom = (self.cursor_y - TEXT_HEIGHT // 2 +
-                           TEXT_SEGMENT_PADDING_Y)
+      segment_bb_bottom = (self.cursor_y - self.ctx.text_height // 2 +
+                           self.ctx.text_segment_padding_y)
 
       # Draw the segment header text
-      self.draw.text((self.right, segment_bb_top),
-                     text_segment.segment_type.value,
-                     TEXT_SEGMENT_FONT_COLOR,
-                     font=TEXT_SEGMENT_FONT,
-                     anchor="rb")
-      text_width, _ = TEXT_SEGMENT_FONT.getsize(text_segment.segment_type.value)
+      text_cache.draw_text(self.draw, (self.right, segment_bb_top),
+                           text_segment.segment_type.value,
+                           TEXT_SEGMENT_FONT_COLOR,
+                           font=self.ctx.text_segment_font,
+                           anchor="rb")
+      text_width, _ = self.ctx.text_segment_font.getsize(
+          text_segment.segment_type.value)
       # Draw the "tabbed box" around the segment
       poly = [
-          (self.left - BODY_TEXT_MARGIN, segment_bb_top),
-          (self.right - text_width - BODY_TEXT_MARGIN, segment_bb_top),
-          (self.right - text_width - BODY_TEXT_MARGIN,
-           segment_bb_top - TEXT_SEGMENT_FONT_PADDING_Y),
-          (self.right + BODY_TEXT_MARGIN,
-           segment_bb_top - TEXT_SEGMENT_FONT_PADDING_Y),
-          (self.right + BODY_TEXT_MARGIN, segment_bb_bottom),
-          (self.left - BODY_TEXT_MARGIN, segment_bb_bottom),
-          (self.left - BODY_TEXT_MARGIN, segment_bb_top),
+          (self.left - self.ctx.body_text_margin, segment_bb_top),
+          (self.right - text_width - self.ctx.body_text_margin, segment_bb_top),
+          (self.right - text_width - self.ctx.body_text_margin,
+           segment_bb_top - self.ctx.text_segment_font_padding_y),
+          (self.right + self.ctx.body_text_margin,
+           segment_bb_top - self.ctx.text_segment_font_padding_y),
+          (self.right + self.ctx.body_text_margin, segment_bb_bottom),
+          (self.left - self.ctx.body_text_margin, segment_bb_bottom),
+          (self.left - self.ctx.body_text_margin, segment_bb_top),
       ]
       self.draw.line(poly,
                      fill=TEXT_SEGMENT_BORDER_COLOR,
-                     width=TEXT_SEGMENT_BORDER_WIDTH)
+                     width=self.ctx.text_segment_border_width)
 
       # Now, reset the cursor position at the top of the box.
-      self.cursor_y = init_y_pos + TEXT_SEGMENT_PADDING_Y
+      self.cursor_y = init_y_pos + self.ctx.text_segment_padding_y
       for line in lines:
         self._render_line(line)
       # Now, place the cursor position at the end of the box.
-      self.cursor_y = (segment_bb_bottom + TEXT_SEGMENT_PADDING_Y +
-                       TEXT_HEIGHT // 2)
+      self.cursor_y = (segment_bb_bottom + self.ctx.text_segment_padding_y +
+                       self.ctx.text_height // 2)
 
   def _render_line(self, tokens: List[Token], dry_run: bool = False):
     if isinstance(tokens[0], ActionToken):
@@ -474,17 +458,19 @@ class BodyTextWriter():
 
   def _newline(self, indent: int = 0):
     self.cursor_x = self.left + indent
-    self.cursor_y += self.font.size + TOKEN_PADDING_Y
+    self.cursor_y += self.font.size + self.ctx.token_padding_y
 
   def _render_cost_background(self, cost: List[Token]):
     assert isinstance(cost[-1], EndCostToken)
-    cost_width = sum(
-        c.width() for c in cost[:-1]) + COST_PADDING_X + ICON_WIDTH / 2
+    cost_width = sum(c.width() for c in cost[:-1]
+                    ) + self.ctx.cost_padding_x + self.ctx.text_icon_width / 2
     bb = [
-        self.cursor_x, self.cursor_y - TEXT_HEIGHT // 2 - 1,
-        self.cursor_x + cost_width, self.cursor_y + TEXT_HEIGHT // 2
+        self.cursor_x, self.cursor_y - self.ctx.text_height // 2 - 1,
+        self.cursor_x + cost_width, self.cursor_y + self.ctx.text_height // 2
     ]
-    self.draw.rounded_rectangle(bb, radius=TEXT_HEIGHT // 2, fill=COST_BG_COLOR)
+    self.draw.rounded_rectangle(bb,
+                                radius=self.ctx.text_height // 2,
+                                fill=COST_BG_COLOR)
 
   def _render_action_line(self,
                           action: ActionToken,
@@ -493,20 +479,20 @@ class BodyTextWriter():
                           dry_run: bool = False):
     if not dry_run:
       action.render(self.im, self.draw, self.cursor_x, self.cursor_y)
-    self.cursor_x += action.width() + ACTION_ICON_PADDING
+    self.cursor_x += action.width() + self.ctx.action_icon_padding
     if len(cost) > 0:
       if not dry_run:
         self._render_cost_background(cost)
-      self.cursor_x += COST_PADDING_X
+      self.cursor_x += self.ctx.cost_padding_x
       for c in cost:
         if not dry_run:
           c.render(self.im, self.draw, self.cursor_x, self.cursor_y)
         self.cursor_x += c.width()
-      self.cursor_x += COST_PADDING_X
-    self.cursor_x += TOKEN_PADDING_X
+      self.cursor_x += self.ctx.cost_padding_x
+    self.cursor_x += self.ctx.token_padding_x
     for token in content:
       if self.cursor_x + token.width() > self.right:
-        self._newline(action.width() + ACTION_ICON_PADDING)
+        self._newline(action.width() + self.ctx.action_icon_padding)
         if isinstance(token, SpaceToken):
           # Don't render a space if we've just started a new line.
           continue
@@ -527,32 +513,42 @@ class BodyTextWriter():
       self.cursor_x += token.width()
 
 
-def render_body_text(im: Image, draw: ImageDraw.Draw, desc: util.CardDesc,
-                     body_text_bb: util.BoundingBox):
+def render_body_panel(draw: ImageDraw.Draw, card_type: util.CardType,
+                      body_text_bb: util.BoundingBox,
+                      ctx: render_context.RenderContext):
+  """The background of the body text, drawn before render_body_text."""
   util.assert_valid_bb(body_text_bb)
-  if desc.card_type == util.CardType.MEMORY:
+  if card_type == util.CardType.MEMORY:
     draw.rectangle(body_text_bb, fill=BG_COLOR)
   else:
-    draw.rounded_rectangle(body_text_bb, radius=BG_RADIUS, fill=BG_COLOR)
+    draw.rounded_rectangle(body_text_bb,
+                           radius=ctx.body_bg_radius,
+                           fill=BG_COLOR)
+
+
+def render_body_text(im: Image, draw: ImageDraw.Draw, desc: util.CardDesc,
+                     body_text_bb: util.BoundingBox,
+                     ctx: render_context.RenderContext):
+  util.assert_valid_bb(body_text_bb)
   bg_x1, bg_y1, bg_x2, bg_y2 = body_text_bb
-  text_area_left = bg_x1 + BODY_TEXT_MARGIN
-  text_area_right = bg_x2 - BODY_TEXT_MARGIN
-  text_area_top = bg_y1 + BODY_TEXT_MARGIN
-  text_area_bottom = bg_y2 - BODY_TEXT_MARGIN
+  text_area_left = bg_x1 + ctx.body_text_margin
+  text_area_right = bg_x2 - ctx.body_text_margin
+  text_area_top = bg_y1 + ctx.body_text_margin
+  text_area_bottom = bg_y2 - ctx.body_text_margin
   flavor_text_top = 0.4 * text_area_top + 0.6 * text_area_bottom
-  flavor_text_left = text_area_left + FLAVOR_TEXT_MARGIN
-  flavor_text_right = text_area_right - FLAVOR_TEXT_MARGIN
+  flavor_text_left = text_area_left + ctx.flavor_text_margin
+  flavor_text_right = text_area_right - ctx.flavor_text_margin
 
   if desc.body_text is not None:
     writer = BodyTextWriter(
         im, draw,
         [text_area_left, text_area_top, text_area_right, text_area_bottom],
-        FONT)
+        ctx.body_font, ctx)
     writer.render_text(desc, desc.body_text)
     flavor_text_top = max(writer.cursor_y, flavor_text_top)
 
   if desc.flavor_text is not None:
     writer = BodyTextWriter(im, draw, [
         flavor_text_left, flavor_text_top, flavor_text_right, text_area_bottom
-    ], FLAVOR_TEXT_FONT)
+    ], ctx.flavor_text_font, ctx)
     writer.render_text(desc, desc.flavor_text)
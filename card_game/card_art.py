@@ -1,14 +1,17 @@
 import colorsys
 import dataclasses
+import functools
 import hashlib
 import math
 import random
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+from PIL import Image, ImageDraw
 
-from . import colors, util
+from . import colors, render_context, util
 
+#pylint: disable=too-many-arguments
 #pylint: disable=too-many-locals
 
 # We want to generate between 3 sided and 10-sided shapes.
@@ -17,8 +20,6 @@ RAND_MAX_POINT_GEN_STEP_RADS = 2 * math.pi / 3
 RAND_MIN_SHAPES = 10
 RAND_MAX_SHAPES = 100
 
-IMAGE_CORNER_RADIUS = int(util.PIXELS_PER_INCH * 0.1)
-
 
 @dataclasses.dataclass
 class ColorPalette:
@@ -27,14 +28,24 @@ class ColorPalette:
   secondary_hue: float
   alt_hues: List[float]
 
-  def sample_hue(self) -> float:
+  def sample_hue(self, rng: random.Random) -> float:
     hues = [self.primary_hue, self.secondary_hue] + self.alt_hues
     weights = [0.5, 0.25]
     weights += [0.25 / len(self.alt_hues) for _ in self.alt_hues]
-    return random.choices(hues, weights=weights)[0]
+    return rng.choices(hues, weights=weights)[0]
+
+
+def get_card_rng(desc: util.CardDesc) -> random.Random:
+  """Returns a new generator seeded with a deterministic hash of the card.
+
+  This gives us the same image if we run the generation script twice. Each
+  render owns its generator, so cards can be rendered concurrently.
+  """
+  return random.Random(desc.hash_title())
 
 
 def rand_shape(
+    rng: random.Random,
     x_offset: float,
     y_offset: float,
     min_radius: float,
@@ -42,68 +53,101 @@ def rand_shape(
 ) -> List[int]:
   """Returns the points of a shape in clockwise order centered at offset."""
   points = []
-  angle_offset = random.random() * 2 * math.pi
+  angle_offset = rng.random() * 2 * math.pi
   angle = 0
   while angle < 2 * math.pi:
-    magnitude = random.uniform(min_radius, max_radius)
+    magnitude = rng.uniform(min_radius, max_radius)
     x = math.cos(angle + angle_offset) * magnitude + x_offset
     y = math.sin(angle + angle_offset) * magnitude + y_offset
     points.append((x, y))
-    angle += random.uniform(RAND_MIN_POINT_GEN_STEP_RADS,
-                            RAND_MAX_POINT_GEN_STEP_RADS)
+    angle += rng.uniform(RAND_MIN_POINT_GEN_STEP_RADS,
+                         RAND_MAX_POINT_GEN_STEP_RADS)
   return points
 
 
-def get_nearby_hue(hue: float, closeness: float = 0.05) -> float:
-  hue += random.uniform(-closeness, closeness)
+def get_nearby_hue(rng: random.Random,
+                   hue: float,
+                   closeness: float = 0.05) -> float:
+  hue += rng.uniform(-closeness, closeness)
   hue %= 1
   return hue
 
 
-def get_nearby_complimentary_hue(hue: float, closeness: float = 0.4) -> float:
-  return get_nearby_hue((hue + 0.5) % 1, closeness)
+def get_nearby_complimentary_hue(rng: random.Random,
+                                 hue: float,
+                                 closeness: float = 0.4) -> float:
+  return get_nearby_hue(rng, (hue + 0.5) % 1, closeness)
 
 
-def get_nearby_hue_from_color(color: colors.Color,
+def get_nearby_hue_from_color(rng: random.Random,
+                              color: colors.Color,
                               closeness: float = 0.05) -> float:
   hue, _, _ = colorsys.rgb_to_hsv(*color)
-  return get_nearby_hue(hue, closeness)
+  return get_nearby_hue(rng, hue, closeness)
 
 
-def get_nearby_hue_from_element(element: util.Element,
+def get_nearby_hue_from_element(rng: random.Random,
+                                element: util.Element,
                                 closeness: float = 0.05) -> float:
   if element == util.Element.COLORLESS:
-    return random.uniform(0, 1)
-  return get_nearby_hue_from_color(element.get_color(), closeness)
+    return rng.uniform(0, 1)
+  return get_nearby_hue_from_color(rng, element.get_color(), closeness)
 
 
-def rand_color_palette(desc: util.CardDesc) -> ColorPalette:
-  primary_hue = get_nearby_hue_from_element(desc.primary_element)
-  secondary_hue = (get_nearby_complimentary_hue(primary_hue)
+def rand_color_palette(rng: random.Random,
+                       desc: util.CardDesc) -> ColorPalette:
+  primary_hue = get_nearby_hue_from_element(rng, desc.primary_element)
+  secondary_hue = (get_nearby_complimentary_hue(rng, primary_hue)
                    if desc.secondary_element is None else
-                   get_nearby_hue_from_element(desc.secondary_element))
+                   get_nearby_hue_from_element(rng, desc.secondary_element))
   alts = [((primary_hue - secondary_hue) / 2) % 1,
           ((secondary_hue - primary_hue) / 2) % 1,
-          get_nearby_hue(primary_hue, 0.2),
-          get_nearby_hue(secondary_hue, 0.2),
-          random.random()]
+          get_nearby_hue(rng, primary_hue, 0.2),
+          get_nearby_hue(rng, secondary_hue, 0.2),
+          rng.random()]
   return ColorPalette(primary_hue, secondary_hue, alts)
 
 
 def rand_color(
+    rng: random.Random,
     hue: float,
     min_saturation=0.5,
     max_saturation=1,
     min_value=0,
     max_value=1,
 ) -> Tuple[int, int, int]:
-  saturation = random.uniform(min_saturation, max_saturation)
-  value = random.uniform(min_value, max_value)
+  saturation = rng.uniform(min_saturation, max_saturation)
+  value = rng.uniform(min_value, max_value)
   return tuple(
       int(255 * c) for c in colorsys.hsv_to_rgb(hue, saturation, value))
 
 
-def _get_random_coords(low: int, high: int, avg_step: int,
+def _hsv_to_rgb(hue: np.ndarray, saturation: np.ndarray,
+                value: np.ndarray) -> np.ndarray:
+  """Vectorized colorsys.hsv_to_rgb, returning uint8 colors like rand_color."""
+  i = (hue * 6.0).astype(np.int64)
+  f = (hue * 6.0) - i
+  p = value * (1.0 - saturation)
+  q = value * (1.0 - saturation * f)
+  t = value * (1.0 - saturation * (1.0 - f))
+  i %= 6
+  choices = [
+      (value, t, p),
+      (q, value, p),
+      (p, value, t),
+      (p, q, value),
+      (t, p, value),
+      (value, p, q),
+  ]
+  rgb = np.stack([
+      np.choose(i, [choice[channel] for choice in choices])
+      for channel in range(3)
+  ],
+                 axis=-1)
+  return (255 * rgb).astype(np.uint8)
+
+
+def _get_random_coords(rng: random.Random, low: int, high: int, avg_step: int,
                        variance: float) -> List[int]:
   step_low = avg_step - int(avg_step * variance)
   step_high = avg_step + int(avg_step * variance)
@@ -111,37 +155,73 @@ def _get_random_coords(low: int, high: int, avg_step: int,
   x = low
   while x < high:
     cords.append(x)
-    x += int(random.uniform(step_low, step_high))
+    x += int(rng.uniform(step_low, step_high))
   cords.append(high)
   return cords
 
 
-def _round_corners(im: Image, radius: int):
-  mask = Image.new("L", (im.width, im.height))
+# The masks and overlays below only depend on their arguments, so they are
+# built once and shared. Callers must not modify the returned images. Each
+# resolution needs a few masks, and an overlay per element.
+MASK_CACHE_SIZE = 32
+OVERLAY_CACHE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def _get_rounded_corner_mask(width: int, height: int, radius: int) -> Image:
+  mask = Image.new("L", (width, height))
   mask_draw = ImageDraw.Draw(mask)
-  mask_draw.rounded_rectangle([0, 0, im.width, im.height],
-                              fill=255,
-                              radius=radius)
-  im.putalpha(mask)
+  mask_draw.rounded_rectangle([0, 0, width, height], fill=255, radius=radius)
+  return mask
 
 
-def _cut_corners(im: Image, corner_size: int):
-  mask = Image.new("L", (im.width, im.height))
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def _get_cut_corner_mask(width: int, height: int, corner_size: int) -> Image:
+  mask = Image.new("L", (width, height))
   mask_draw = ImageDraw.Draw(mask)
   mask_draw.polygon([(0, corner_size), (corner_size, 0),
-                     (im.width - corner_size, 0), (im.width, corner_size),
-                     (im.width, im.height - corner_size),
-                     (im.width - corner_size, im.height),
-                     (corner_size, im.height), (0, im.height - corner_size)],
+                     (width - corner_size, 0), (width, corner_size),
+                     (width, height - corner_size),
+                     (width - corner_size, height), (corner_size, height),
+                     (0, height - corner_size)],
                     fill=255)
-  im.putalpha(mask)
+  return mask
+
+
+@functools.lru_cache(maxsize=OVERLAY_CACHE_SIZE)
+def _get_secondary_border_overlay(width: int, height: int,
+                                  image_bb: Tuple[int, int, int, int],
+                                  border_width: int, corner_radius: int,
+                                  element: util.Element) -> Image:
+  """The right half of the border, colored by the secondary element."""
+  right_border = Image.new("RGBA", (width, height), color=element.get_color())
+  right_mask = Image.new("L", (width, height), color=0)
+  right_mask_draw = ImageDraw.Draw(right_mask)
+  # Cut out the border
+  right_mask_draw.rounded_rectangle(
+      image_bb,
+      fill=0,
+      outline=255,
+      width=border_width,
+      radius=corner_radius,
+  )
+  # Mask out left side
+  right_mask_draw.rectangle([0, 0, width // 2, height], fill=0)
+  right_border.putalpha(right_mask)
+  return right_border
+
+
+def _round_corners(im: Image, radius: int):
+  im.putalpha(_get_rounded_corner_mask(im.width, im.height, radius))
 
 
-def render_card_art(im: Image, desc: util.CardDesc,
-                    image_bb: util.BoundingBox) -> Image:
-  # Seed random number gen with deterministic hash of card description. This
-  # gives us the same image if we run the generation script twice.
-  random.seed(desc.hash_title())
+def _cut_corners(im: Image, corner_size: int):
+  im.putalpha(_get_cut_corner_mask(im.width, im.height, corner_size))
+
+
+def render_card_art(im: Image, desc: util.CardDesc, image_bb: util.BoundingBox,
+                    ctx: render_context.RenderContext):
+  rng = get_card_rng(desc)
   left, top, right, bottom = image_bb
   width = right - left
   height = bottom - top
@@ -149,16 +229,20 @@ def render_card_art(im: Image, desc: util.CardDesc,
   art_image = Image.new(mode="RGBA", size=(width, height))
   art_draw = ImageDraw.Draw(art_image)
   art_draw.rectangle([0, 0, width, height], fill=colors.BLACK)
-  num_shapes = random.randint(RAND_MIN_SHAPES, RAND_MAX_SHAPES)
-  color_palette = rand_color_palette(desc)
+  num_shapes = rng.randint(RAND_MIN_SHAPES, RAND_MAX_SHAPES)
+  # The art draws its palette after the shape count, so it differs from the
+  # background palette.
+  color_palette = rand_color_palette(rng, desc)
   for _ in range(num_shapes):
-    offset_x = random.uniform(0, width)
-    offset_y = random.uniform(0, height)
-    shape = rand_shape(offset_x,
+    offset_x = rng.uniform(0, width)
+    offset_y = rng.uniform(0, height)
+    shape = rand_shape(rng,
+                       offset_x,
                        offset_y,
                        min_radius=min(width, height) * 0.1,
                        max_radius=min(width, height) * 0.3)
-    art_draw.polygon(shape, fill=rand_color(color_palette.sample_hue()))
+    art_draw.polygon(shape,
+                     fill=rand_color(rng, color_palette.sample_hue(rng)))
   # These values make the primary and secondary shapes "pop"
   x_min_offset = width * 0.1
   x_max_offset = width * 0.9
@@ -171,106 +255,144 @@ def render_card_art(im: Image, desc: util.CardDesc,
   min_radius = min(width, height) * 0.3
   max_radius = min(width, height) * 0.6
   # Big secondary shape.
-  art_draw.polygon(rand_shape(random.uniform(x_min_offset, x_max_offset),
-                              random.uniform(y_min_offset, y_max_offset),
+  art_draw.polygon(rand_shape(rng, rng.uniform(x_min_offset, x_max_offset),
+                              rng.uniform(y_min_offset, y_max_offset),
                               min_radius, max_radius),
-                   fill=rand_color(color_palette.secondary_hue, min_saturation,
-                                   max_saturation, min_value, max_value))
-  art_draw.polygon(rand_shape(random.uniform(x_min_offset, x_max_offset),
-                              random.uniform(y_min_offset, y_max_offset),
+                   fill=rand_color(rng, color_palette.secondary_hue,
+                                   min_saturation, max_saturation, min_value,
+                                   max_value))
+  art_draw.polygon(rand_shape(rng, rng.uniform(x_min_offset, x_max_offset),
+                              rng.uniform(y_min_offset, y_max_offset),
                               min_radius, max_radius),
-                   fill=rand_color(color_palette.primary_hue, min_saturation,
-                                   max_saturation, min_value, max_value))
+                   fill=rand_color(rng, color_palette.primary_hue,
+                                   min_saturation, max_saturation, min_value,
+                                   max_value))
   if desc.card_type == util.CardType.MEMORY:
-    _cut_corners(art_image, IMAGE_CORNER_RADIUS)
+    _cut_corners(art_image, ctx.art_corner_radius)
   else:
-    _round_corners(art_image, IMAGE_CORNER_RADIUS)
+    _round_corners(art_image, ctx.art_corner_radius)
   im.paste(art_image, image_bb, art_image)
 
 
-BORDER_WIDTH = int(0.2 * util.PIXELS_PER_INCH)
-BORDER_CORNER_RADIUS = int(0.25 * util.PIXELS_PER_INCH)
-BG_PATTERN_SIZE = int(0.2 * util.PIXELS_PER_INCH)
-
+def draw_background_mesh(im: Image, desc: util.CardDesc,
+                         image_bb: util.BoundingBox, pattern_size: int):
+  """Fills image_bb with a mesh of slightly offset, pale colored cells.
 
-def render_background(im: Image, draw: ImageDraw.Draw, desc: util.CardDesc,
-                      image_bb: util.BoundingBox):
-  random.seed(desc.hash_title())
-  color_palette = rand_color_palette(desc)
+  Every cell's color is computed in one batch, and the mesh is rasterized
+  with numpy and pasted with a single Pillow call.
+  """
+  rng = get_card_rng(desc)
+  color_palette = rand_color_palette(rng, desc)
   left, top, right, bottom = image_bb
   image_width = right - left
 
   # Generate a triangle mesh
-  bg_left = left - BG_PATTERN_SIZE
-  bg_right = right + BG_PATTERN_SIZE
-  bg_top = top - BG_PATTERN_SIZE
-  bg_bottom = bottom + BG_PATTERN_SIZE
+  bg_left = left - pattern_size
+  bg_right = right + pattern_size
+  bg_top = top - pattern_size
+  bg_bottom = bottom + pattern_size
   bg_ceter = (bg_left + bg_right) / 2
 
-  def _get_hue(x: float) -> float:
-    """Gets the hue based on the horizontal location."""
-    if desc.secondary_element is None:
-      return color_palette.primary_hue
-    # fuzzy the card in half, left side is primary.
-    color_frac = util.sigmoid((x - bg_ceter) / image_width * 100 +
-                              random.uniform(-20, 20))
-    return (color_frac * color_palette.secondary_hue +
-            (1 - color_frac) * color_palette.primary_hue)
-
-  x_cords = _get_random_coords(bg_left, bg_right, BG_PATTERN_SIZE, 0.2)
-  y_cords = _get_random_coords(bg_top, bg_bottom, BG_PATTERN_SIZE, 0.2)
+  x_cords = np.array(_get_random_coords(rng, bg_left, bg_right, pattern_size,
+                                        0.2))
+  y_cords = np.array(_get_random_coords(rng, bg_top, bg_bottom, pattern_size,
+                                        0.2))
+  num_cols = len(x_cords) - 1
+  num_rows = len(y_cords) - 1
   min_saturation = 0 if desc.primary_element == util.Element.COLORLESS else 0.1
   max_saturation = 0 if desc.primary_element == util.Element.COLORLESS else 0.3
+  min_value = 0.9
+  max_value = 1
+
+  # Draw from the generator in the same column-major order as the per-cell
+  # loop this replaces, so each card keeps its colors.
+  draws_per_cell = 2 if desc.secondary_element is None else 3
+  draws = np.array([
+      rng.random() for _ in range(num_cols * num_rows * draws_per_cell)
+  ]).reshape((num_cols, num_rows, draws_per_cell))
+
+  if desc.secondary_element is None:
+    hue = np.full((num_cols, num_rows), color_palette.primary_hue)
+  else:
+    # Gets the hue based on the horizontal location.
+    # fuzzy the card in half, left side is primary.
+    cell_center_x = (x_cords[:-1] + x_cords[1:]) / 2
+    color_frac = 1 / (1 + np.exp(-(
+        (cell_center_x[:, np.newaxis] - bg_ceter) / image_width * 100 +
+        (-20 + 40 * draws[:, :, 0]))))
+    hue = (color_frac * color_palette.secondary_hue +
+           (1 - color_frac) * color_palette.primary_hue)
+  saturation = (min_saturation +
+                (max_saturation - min_saturation) * draws[:, :, -2])
+  value = min_value + (max_value - min_value) * draws[:, :, -1]
+  cell_colors = _hsv_to_rgb(hue, saturation, value)
+
+  # Every other column is shifted down by half a cell. Cells include their
+  # edges, and later cells are drawn on top of earlier ones, so each pixel
+  # belongs to the last cell whose first edge is at or before it.
+  col_offsets = np.where(np.arange(num_cols) % 2 == 0, 0, int(pattern_size / 2))
+  pixel_y = np.arange(im.height)
+  col_y_cords = y_cords[np.newaxis, :] + col_offsets[:, np.newaxis]
+  cell_rows = np.stack([
+      np.searchsorted(y, pixel_y, side="right") - 1 for y in col_y_cords
+  ]).clip(0, num_rows - 1)
+  rows_drawn = ((pixel_y[np.newaxis, :] >= col_y_cords[:, :1]) &
+                (pixel_y[np.newaxis, :] <= col_y_cords[:, -1:]))
+  col_strips = np.concatenate([
+      cell_colors[np.arange(num_cols)[:, np.newaxis], cell_rows],
+      np.where(rows_drawn, 255, 0).astype(np.uint8)[:, :, np.newaxis]
+  ],
+                              axis=2)
+  # View each RGBA pixel as one uint32, shaped (height, num_cols).
+  col_strips = np.ascontiguousarray(col_strips.transpose(1, 0, 2)).view(
+      np.uint32)[:, :, 0]
+
+  pixel_x = np.arange(im.width)
+  pixel_cols = (np.searchsorted(x_cords, pixel_x, side="right") - 1).clip(
+      0, num_cols - 1)
+  # Columns are sorted, so repeating each strip by its width lays them out.
+  mesh = np.repeat(col_strips, np.bincount(pixel_cols, minlength=num_cols),
+                   axis=1)
+  cols_drawn = (pixel_x >= x_cords[0]) & (pixel_x <= x_cords[-1])
+  mesh[:, ~cols_drawn] = 0
+  mesh_im = Image.frombuffer("RGBA", (im.width, im.height), mesh, "raw",
+                             "RGBA", 0, 1)
+  if rows_drawn.all() and cols_drawn.all():
+    im.paste(mesh_im, (0, 0))
+  else:
+    im.paste(mesh_im, (0, 0), mesh_im)
+
+
+def render_background(im: Image, desc: util.CardDesc,
+                      image_bb: util.BoundingBox,
+                      ctx: render_context.RenderContext):
+  draw_background_mesh(im, desc, image_bb, ctx.bg_pattern_size)
+  _round_corners(im, ctx.border_corner_radius)
+
 
-  for x, _ in enumerate(x_cords):
-    this_offset = 0 if x % 2 == 0 else int(BG_PATTERN_SIZE / 2)
-    next_offset = 0 if x % 2 == 0 else int(BG_PATTERN_SIZE / 2)
-    for y, _ in enumerate(y_cords):
-      if x + 1 < len(x_cords) and y + 1 < len(y_cords):
-        square = [
-            (x_cords[x], y_cords[y] + this_offset),
-            (x_cords[x + 1], y_cords[y] + next_offset),
-            (x_cords[x + 1], y_cords[y + 1] + next_offset),
-            (x_cords[x], y_cords[y + 1] + this_offset),
-        ]
-        square_center_x = (x_cords[x] + x_cords[x + 1]) / 2
-        draw.polygon(square,
-                     fill=rand_color(_get_hue(square_center_x),
-                                     max_saturation=max_saturation,
-                                     min_saturation=min_saturation,
-                                     min_value=0.9))
-  _round_corners(im, BORDER_CORNER_RADIUS)
-
-
-def render_boarder(im: Image, draw: ImageDraw.Draw, desc: util.CardDesc,
-                   image_bb: util.BoundingBox):
+def render_boarder(im: Image, draw: ImageDraw.Draw,
+                   primary_element: util.Element,
+                   secondary_element: Optional[util.Element],
+                   image_bb: util.BoundingBox,
+                   ctx: render_context.RenderContext):
   draw.rounded_rectangle(
       image_bb,
-      outline=desc.primary_element.get_color(),
-      width=BORDER_WIDTH,
-      radius=BORDER_CORNER_RADIUS,
+      outline=primary_element.get_color(),
+      width=ctx.border_width,
+      radius=ctx.border_corner_radius,
   )
-  if desc.secondary_element is not None:
-    right_border = Image.new("RGBA", (im.width, im.height),
-                             color=desc.secondary_element.get_color())
-    right_mask = Image.new("L", (im.width, im.height), color=0)
-    right_mask_draw = ImageDraw.Draw(right_mask)
-    # Cut out the border
-    right_mask_draw.rounded_rectangle(
-        image_bb,
-        fill=0,
-        outline=255,
-        width=BORDER_WIDTH,
-        radius=BORDER_CORNER_RADIUS,
-    )
-    # Mask out left side
-    right_mask_draw.rectangle([0, 0, im.width // 2, im.height], fill=0)
-    right_border.putalpha(right_mask)
+  if secondary_element is not None:
+    right_border = _get_secondary_border_overlay(im.width, im.height,
+                                                 tuple(image_bb),
+                                                 ctx.border_width,
+                                                 ctx.border_corner_radius,
+                                                 secondary_element)
     im.paste(right_border, image_bb, right_border)
 
 
-def render_card_back(im: Image, draw: ImageDraw.Draw):
-  random.seed(hashlib.md5("TEMP".encode("utf-8")).hexdigest())
+def render_card_back(im: Image, draw: ImageDraw.Draw,
+                     ctx: render_context.RenderContext):
+  rng = random.Random(hashlib.md5("TEMP".encode("utf-8")).hexdigest())
 
   edge_size = min(im.width, im.height)
   image_bb = [0, 0, im.width, im.height]
@@ -290,45 +412,43 @@ def render_card_back(im: Image, draw: ImageDraw.Draw):
     element = elements[idx % len(elements)]
     base_color = element.get_color();
 
-    hue = get_nearby_hue_from_color(base_color, 0.1)
+    hue = get_nearby_hue_from_color(rng, base_color, 0.1)
     if idx < num_bg_shapes:
-      shape_radius = edge_size * random.uniform(0.6, 1)
-      saturation = random.uniform(0.4, 0.6)
-      value = random.uniform(0.25, 0.5)
+      shape_radius = edge_size * rng.uniform(0.6, 1)
+      saturation = rng.uniform(0.4, 0.6)
+      value = rng.uniform(0.25, 0.5)
     elif idx > num_shapes - num_fg_shapes:
-      shape_radius = edge_size * random.uniform(0.1, 0.3)
-      saturation = random.uniform(0.9, 1)
+      shape_radius = edge_size * rng.uniform(0.1, 0.3)
+      saturation = rng.uniform(0.9, 1)
       value = 1
     else:
-      shape_radius = edge_size * random.uniform(0.4, 0.6)
-      saturation = random.uniform(0.6, 0.9)
-      value = random.uniform(0.25, 0.75)
+      shape_radius = edge_size * rng.uniform(0.4, 0.6)
+      saturation = rng.uniform(0.6, 0.9)
+      value = rng.uniform(0.25, 0.75)
 
     value *= 0.3
 
     color = tuple(
         int(255 * c) for c in colorsys.hsv_to_rgb(hue, saturation, value))
 
-    shape = rand_shape(random.uniform(extended_bb[0], extended_bb[2]),
-                       random.uniform(extended_bb[1], extended_bb[3]),
+    shape = rand_shape(rng, rng.uniform(extended_bb[0], extended_bb[2]),
+                       rng.uniform(extended_bb[1], extended_bb[3]),
                        shape_radius, shape_radius)
     draw.polygon(shape, fill=color)
 
-  title_font = ImageFont.truetype(str(util.LEAGUE_GOTHIC_FONT_PATH),
-                                  int(util.PIXELS_PER_INCH * 0.75))
   draw.text((im.width // 2, int(im.height * 0.4)),
             "Hawken",
             colors.WHITE,
-            font=title_font,
+            font=ctx.card_back_title_font,
             anchor="mm")
 
   draw.rounded_rectangle(
       image_bb,
       outline=colors.BLACK,
-      width=BORDER_WIDTH,
-      radius=BORDER_CORNER_RADIUS,
+      width=ctx.border_width,
+      radius=ctx.border_corner_radius,
   )
-  _round_corners(im, BORDER_CORNER_RADIUS)
+  _round_corners(im, ctx.border_corner_radius)
 
 
 def crop_image_border(im: Image, border_width: float,
@@ -0,0 +1,105 @@
+# Precomposed layers that every card of a type and element pairing shares.
+#
+# The body text panel, the border and the fixed mana icon of memory cards only
+# depend on the card type, the elements and the resolution. Each is drawn once
+# into a transparent layer. A card draws the panel right after the background,
+# under its own content, and the frame, i.e. the border and mana icon, before
+# the crop. Every drawn template pixel is opaque and nothing drawn per card sits
+# between the art and the panel, so cards come out the same as when each part
+# was drawn on the card.
+#
+# Layers are mostly empty, e.g. the border is a thin frame, so they are kept as
+# tiles cropped to what was drawn. Opaque tiles are copied, others composited.
+
+import dataclasses
+import functools
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from . import body_text, card_art, colors, icons, render_context, util
+
+#pylint: disable=too-few-public-methods
+
+# Frames kept. Decks rarely use more than a few element pairings, and a frame
+# takes well under 1 MiB at 300 PPI.
+FRAME_CACHE_SIZE = 64
+# Panels kept, one per card type and resolution.
+PANEL_CACHE_SIZE = 16
+TILE_SIZE = 64
+MANA_ICON_TEXT = "1"
+ICON_FONT_COLOR = colors.WHITE
+
+
+@dataclasses.dataclass(frozen=True)
+class Tile:
+  im: Image
+  coord: util.Coord
+  is_opaque: bool
+
+
+class TemplateLayer():
+  """The non-empty tiles of a layer the size of the card."""
+
+  def __init__(self, im: Image, tile_size: int = TILE_SIZE):
+    self.tiles: List[Tile] = []
+    alpha = np.asarray(im.getchannel("A"))
+    for top in range(0, im.height, tile_size):
+      for left in range(0, im.width, tile_size):
+        tile_alpha = alpha[top:top + tile_size, left:left + tile_size]
+        rows = np.flatnonzero(tile_alpha.any(axis=1))
+        if len(rows) == 0:
+          continue
+        cols = np.flatnonzero(tile_alpha.any(axis=0))
+        box = (left + int(cols[0]), top + int(rows[0]),
+               left + int(cols[-1]) + 1, top + int(rows[-1]) + 1)
+        is_opaque = bool((alpha[box[1]:box[3], box[0]:box[2]] == 255).all())
+        self.tiles.append(Tile(im.crop(box), box[:2], is_opaque))
+
+  def draw(self, im: Image):
+    for tile in self.tiles:
+      if tile.is_opaque:
+        im.paste(tile.im, tile.coord)
+      else:
+        im.alpha_composite(tile.im, tile.coord)
+
+
+@functools.lru_cache(maxsize=PANEL_CACHE_SIZE)
+def _get_panel_layer(card_type: util.CardType,
+                     pixels_per_inch: int) -> TemplateLayer:
+  ctx = render_context.get_render_context(pixels_per_inch)
+  im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
+  body_text.render_body_panel(ImageDraw.Draw(im), card_type,
+                              ctx.body_text_bg_bb, ctx)
+  return TemplateLayer(im)
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def _get_frame_layer(has_mana_icon: bool, primary_element: util.Element,
+                     secondary_element: Optional[util.Element],
+                     pixels_per_inch: int) -> TemplateLayer:
+  ctx = render_context.get_render_context(pixels_per_inch)
+  im = Image.new(mode="RGBA", size=(ctx.card_width, ctx.card_height))
+  draw = ImageDraw.Draw(im)
+  if has_mana_icon:
+    icons.draw_cost_icon(im, draw, ctx.mana_coord, ctx.icon_height,
+                         ctx.icon_width, MANA_ICON_TEXT, ctx.icon_font,
+                         ICON_FONT_COLOR, primary_element, secondary_element)
+  card_art.render_boarder(im, draw, primary_element, secondary_element,
+                          ctx.card_bb, ctx)
+  return TemplateLayer(im)
+
+
+def get_panel_layer(desc: util.CardDesc,
+                    ctx: render_context.RenderContext) -> TemplateLayer:
+  """The body text panel, under the attributes and body text."""
+  return _get_panel_layer(desc.card_type, ctx.pixels_per_inch)
+
+
+def get_frame_layer(desc: util.CardDesc,
+                    ctx: render_context.RenderContext) -> TemplateLayer:
+  """The border and the memory mana icon, over everything but the crop."""
+  return _get_frame_layer(desc.card_type == util.CardType.MEMORY,
+                          desc.primary_element, desc.secondary_element,
+                          ctx.pixels_per_inch)
@@ -0,0 +1,62 @@
+# Shares one render between identical requests that arrive at the same time.
+#
+# When several people open the same deck preview, the render server receives
+# the same cards from each of them at once. The first request for a key does
+# the work, and requests for that key that arrive before it finishes wait for
+# and return its result, or its error. Nothing is kept once the work is done.
+
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class Coalescer():
+  """Runs each key at most once at a time and counts the shared calls."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._in_flight: Dict[Hashable, concurrent.futures.Future] = {}
+    self.num_calls = 0
+    self.num_runs = 0
+    self.num_coalesced = 0
+    self.num_failed = 0
+
+  def run(self, key: Hashable, function: Callable[[], Any]) -> Any:
+    """Calls function, unless a call for key is already running to share."""
+    with self._lock:
+      self.num_calls += 1
+      future = self._in_flight.get(key)
+      is_leader = future is None
+      if is_leader:
+        future = concurrent.futures.Future()
+        self._in_flight[key] = future
+        self.num_runs += 1
+      else:
+        self.num_coalesced += 1
+    if not is_leader:
+      return future.result()
+    try:
+      result = function()
+      future.set_result(result)
+      return result
+    except BaseException as e:
+      # Waiters are released on any exit, e.g. KeyboardInterrupt or SystemExit
+      # in the leader, which they see as an error of the shared call.
+      with self._lock:
+        self.num_failed += 1
+      future.set_exception(e if isinstance(e, Exception) else RuntimeError(
+          f"The shared call was interrupted: {e!r}"))
+      raise
+    finally:
+      with self._lock:
+        del self._in_flight[key]
+
+  def get_stats(self) -> Dict[str, int]:
+    with self._lock:
+      return {
+          "requests": self.num_calls,
+          "renders": self.num_runs,
+          "coalesced": self.num_coalesced,
+          "failed": self.num_failed,
+          "in_flight": len(self._in_flight),
+      }
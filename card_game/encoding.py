@@ -0,0 +1,187 @@
+# Output profiles control how rendered cards are encoded and written.
+
+import concurrent.futures
+import dataclasses
+import io
+import pathlib
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from . import colors
+
+#pylint: disable=too-many-instance-attributes
+
+# Threads that encode and write cards while the next ones render. Pillow
+# releases the GIL while compressing, so they run alongside the renderer.
+WRITE_THREADS = 2
+
+
+@dataclasses.dataclass(frozen=True)
+class OutputProfile:
+  name: str
+  image_format: str
+  suffix: str
+  save_kwargs: Dict[str, Any] = dataclasses.field(default_factory=dict)
+  # If set, alpha is dropped by compositing the card onto this color.
+  flatten_color: Optional[colors.Color] = None
+  # If set, the card is quantized to a palette of this many colors.
+  palette_colors: Optional[int] = None
+
+  def prepare(self, im: Image) -> Image:
+    """Applies the lossy steps of this profile ahead of encoding."""
+    if self.flatten_color is not None:
+      flat = Image.new("RGB", im.size, color=self.flatten_color)
+      flat.paste(im, (0, 0), im if im.mode == "RGBA" else None)
+      im = flat
+    if self.palette_colors is not None:
+      im = im.quantize(colors=self.palette_colors, method=Image.FASTOCTREE)
+    return im
+
+
+PROFILES = {
+    profile.name: profile for profile in [
+        # What Pillow does by default.
+        OutputProfile("png", "PNG", ".png"),
+        # Quick to write, large files. For iterating on designs.
+        OutputProfile("fast_png", "PNG", ".png", {"compress_level": 1}),
+        # Slow to write, smallest lossless png. For uploads.
+        OutputProfile("optimized_png", "PNG", ".png", {"optimize": True}),
+        # Much smaller, but colors are reduced to a palette.
+        OutputProfile("palette_png",
+                      "PNG",
+                      ".png", {"optimize": True},
+                      palette_colors=256),
+        OutputProfile("lossless_webp", "WEBP", ".webp", {
+            "lossless": True,
+            "method": 4
+        }),
+        # For outputs where the rounded corners don't matter, such as print.
+        OutputProfile("rgb_png", "PNG", ".png", flatten_color=colors.WHITE),
+    ]
+}
+
+
+class EncodeStats():
+  """Tracks the time spent encoding and the size written per profile."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.num_images = {}
+    self.seconds = {}
+    self.num_bytes = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_lock"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def merge(self, other: "EncodeStats"):
+    """Adds the encodes of a worker process."""
+    with self._lock:
+      for totals, other_totals in [(self.num_images, other.num_images),
+                                   (self.seconds, other.seconds),
+                                   (self.num_bytes, other.num_bytes)]:
+        for name, total in other_totals.items():
+          totals[name] = totals.get(name, 0) + total
+
+  def reset(self):
+    with self._lock:
+      self.num_images = {}
+      self.seconds = {}
+      self.num_bytes = {}
+
+  def record(self, profile: OutputProfile, seconds: float, num_bytes: int):
+    with self._lock:
+      self.num_images[profile.name] = self.num_images.get(profile.name, 0) + 1
+      self.seconds[profile.name] = self.seconds.get(profile.name, 0) + seconds
+      self.num_bytes[profile.name] = (self.num_bytes.get(profile.name, 0) +
+                                      num_bytes)
+
+  def report(self):
+    with self._lock:
+      for name, num_images in sorted(self.num_images.items()):
+        print(f"Encoded {num_images} images as {name}: "
+              f"{self.seconds[name] / num_images * 1000:.1f} ms/image, "
+              f"{self.num_bytes[name] / num_images / 1024:.1f} KiB/image")
+
+
+# Collects every encode in this process.
+STATS = EncodeStats()
+
+
+def encode_image(im: Image, profile: OutputProfile) -> bytes:
+  start = time.perf_counter()
+  buffer = io.BytesIO()
+  profile.prepare(im).save(buffer,
+                           format=profile.image_format,
+                           **profile.save_kwargs)
+  data = buffer.getvalue()
+  STATS.record(profile, time.perf_counter() - start, len(data))
+  return data
+
+
+def save_image(im: Image, output_path: pathlib.Path, profile: OutputProfile):
+  output_path.write_bytes(encode_image(im, profile))
+
+
+class ImageWriter():
+  """Encodes and writes images on background threads.
+
+  At most max_pending images wait or encode at once, so submit blocks while the
+  renderer is that far ahead of the writes, which bounds the memory they hold.
+  wait is the barrier that raises the first error of the submitted images.
+  """
+
+  def __init__(self,
+               num_threads: int = WRITE_THREADS,
+               max_pending: Optional[int] = None):
+    assert num_threads > 0, "Must write with at least one thread."
+    self._executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_threads, thread_name_prefix="image_writer")
+    self._slots = threading.BoundedSemaphore(
+        2 * num_threads if max_pending is None else max_pending)
+    self._futures: List[concurrent.futures.Future] = []
+
+  def submit(self, im: Image, output_path: pathlib.Path,
+             profile: OutputProfile) -> concurrent.futures.Future:
+    # Released once the image is written, on the writer thread.
+    self._slots.acquire()  #pylint: disable=consider-using-with
+    try:
+      future = self._executor.submit(save_image, im, output_path, profile)
+    except BaseException:
+      self._slots.release()
+      raise
+    future.add_done_callback(lambda _: self._slots.release())
+    self._futures.append(future)
+    return future
+
+  def wait(self):
+    """Waits for every submitted image, raising the first error."""
+    futures, self._futures = self._futures, []
+    concurrent.futures.wait(futures)
+    errors = [future.exception() for future in futures]
+    errors = [error for error in errors if error is not None]
+    if errors:
+      print(f"Failed to write {len(errors)} of {len(futures)} images.")
+      raise errors[0]
+
+  def close(self):
+    """Finishes the submitted images. Their errors stay with their futures."""
+    self._executor.shutdown()
+
+  def __enter__(self) -> "ImageWriter":
+    return self
+
+  def __exit__(self, exc_type, *exc_info):
+    try:
+      if exc_type is None:
+        self.wait()
+    finally:
+      self.close()
@@ -0,0 +1,244 @@
+# Golden image checks, so that renderer rewrites can not silently change pixels.
+#
+# Renders a fixed corpus, built from the sample cards in every element and
+# alongside every secondary element, and compares each card to a reference
+# checked in under resources/golden. A card without a reference fails, so a
+# fresh checkout can not pass by writing its own. Failures get a diff image of
+# the reference, the new render and the changed pixels side by side. Run from
+# the project root, for instance:
+#   python -m card_game.golden
+#   python -m card_game.golden --update   # Only for intended pixel changes.
+#   python -m card_game.golden --check_determinism
+
+import argparse
+import concurrent.futures
+import dataclasses
+import os
+import pathlib
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from . import __main__ as card_game_main
+from . import encoding, render_context, util
+
+#pylint: disable=too-many-arguments
+
+GOLDEN_DIR = util.RESOURCE_DIR.joinpath("golden")
+# Low enough for hundreds of cards to take seconds, high enough for text to
+# be legible in the diffs.
+GOLDEN_PIXELS_PER_INCH = 100
+# Changed pixels are drawn in this color in the diff image.
+DIFF_COLOR = (255, 0, 255, 255)
+
+
+def get_corpus() -> List[util.CardDesc]:
+  """Every sample card in each element, alone and with the next element."""
+  corpus = []
+  elements = list(util.Element)
+  for desc in util.load_card_descs(util.SAMPLE_CARDS_PATH):
+    for idx, primary in enumerate(elements):
+      # Every element is paired once as the secondary, which keeps the checked
+      # in references small.
+      for secondary in [None, elements[(idx + 1) % len(elements)]]:
+        # The title seeds the card art, so it stays unique per variant.
+        name = primary.name if secondary is None else (
+            f"{primary.name}/{secondary.name}")
+        corpus.append(
+            dataclasses.replace(desc,
+                                title=f"{desc.title} {name}",
+                                primary_element=primary,
+                                secondary_element=secondary))
+  return corpus
+
+
+def _get_reference_path(reference_dir: pathlib.Path,
+                        desc: util.CardDesc) -> pathlib.Path:
+  return reference_dir.joinpath(f"{desc.hash_all()}.png")
+
+
+@dataclasses.dataclass
+class GoldenResult:
+  title: str
+  # None if there is no reference yet.
+  max_diff: Optional[int] = None
+  num_diff_pixels: int = 0
+  num_pixels: int = 0
+  diff_path: Optional[pathlib.Path] = None
+
+  @property
+  def passed(self) -> bool:
+    return self.max_diff is not None and self.diff_path is None
+
+
+def _save_diff(reference: np.ndarray, actual: np.ndarray, changed: np.ndarray,
+               diff_path: pathlib.Path):
+  # Faded reference, with the changed pixels highlighted.
+  highlight = (reference // 4 + 191).astype(np.uint8)
+  highlight[changed] = DIFF_COLOR
+  diff_path.parent.mkdir(parents=True, exist_ok=True)
+  Image.fromarray(np.concatenate([reference, actual, highlight],
+                                 axis=1)).save(diff_path)
+
+
+def compare_images(reference: Image, actual: Image, tolerance: int,
+                   max_diff_fraction: float, diff_path: pathlib.Path,
+                   title: str) -> GoldenResult:
+  """Passes if few enough channels differ by more than tolerance."""
+  reference = np.asarray(reference.convert("RGBA"))
+  actual = np.asarray(actual.convert("RGBA"))
+  result = GoldenResult(title,
+                        num_pixels=reference.shape[0] * reference.shape[1])
+  if reference.shape != actual.shape:
+    result.max_diff = 255
+    result.num_diff_pixels = result.num_pixels
+    result.diff_path = diff_path
+    diff_path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(actual).save(diff_path)
+    return result
+  abs_diff = np.abs(reference.astype(np.int16) - actual.astype(np.int16))
+  changed = (abs_diff > tolerance).any(axis=2)
+  result.max_diff = int(abs_diff.max())
+  result.num_diff_pixels = int(changed.sum())
+  if result.num_diff_pixels > max_diff_fraction * result.num_pixels:
+    result.diff_path = diff_path
+    _save_diff(reference, actual, changed, diff_path)
+  return result
+
+
+def _check_card(desc: util.CardDesc, pixels_per_inch: int,
+                reference_dir: pathlib.Path, diff_dir: pathlib.Path,
+                tolerance: int, max_diff_fraction: float,
+                update: bool) -> GoldenResult:
+  """Renders and checks one card. Runs in a worker process."""
+  ctx = render_context.get_render_context(pixels_per_inch)
+  actual = card_game_main.render_card_image(desc, ctx)
+  reference_path = _get_reference_path(reference_dir, desc)
+  if update:
+    encoding.save_image(actual, reference_path, encoding.PROFILES["png"])
+    return GoldenResult(desc.title, max_diff=0)
+  if not reference_path.is_file():
+    return GoldenResult(desc.title)
+  with Image.open(reference_path) as reference:
+    return compare_images(reference, actual, tolerance, max_diff_fraction,
+                          diff_dir.joinpath(reference_path.name), desc.title)
+
+
+def run_golden(cards: List[util.CardDesc], pixels_per_inch: int,
+               reference_dir: pathlib.Path, diff_dir: pathlib.Path,
+               tolerance: int, max_diff_fraction: float, update: bool,
+               jobs: int) -> List[GoldenResult]:
+  """Checks, or with update rewrites, every reference over `jobs` processes."""
+  reference_dir.mkdir(parents=True, exist_ok=True)
+  start = time.perf_counter()
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+    futures = [
+        executor.submit(_check_card, desc, pixels_per_inch, reference_dir,
+                        diff_dir, tolerance, max_diff_fraction, update)
+        for desc in cards
+    ]
+    results = [future.result() for future in futures]
+  seconds = time.perf_counter() - start
+  if update:
+    print(f"Wrote {len(results)} references to {reference_dir} in "
+          f"{seconds:.1f}s.")
+    return results
+  for result in results:
+    if result.max_diff is None:
+      print(f"MISSING {result.title}: no reference, add one with --update")
+    elif not result.passed:
+      print(f"FAILED {result.title}: {result.num_diff_pixels} of "
+            f"{result.num_pixels} pixels differ, by up to {result.max_diff}. "
+            f"See {result.diff_path}")
+  num_passed = sum(result.passed for result in results)
+  print(f"{num_passed} of {len(results)} cards match the references in "
+        f"{reference_dir}, checked in {seconds:.1f}s over {jobs} processes.")
+  return results
+
+
+def _render_bytes(desc: util.CardDesc, pixels_per_inch: int) -> bytes:
+  ctx = render_context.get_render_context(pixels_per_inch)
+  return encoding.encode_image(card_game_main.render_card_image(desc, ctx),
+                               encoding.PROFILES["png"])
+
+
+def check_determinism(cards: List[util.CardDesc], pixels_per_inch: int,
+                      jobs: int) -> List[str]:
+  """Returns the cards whose bytes differ between serial and parallel renders.
+
+  Each card is rendered serially, over threads and over processes.
+  """
+  runs: Dict[str, Callable[[], List[bytes]]] = {
+      "serial":
+          lambda: [_render_bytes(desc, pixels_per_inch) for desc in cards],
+  }
+  for name, executor_type in [
+      ("threads", concurrent.futures.ThreadPoolExecutor),
+      ("processes", concurrent.futures.ProcessPoolExecutor)
+  ]:
+
+    def _run(executor_type=executor_type) -> List[bytes]:
+      with executor_type(max_workers=jobs) as executor:
+        return list(
+            executor.map(_render_bytes, cards, [pixels_per_inch] * len(cards)))
+
+    runs[name] = _run
+
+  outputs = {}
+  for name, run in runs.items():
+    start = time.perf_counter()
+    outputs[name] = run()
+    print(f"Rendered {len(cards)} cards with {name} in "
+          f"{time.perf_counter() - start:.1f}s.")
+  mismatches = [
+      desc.title
+      for idx, desc in enumerate(cards)
+      if len({output[idx] for output in outputs.values()}) != 1
+  ]
+  for title in mismatches:
+    print(f"NOT DETERMINISTIC {title}")
+  print(f"{len(cards) - len(mismatches)} of {len(cards)} cards render "
+        f"identically serially, over {jobs} threads and over {jobs} processes.")
+  return mismatches
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  # Overwrite the references with the current renders. Missing references
+  # fail without it.
+  parser.add_argument("--update", action="store_true")
+  parser.add_argument("--check_determinism", action="store_true")
+  parser.add_argument("--pixels_per_inch",
+                      type=int,
+                      default=GOLDEN_PIXELS_PER_INCH)
+  parser.add_argument("--reference_dir", type=pathlib.Path, default=None)
+  parser.add_argument("--diff_dir",
+                      type=pathlib.Path,
+                      default=pathlib.Path("./golden_diffs"))
+  # Largest difference of a color channel that still counts as unchanged.
+  parser.add_argument("--tolerance", type=int, default=0)
+  # Fraction of the pixels of a card that may change before it fails.
+  parser.add_argument("--max_diff_fraction", type=float, default=0)
+  parser.add_argument("--jobs", type=int, default=os.cpu_count())
+  args = parser.parse_args()
+  assert args.jobs > 0, "Must render with at least one job."
+
+  cards = get_corpus()
+  if args.check_determinism:
+    mismatches = check_determinism(cards, args.pixels_per_inch, args.jobs)
+    assert len(mismatches) == 0, "Rendering is not deterministic."
+    return
+
+  reference_dir = (GOLDEN_DIR.joinpath(f"{args.pixels_per_inch}ppi")
+                   if args.reference_dir is None else args.reference_dir)
+  results = run_golden(cards, args.pixels_per_inch, reference_dir,
+                       args.diff_dir, args.tolerance, args.max_diff_fraction,
+                       args.update, args.jobs)
+  assert all(result.passed for result in results), \
+    "Cards differ from the golden references."
+
+
+if __name__ == "__main__":
+  main()
@@ -1,4 +1,3 @@
-import pathlib
 from typing import Any, List, Optional
 
 from google.auth.transport.requests import Request
@@ -12,8 +11,7 @@ CARD_RANGE = "All!1:1000"
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 
-LOCAL_PATH = pathlib.Path.home().joinpath(".local").joinpath("share").joinpath(
-    "card_game")
+LOCAL_PATH = util.LOCAL_PATH
 LOCAL_PATH.mkdir(parents=True, exist_ok=True)
 
 TOKEN_CACHE_PATH = LOCAL_PATH.joinpath("token.json")
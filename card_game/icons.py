@@ -1,13 +1,119 @@
 # This  module produces icons.
 
+import functools
+import hashlib
+import io
+import os
+import pathlib
+import tempfile
 from typing import Optional
 
 from PIL import Image, ImageDraw, ImageFont
 
-from . import colors, util
+from . import colors, text_cache, util
+
+try:
+  import cairosvg
+except (ImportError, OSError):
+  # cairosvg needs the system cairo library. Without it, we fall back to
+  # resampling the png version of each icon.
+  cairosvg = None
 
 #pylint: disable=too-many-arguments
 #pylint: disable=too-many-locals
+#pylint: disable=global-statement
+
+# Rasterized icons are stored here, so that later runs and worker processes can
+# load a bitmap at the right size instead of resampling the source.
+ICON_CACHE_DIR = util.LOCAL_PATH.joinpath("icon_cache")
+# Icons kept loaded, over every name, size and resolution.
+ICON_CACHE_SIZE = 256
+
+# Whether the fallback to png icons was reported, once per process.
+_WARNED_PNG_FALLBACK = False
+
+
+def _warn_png_fallback():
+  global _WARNED_PNG_FALLBACK
+  if not _WARNED_PNG_FALLBACK:
+    _WARNED_PNG_FALLBACK = True
+    print("Warning: cairosvg or the cairo library is missing, so icons are "
+          "resampled from their png versions instead of rasterized from svg.")
+
+
+def _get_source_path(name: str) -> pathlib.Path:
+  svg_path = util.ICON_DIR.joinpath(f"{name}.svg")
+  if svg_path.is_file():
+    if cairosvg is not None:
+      return svg_path
+    _warn_png_fallback()
+  png_path = util.ICON_DIR.joinpath(f"{name}.png")
+  assert png_path.is_file(), str(png_path)
+  return png_path
+
+
+def _rasterize(source_path: pathlib.Path, width: int, height: int) -> bytes:
+  """Returns png bytes of the source icon at exactly width x height."""
+  if source_path.suffix == ".svg":
+    return cairosvg.svg2png(url=str(source_path),
+                            output_width=width,
+                            output_height=height)
+  icon = Image.open(source_path).convert("RGBA").resize((width, height),
+                                                        Image.LANCZOS)
+  buffer = io.BytesIO()
+  icon.save(buffer, format="PNG")
+  return buffer.getvalue()
+
+
+def _get_cache_path(source_path: pathlib.Path, width: int,
+                    height: int) -> pathlib.Path:
+  # The key covers the source contents, so editing an icon invalidates it.
+  digest = hashlib.md5(source_path.read_bytes()).hexdigest()[:12]
+  kind = source_path.suffix[1:]
+  return ICON_CACHE_DIR.joinpath(
+      f"{source_path.stem}_{kind}_{width}x{height}_{digest}.png")
+
+
+@functools.lru_cache(maxsize=ICON_CACHE_SIZE)
+def load_icon(name: str, width: int, height: int) -> Image:
+  """Loads icons/{name} rasterized at width x height.
+
+  The result is shared between callers and must not be modified.
+  """
+  source_path = _get_source_path(name)
+  cache_path = _get_cache_path(source_path, width, height)
+  if not cache_path.is_file():
+    ICON_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so that concurrent workers never see a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=ICON_CACHE_DIR, suffix=".tmp")
+    try:
+      with os.fdopen(fd, "wb") as tmp_file:
+        tmp_file.write(_rasterize(source_path, width, height))
+      os.replace(tmp_path, cache_path)
+    finally:
+      # Only left behind if writing or renaming failed.
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+  icon = Image.open(cache_path).convert("RGBA")
+  assert icon.size == (width, height), f"Bad cached icon: {cache_path}"
+  return icon
+
+
+@functools.lru_cache(maxsize=ICON_CACHE_SIZE)
+def _get_secondary_half_circle(side: int, element: util.Element) -> Image:
+  """The bottom/right half of a dual-element cost icon.
+
+  The result is shared between callers and must not be modified.
+  """
+  secondary_im = Image.new("RGBA", (side, side), color=element.get_color())
+  secondary_mask = Image.new("L", (side, side))
+  secondary_mask_draw = ImageDraw.Draw(secondary_mask)
+  # Fill in the center
+  secondary_mask_draw.ellipse([0, 0, side, side], fill=255)
+  # Delete the top/left
+  secondary_mask_draw.polygon([(0, 0), (side, 0), (0, side)], fill=0)
+  secondary_im.putalpha(secondary_mask)
+  return secondary_im
 
 
 def draw_cost_icon(im: Image,
@@ -24,21 +130,9 @@ def draw_cost_icon(im: Image,
   icon_bb = util.get_centered_bb(center, side, side)
   draw.ellipse(icon_bb, fill=primary_element.get_color())
   if secondary_element is not None:
-    secondary_im = Image.new("RGBA", (side, side),
-                             color=secondary_element.get_color())
-    secondary_mask = Image.new("L", (side, side))
-    secondary_mask_draw = ImageDraw.Draw(secondary_mask)
-    # Fill in the center
-    secondary_mask_draw.ellipse([0, 0, side, side], fill=255)
-    # Delete the top/left
-    secondary_mask_draw.polygon([(0, 0), (side, 0), (0, side)], fill=0)
-    secondary_im.putalpha(secondary_mask)
+    secondary_im = _get_secondary_half_circle(side, secondary_element)
     im.paste(secondary_im, icon_bb, secondary_im)
-  draw.text(center, text, font_color, anchor="mm", font=font)
-
-
-STRENGTH_ICON_IMG = Image.open(
-    util.ICON_DIR.joinpath("strength.png")).convert("RGBA")
+  text_cache.draw_text(draw, center, text, font_color, anchor="mm", font=font)
 
 
 def draw_strength_with_text(im: Image, draw: ImageDraw.Draw, center: util.Coord,
@@ -46,31 +140,24 @@ def draw_strength_with_text(im: Image, draw: ImageDraw.Draw, center: util.Coord,
                             font: ImageFont.ImageFont,
                             font_color: colors.Color):
   bb = util.get_centered_bb(center, icon_width, icon_height)
-  icon_img = STRENGTH_ICON_IMG.resize([icon_width, icon_height])
+  icon_img = load_icon("strength", icon_width, icon_height)
   im.paste(icon_img, bb, icon_img)
-  draw.text(center, text, font_color, anchor="mm", font=font)
-
-
-TARGET_ICON_IMG = Image.open(
-    util.ICON_DIR.joinpath("target.png")).convert("RGBA")
+  text_cache.draw_text(draw, center, text, font_color, anchor="mm", font=font)
 
 
 def draw_target_with_text(im: Image, draw: ImageDraw.Draw, center: util.Coord,
                           icon_width: int, icon_height: int, text: str,
                           font: ImageFont.ImageFont, font_color: colors.Color):
   bb = util.get_centered_bb(center, icon_width, icon_height)
-  icon_img = TARGET_ICON_IMG.resize([icon_width, icon_height])
+  icon_img = load_icon("target", icon_width, icon_height)
   im.paste(icon_img, bb, icon_img)
-  draw.text(center, text, font_color, anchor="mm", font=font)
-
-
-HEART_ICON_IMG = Image.open(util.ICON_DIR.joinpath("heart.png")).convert("RGBA")
+  text_cache.draw_text(draw, center, text, font_color, anchor="mm", font=font)
 
 
 def draw_heart_with_text(im: Image, draw: ImageDraw.Draw, center: util.Coord,
                          icon_width: int, icon_height: int, text: str,
                          font: ImageFont.ImageFont, font_color: colors.Color):
   bb = util.get_centered_bb(center, icon_width, icon_height)
-  icon_img = HEART_ICON_IMG.resize([icon_width, icon_height])
+  icon_img = load_icon("heart", icon_width, icon_height)
   im.paste(icon_img, bb, icon_img)
-  draw.text(center, text, font_color, anchor="mm", font=font)
+  text_cache.draw_text(draw, center, text, font_color, anchor="mm", font=font)
@@ -0,0 +1,92 @@
+# Tests rasterizing icons and their disk cache.
+#
+# Run from the project root, with either runner:
+#   python -m unittest card_game.icons_test
+#   python -m pytest card_game/icons_test.py
+
+import contextlib
+import io
+import pathlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from card_game import icons, util
+
+#pylint: disable=protected-access
+
+ICON_NAME = "any_action"
+WIDTH = 37
+HEIGHT = 29
+
+
+def _open_png(data: bytes) -> Image:
+  with Image.open(io.BytesIO(data)) as im:
+    im.load()
+    return im
+
+
+class IconsTest(unittest.TestCase):
+
+  def setUp(self):
+    cache_dir = pathlib.Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, cache_dir)
+    patcher = mock.patch.object(icons, "ICON_CACHE_DIR", cache_dir)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.cache_dir = cache_dir
+    icons.load_icon.cache_clear()
+    self.addCleanup(icons.load_icon.cache_clear)
+
+  def test_rasterize_png(self):
+    data = icons._rasterize(util.ICON_DIR.joinpath(f"{ICON_NAME}.png"), WIDTH,
+                            HEIGHT)
+    self.assertEqual(_open_png(data).size, (WIDTH, HEIGHT))
+
+  @unittest.skipIf(icons.cairosvg is None, "cairosvg can't be imported.")
+  def test_rasterize_svg(self):
+    data = icons._rasterize(util.ICON_DIR.joinpath(f"{ICON_NAME}.svg"), WIDTH,
+                            HEIGHT)
+    self.assertEqual(_open_png(data).size, (WIDTH, HEIGHT))
+
+  @unittest.skipIf(icons.cairosvg is None, "cairosvg can't be imported.")
+  def test_uses_svg_source(self):
+    self.assertEqual(icons._get_source_path(ICON_NAME).suffix, ".svg")
+
+  def test_cache_hit(self):
+    icon = icons.load_icon(ICON_NAME, WIDTH, HEIGHT)
+    self.assertEqual(icon.size, (WIDTH, HEIGHT))
+    cached_paths = list(self.cache_dir.iterdir())
+    self.assertEqual(len(cached_paths), 1)
+    self.assertEqual(cached_paths[0].suffix, ".png")
+    # A new process, or an evicted icon, loads the bitmap from disk.
+    icons.load_icon.cache_clear()
+    with mock.patch.object(icons,
+                           "_rasterize",
+                           side_effect=AssertionError("Not cached")):
+      cached_icon = icons.load_icon(ICON_NAME, WIDTH, HEIGHT)
+    self.assertEqual(cached_icon.tobytes(), icon.tobytes())
+
+  def test_failed_rasterize_leaves_no_file(self):
+    with mock.patch.object(icons, "_rasterize", side_effect=OSError("Broken")):
+      with self.assertRaises(OSError):
+        icons.load_icon(ICON_NAME, WIDTH, HEIGHT)
+    self.assertEqual(list(self.cache_dir.iterdir()), [])
+
+  def test_png_fallback_warns_once(self):
+    output = io.StringIO()
+    with mock.patch.object(icons, "cairosvg", None), \
+        mock.patch.object(icons, "_WARNED_PNG_FALLBACK", False), \
+        contextlib.redirect_stdout(output):
+      paths = [icons._get_source_path(ICON_NAME) for _ in range(2)]
+      icon = icons.load_icon(ICON_NAME, WIDTH, HEIGHT)
+    self.assertEqual([path.suffix for path in paths], [".png", ".png"])
+    self.assertEqual(output.getvalue().count("Warning: cairosvg"), 1)
+    self.assertEqual(icon.size, (WIDTH, HEIGHT))
+
+
+if __name__ == "__main__":
+  unittest.main()
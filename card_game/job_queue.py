@@ -0,0 +1,134 @@
+# Records every render task of the bulk render modes, so builds can resume.
+#
+# Each task is keyed by the image it writes and remembers the hash of its card,
+# its status, how often it was attempted, its last error and how long it took.
+# A rerun skips tasks that are done and whose image still exists, runs pending
+# ones, including those interrupted mid-render, and retries failed ones until
+# they reach the attempt limit. Editing a card starts its task over. An image
+# without a task, e.g. from before the queue existed, is taken to be done.
+
+import collections
+import pathlib
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import util
+
+JOB_QUEUE_PATH = util.LOCAL_PATH.joinpath("render_jobs.sqlite")
+# Attempts of a task, over all runs, before it is left as failed.
+MAX_ATTEMPTS = 3
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  key TEXT PRIMARY KEY,
+  card_hash TEXT NOT NULL,
+  title TEXT NOT NULL,
+  status TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  error TEXT,
+  seconds REAL,
+  updated REAL NOT NULL
+)
+"""
+
+
+class JobQueue():
+  """The render tasks of every build, in a SQLite database.
+
+  Only used from one thread, which hands the tasks to the render workers.
+  """
+
+  def __init__(self,
+               path: pathlib.Path = JOB_QUEUE_PATH,
+               max_attempts: int = MAX_ATTEMPTS):
+    assert max_attempts > 0, "Tasks must be attempted at least once."
+    self.path = path
+    self.max_attempts = max_attempts
+    path.parent.mkdir(parents=True, exist_ok=True)
+    self._connection = sqlite3.connect(path)
+    with self._connection:
+      self._connection.execute("PRAGMA journal_mode=WAL")
+      self._connection.execute(_SCHEMA)
+      # Tasks of a run that died mid-render, e.g. from Ctrl+C or OOM.
+      num_interrupted = self._connection.execute(
+          "UPDATE jobs SET status = ?, error = ?, updated = ? "
+          "WHERE status = ?",
+          (STATUS_PENDING, "Interrupted", time.time(), STATUS_RUNNING)).rowcount
+    if num_interrupted > 0:
+      print(f"Resuming {num_interrupted} interrupted render tasks.")
+
+  def _set(self, key: str, **columns):
+    columns["updated"] = time.time()
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    with self._connection:
+      self._connection.execute(f"UPDATE jobs SET {assignments} WHERE key = ?",
+                               (*columns.values(), key))
+
+  def get_status(self, key: str) -> Optional[str]:
+    row = self._connection.execute("SELECT status FROM jobs WHERE key = ?",
+                                   (key,)).fetchone()
+    return None if row is None else row[0]
+
+  def add(self, key: str, card_hash: str, title: str,
+          output_exists: bool) -> bool:
+    """Records the task if needed, and returns whether it should run now."""
+    row = self._connection.execute(
+        "SELECT card_hash, status, attempts FROM jobs WHERE key = ?",
+        (key,)).fetchone()
+    if row is None or row[0] != card_hash:
+      # Images the queue has no record of are kept, as they were before it.
+      seeded = row is None and output_exists
+      with self._connection:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO jobs (key, card_hash, title, status, "
+            "updated) VALUES (?, ?, ?, ?, ?)",
+            (key, card_hash, title, STATUS_DONE if seeded else STATUS_PENDING,
+             time.time()))
+      return not seeded
+    _, status, attempts = row
+    if status == STATUS_DONE:
+      if output_exists:
+        return False
+      # The image was deleted since, so the task is pending again.
+      self._set(key, status=STATUS_PENDING, attempts=0)
+      return True
+    return status == STATUS_PENDING or attempts < self.max_attempts
+
+  def start(self, key: str):
+    with self._connection:
+      self._connection.execute(
+          "UPDATE jobs SET status = ?, attempts = attempts + 1, updated = ? "
+          "WHERE key = ?", (STATUS_RUNNING, time.time(), key))
+
+  def finish(self, key: str, seconds: float):
+    self._set(key, status=STATUS_DONE, error=None, seconds=seconds)
+
+  def fail(self, key: str, error: str, seconds: float):
+    self._set(key, status=STATUS_FAILED, error=error, seconds=seconds)
+
+  def get_tally(self, keys: List[str]) -> Dict[str, int]:
+    """Number of these tasks in each status."""
+    tally = collections.Counter()
+    for key in keys:
+      tally[self.get_status(key)] += 1
+    return tally
+
+  def get_failures(self, keys: List[str]) -> List[Tuple[str, int, str]]:
+    """(title, attempts, error) of the failed tasks among keys."""
+    failures = []
+    for key in keys:
+      row = self._connection.execute(
+          "SELECT title, attempts, error FROM jobs WHERE key = ? AND "
+          "status = ?", (key, STATUS_FAILED)).fetchone()
+      if row is not None:
+        failures.append(row)
+    return failures
+
+  def close(self):
+    self._connection.close()
@@ -0,0 +1,100 @@
+# Tests resuming, retrying and invalidating render tasks.
+#
+# Run from the project root, with either runner:
+#   python -m unittest card_game.job_queue_test
+#   python -m pytest card_game/job_queue_test.py
+
+import contextlib
+import io
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from card_game import job_queue
+
+KEY = "cards/fireball.png"
+CARD_HASH = "0123abcd"
+TITLE = "Fireball"
+MAX_ATTEMPTS = 2
+
+
+class JobQueueTest(unittest.TestCase):
+
+  def setUp(self):
+    temp_dir = pathlib.Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, temp_dir)
+    self.path = temp_dir.joinpath("render_jobs.sqlite")
+
+  def _open(self) -> job_queue.JobQueue:
+    with contextlib.redirect_stdout(io.StringIO()):
+      queue = job_queue.JobQueue(self.path, max_attempts=MAX_ATTEMPTS)
+    self.addCleanup(queue.close)
+    return queue
+
+  def test_new_task_runs(self):
+    queue = self._open()
+    self.assertTrue(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_PENDING)
+
+  def test_existing_output_is_seeded_as_done(self):
+    queue = self._open()
+    self.assertFalse(queue.add(KEY, CARD_HASH, TITLE, output_exists=True))
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_DONE)
+
+  def test_interrupted_task_is_pending(self):
+    queue = self._open()
+    queue.add(KEY, CARD_HASH, TITLE, output_exists=False)
+    queue.start(KEY)
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_RUNNING)
+    # The run dies mid-render, without finishing the task.
+    queue.close()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+      queue = job_queue.JobQueue(self.path, max_attempts=MAX_ATTEMPTS)
+    self.addCleanup(queue.close)
+    self.assertIn("Resuming 1 interrupted", output.getvalue())
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_PENDING)
+    self.assertTrue(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+
+  def test_failed_task_is_retried_until_the_limit(self):
+    queue = self._open()
+    for _ in range(MAX_ATTEMPTS):
+      # Below the limit, a failed task is retried.
+      self.assertTrue(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+      queue.start(KEY)
+      queue.fail(KEY, "Broken", 0.1)
+    self.assertFalse(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_FAILED)
+    self.assertEqual(queue.get_failures([KEY]),
+                     [(TITLE, MAX_ATTEMPTS, "Broken")])
+
+  def test_changed_hash_rerenders(self):
+    queue = self._open()
+    queue.add(KEY, CARD_HASH, TITLE, output_exists=False)
+    queue.start(KEY)
+    queue.finish(KEY, 0.1)
+    self.assertFalse(queue.add(KEY, CARD_HASH, TITLE, output_exists=True))
+    self.assertTrue(queue.add(KEY, "4567ef01", TITLE, output_exists=True))
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_PENDING)
+
+  def test_changed_hash_resets_failed_attempts(self):
+    queue = self._open()
+    for _ in range(MAX_ATTEMPTS):
+      queue.add(KEY, CARD_HASH, TITLE, output_exists=False)
+      queue.start(KEY)
+      queue.fail(KEY, "Broken", 0.1)
+    self.assertFalse(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+    self.assertTrue(queue.add(KEY, "4567ef01", TITLE, output_exists=False))
+
+  def test_deleted_output_rerenders(self):
+    queue = self._open()
+    queue.add(KEY, CARD_HASH, TITLE, output_exists=False)
+    queue.start(KEY)
+    queue.finish(KEY, 0.1)
+    self.assertTrue(queue.add(KEY, CARD_HASH, TITLE, output_exists=False))
+    self.assertEqual(queue.get_status(KEY), job_queue.STATUS_PENDING)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,219 @@
+# A small FTP server that stands in for the real image host.
+#
+# It speaks just enough of the protocol for upload.py: USER, PASS, TYPE, PASV,
+# STOR, NOOP and QUIT. Files are written to a local directory. It can also
+# add latency and drop connections, so that the upload pool can be exercised
+# without touching the real server. For instance:
+#   python -m card_game.local_ftp --root /tmp/ftp --port 2121
+
+import argparse
+import pathlib
+import socket
+import socketserver
+import threading
+import time
+from typing import Optional
+
+#pylint: disable=too-many-arguments
+#pylint: disable=too-many-instance-attributes
+
+DEFAULT_USER = "ftpuser"
+DEFAULT_PASSWORD = "ftppassword"
+
+
+class _FtpHandler(socketserver.StreamRequestHandler):
+  """Serves one control connection."""
+
+  def setup(self):
+    super().setup()
+    self._user = None
+    self._logged_in = False
+    self._data_listener = None
+    # Command -> handler of its argument, which returns whether to hang up.
+    self._commands = {
+        "USER": self._handle_user,
+        "PASS": self._handle_pass,
+        "QUIT": self._handle_quit,
+        "NOOP": self._handle_noop,
+    }
+    # Commands that need a login.
+    self._session_commands = {
+        "TYPE": self._handle_type,
+        "PASV": self._handle_pasv,
+        "STOR": self._handle_stor,
+    }
+
+  def _reply(self, line: str):
+    self.wfile.write(f"{line}\r\n".encode("utf-8"))
+    self.wfile.flush()
+
+  def _close_data_listener(self):
+    if self._data_listener is not None:
+      self._data_listener.close()
+      self._data_listener = None
+
+  def _handle_user(self, argument: str) -> bool:
+    self._user = argument
+    self._reply("331 Password required.")
+    return False
+
+  def _handle_pass(self, argument: str) -> bool:
+    self._logged_in = (self._user == self.server.user and
+                       argument == self.server.password)
+    self._reply("230 Logged in." if self._logged_in else "530 Login incorrect.")
+    return False
+
+  def _handle_quit(self, _: str) -> bool:
+    self._reply("221 Goodbye.")
+    return True
+
+  def _handle_noop(self, _: str) -> bool:
+    self._reply("200 OK.")
+    return False
+
+  def _handle_type(self, _: str) -> bool:
+    self._reply("200 Type set.")
+    return False
+
+  def _handle_pasv(self, _: str) -> bool:
+    self._close_data_listener()
+    self._data_listener = socket.create_server(("127.0.0.1", 0))
+    host, port = self._data_listener.getsockname()
+    address = ",".join(host.split(".") + [str(port >> 8), str(port & 255)])
+    self._reply(f"227 Entering Passive Mode ({address}).")
+    return False
+
+  def _handle_stor(self, argument: str) -> bool:
+    if self._data_listener is None:
+      self._reply("425 Use PASV first.")
+      return False
+    if self.server.should_drop():
+      # Simulates a session dying halfway through an upload.
+      return True
+    self._reply("150 Ready to receive.")
+    data_conn, _ = self._data_listener.accept()
+    self._close_data_listener()
+    with data_conn:
+      chunks = []
+      while True:
+        chunk = data_conn.recv(1 << 16)
+        if not chunk:
+          break
+        chunks.append(chunk)
+    if self.server.latency > 0:
+      time.sleep(self.server.latency)
+    self.server.store(pathlib.Path(argument).name, b"".join(chunks))
+    self._reply("226 Transfer complete.")
+    return False
+
+  def _handle_command(self, command: str, argument: str) -> bool:
+    if command in self._commands:
+      return self._commands[command](argument)
+    if command not in self._session_commands:
+      self._reply(f"502 {command} not implemented.")
+      return False
+    if not self._logged_in:
+      self._reply("530 Not logged in.")
+      return False
+    return self._session_commands[command](argument)
+
+  def handle(self):
+    self._reply("220 Local FTP stand-in ready.")
+    try:
+      for raw_line in self.rfile:
+        command, _, argument = raw_line.decode("utf-8").strip().partition(" ")
+        if self._handle_command(command.upper(), argument):
+          return
+    finally:
+      self._close_data_listener()
+
+
+class BackgroundServer(socketserver.BaseServer):
+  """A server that can serve from a thread for the length of a with block."""
+
+  _thread: Optional[threading.Thread] = None
+
+  def start(self):
+    """Serves from a background thread."""
+    self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+    if self._thread is not None:
+      self._thread.join()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *_):
+    self.stop()
+
+
+class LocalFtpServer(BackgroundServer, socketserver.ThreadingTCPServer):
+  """A threaded FTP server that stores uploads in root_dir.
+
+  latency: Seconds added to each STOR, roughly the round trips to a real host.
+  drop_every: If set, every nth STOR closes the control connection instead.
+  """
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self,
+               root_dir: pathlib.Path,
+               port: int = 0,
+               user: str = DEFAULT_USER,
+               password: str = DEFAULT_PASSWORD,
+               latency: float = 0,
+               drop_every: Optional[int] = None):
+    super().__init__(("127.0.0.1", port), _FtpHandler)
+    root_dir.mkdir(parents=True, exist_ok=True)
+    self.root_dir = root_dir
+    self.user = user
+    self.password = password
+    self.latency = latency
+    self.drop_every = drop_every
+    self.num_stored = 0
+    self.num_dropped = 0
+    self._num_stor = 0
+    self._lock = threading.Lock()
+
+  @property
+  def port(self) -> int:
+    return self.server_address[1]
+
+  def should_drop(self) -> bool:
+    with self._lock:
+      self._num_stor += 1
+      drop = (self.drop_every is not None and
+              self._num_stor % self.drop_every == 0)
+      if drop:
+        self.num_dropped += 1
+      return drop
+
+  def store(self, name: str, data: bytes):
+    self.root_dir.joinpath(name).write_bytes(data)
+    with self._lock:
+      self.num_stored += 1
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--root", type=pathlib.Path, required=True)
+  parser.add_argument("--port", type=int, default=2121)
+  parser.add_argument("--user", type=str, default=DEFAULT_USER)
+  parser.add_argument("--password", type=str, default=DEFAULT_PASSWORD)
+  parser.add_argument("--latency", type=float, default=0)
+  parser.add_argument("--drop_every", type=int, default=None)
+  args = parser.parse_args()
+  server = LocalFtpServer(args.root, args.port, args.user, args.password,
+                          args.latency, args.drop_every)
+  print(f"Serving {args.root} on ftp://127.0.0.1:{server.port}")
+  server.serve_forever()
+
+
+if __name__ == "__main__":
+  main()
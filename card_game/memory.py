@@ -0,0 +1,271 @@
+# Memory accounting for renders, and a budget that limits concurrency.
+#
+# Pillow allocates image buffers outside of Python, so tracemalloc only sees
+# Python and numpy allocations. Each stage therefore also reports how far the
+# resident set grew, using the Linux peak RSS counter. Both views are exact
+# when cards are rendered one at a time, and overlap between threads otherwise.
+#
+# tracemalloc can only restart its peak by clearing its traces, since Python
+# 3.8 has no reset_peak. Memory traced until then is carried over as an offset,
+# so a stage counts what it allocates, without the frees of older blocks.
+
+import contextlib
+import dataclasses
+import pathlib
+import resource
+import threading
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import render_context
+
+#pylint: disable=global-statement
+#pylint: disable=too-many-instance-attributes
+
+PROC_STATUS_PATH = pathlib.Path("/proc/self/status")
+PROC_CLEAR_REFS_PATH = pathlib.Path("/proc/self/clear_refs")
+# Full size RGBA images alive at once while rendering a card: the card, the art
+# layer, the border overlay, a mask and the cropped copy.
+FULL_SIZE_IMAGES_PER_CARD = 5
+NUM_REPORTED_ITEMS = 5
+MIB = 1024 * 1024
+
+# The accounting of this process, if one is running.
+_ACTIVE: Optional["MemoryStats"] = None
+# Memory traced before tracemalloc last cleared its traces.
+_TRACED_OFFSET = 0
+_TRACED_LOCK = threading.Lock()
+
+
+def _read_status_kib(field: str) -> Optional[int]:
+  if not PROC_STATUS_PATH.is_file():
+    return None
+  with PROC_STATUS_PATH.open(encoding="utf-8") as status_file:
+    for line in status_file:
+      if line.startswith(f"{field}:"):
+        return int(line.split()[1])
+  return None
+
+
+def get_rss_bytes() -> int:
+  """The resident set size, or its peak where the current size is unknown."""
+  rss_kib = _read_status_kib("VmRSS")
+  if rss_kib is None:
+    # Without /proc, e.g. on macOS where ru_maxrss is in bytes.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss_kib * 1024
+
+
+def _reset_peak_rss() -> bool:
+  try:
+    PROC_CLEAR_REFS_PATH.write_text("5", encoding="utf-8")
+    return True
+  except OSError:
+    return False
+
+
+def _get_peak_rss_bytes() -> int:
+  peak_kib = _read_status_kib("VmHWM")
+  return get_rss_bytes() if peak_kib is None else peak_kib * 1024
+
+
+def get_process_peak_rss_bytes() -> int:
+  """The largest resident set of this process so far."""
+  # ru_maxrss is in KiB on Linux.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _get_traced_bytes() -> Tuple[int, int]:
+  """The traced memory and its peak since _reset_traced_peak."""
+  with _TRACED_LOCK:
+    current, peak = tracemalloc.get_traced_memory()
+    return _TRACED_OFFSET + current, _TRACED_OFFSET + peak
+
+
+def _reset_traced_peak():
+  global _TRACED_OFFSET
+  with _TRACED_LOCK:
+    _TRACED_OFFSET += tracemalloc.get_traced_memory()[0]
+    tracemalloc.clear_traces()
+
+
+@dataclasses.dataclass
+class _Measurement:
+  traced_start: int
+  rss_start: int
+  # Peaks seen by nested measurements, which reset the counters.
+  traced_peak: int = 0
+  rss_peak: int = 0
+
+
+class MemoryStats():
+  """Peak memory growth per named step and per item, such as a card."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self.counts: Dict[str, int] = {}
+    self.traced_peaks: Dict[str, int] = {}
+    self.rss_peaks: Dict[str, int] = {}
+    self.item_rss_peaks: Dict[str, int] = {}
+    self.item_traced_peaks: Dict[str, int] = {}
+    # Process name -> peak resident set, of the workers merged in.
+    self.worker_rss_peaks: Dict[str, int] = {}
+    self.can_reset_rss = _reset_peak_rss()
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state["_lock"]
+    del state["_local"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+    self._local = threading.local()
+
+  def merge(self, other: "MemoryStats", process_name: str,
+            process_rss_peak: int):
+    """Adds the accounting of a worker process."""
+    with self._lock:
+      for step, count in other.counts.items():
+        self.counts[step] = self.counts.get(step, 0) + count
+      for peaks, other_peaks in [
+          (self.traced_peaks, other.traced_peaks),
+          (self.rss_peaks, other.rss_peaks),
+          (self.item_traced_peaks, other.item_traced_peaks),
+          (self.item_rss_peaks, other.item_rss_peaks),
+      ]:
+        for name, peak in other_peaks.items():
+          peaks[name] = max(peaks.get(name, 0), peak)
+      self.worker_rss_peaks[process_name] = process_rss_peak
+      self.can_reset_rss = self.can_reset_rss and other.can_reset_rss
+
+  def _record(self, step: str, item: Optional[str], traced: int, rss: int):
+    with self._lock:
+      self.counts[step] = self.counts.get(step, 0) + 1
+      self.traced_peaks[step] = max(self.traced_peaks.get(step, 0), traced)
+      self.rss_peaks[step] = max(self.rss_peaks.get(step, 0), rss)
+      if item is not None:
+        self.item_traced_peaks[item] = max(self.item_traced_peaks.get(item, 0),
+                                           traced)
+        self.item_rss_peaks[item] = max(self.item_rss_peaks.get(item, 0), rss)
+
+  @contextlib.contextmanager
+  def measure(self, step: str, item: Optional[str] = None) -> Iterator[None]:
+    """Records how far memory grew above its level at the start of step."""
+    stack: List[_Measurement] = getattr(self._local, "stack", None)
+    if stack is None:
+      stack = self._local.stack = []
+    _reset_traced_peak()
+    if self.can_reset_rss:
+      _reset_peak_rss()
+    measurement = _Measurement(_get_traced_bytes()[0], get_rss_bytes())
+    stack.append(measurement)
+    try:
+      yield
+    finally:
+      stack.pop()
+      traced_peak = max(measurement.traced_peak, _get_traced_bytes()[1])
+      rss_peak = max(measurement.rss_peak, _get_peak_rss_bytes())
+      if len(stack) > 0:
+        stack[-1].traced_peak = max(stack[-1].traced_peak, traced_peak)
+        stack[-1].rss_peak = max(stack[-1].rss_peak, rss_peak)
+      self._record(step, item, max(0, traced_peak - measurement.traced_start),
+                   max(0, rss_peak - measurement.rss_start))
+
+  def report(self):
+    with self._lock:
+      print("Peak memory growth per stage (python and numpy, resident set):")
+      for step, count in self.counts.items():
+        print(f"  {step}: {count}x, "
+              f"{self.traced_peaks[step] / MIB:.1f} MiB traced, "
+              f"{self.rss_peaks[step] / MIB:.1f} MiB resident")
+      largest_items = sorted(self.item_rss_peaks.items(),
+                             key=lambda item: item[1],
+                             reverse=True)[:NUM_REPORTED_ITEMS]
+      for item, rss_peak in largest_items:
+        print(f"  {item}: {self.item_traced_peaks[item] / MIB:.1f} MiB "
+              f"traced, {rss_peak / MIB:.1f} MiB resident")
+      print("Peak resident set of the process: "
+            f"{get_process_peak_rss_bytes() / MIB:.1f} MiB")
+      if len(self.worker_rss_peaks) > 0:
+        print("Peak resident set of the worker processes, merged above:")
+      for name, rss_peak in sorted(self.worker_rss_peaks.items()):
+        print(f"  {name}: {rss_peak / MIB:.1f} MiB")
+      if not self.can_reset_rss:
+        print(
+            "Resident growth is only approximate, since the peak resident set "
+            "could not be reset.")
+
+
+def start() -> MemoryStats:
+  """Starts accounting for every `stage` in this process."""
+  global _ACTIVE
+  assert _ACTIVE is None, "Memory is already being accounted."
+  tracemalloc.start()
+  _ACTIVE = MemoryStats()
+  return _ACTIVE
+
+
+def get_active() -> Optional[MemoryStats]:
+  """The accounting of this process, if it is running."""
+  return _ACTIVE
+
+
+def stop():
+  """Stops accounting in this process, e.g. in a forked worker."""
+  global _ACTIVE
+  _ACTIVE = None
+  if tracemalloc.is_tracing():
+    tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def stage(step: str, item: Optional[str] = None) -> Iterator[None]:
+  """Measures the enclosed code, if memory is being accounted."""
+  if _ACTIVE is None:
+    yield
+    return
+  with _ACTIVE.measure(step, item):
+    yield
+
+
+def estimate_card_bytes(ctx: render_context.RenderContext,
+                        render_sample: Callable[[], object]) -> int:
+  """Estimates the memory one more concurrent render needs at this size.
+
+  Pillow buffers are estimated from the card size, and everything else is
+  traced while rendering a sample card.
+  """
+  image_bytes = FULL_SIZE_IMAGES_PER_CARD * ctx.card_width * ctx.card_height * 4
+  was_tracing = tracemalloc.is_tracing()
+  if not was_tracing:
+    tracemalloc.start()
+  _reset_traced_peak()
+  traced_start = _get_traced_bytes()[0]
+  render_sample()
+  traced_bytes = _get_traced_bytes()[1] - traced_start
+  if not was_tracing:
+    tracemalloc.stop()
+  return image_bytes + max(0, traced_bytes)
+
+
+def limit_jobs(jobs: int, budget_bytes: int, card_bytes: int) -> int:
+  """The most concurrent renders, up to jobs, that fit within the budget.
+
+  More than one job runs in worker processes forked from this one. Each is
+  counted at the resident set of this process plus a card, an upper bound as
+  the workers share the pages of this process until they write to them.
+  """
+  rss_bytes = get_rss_bytes()
+  available_bytes = budget_bytes - rss_bytes
+  worker_bytes = rss_bytes + card_bytes
+  budget_jobs = max(1, min(jobs, available_bytes // worker_bytes))
+  print(f"Memory budget of {budget_bytes / MIB:.0f} MiB with "
+        f"{rss_bytes / MIB:.0f} MiB in use allows {budget_jobs} of {jobs} "
+        f"jobs at {card_bytes / MIB:.1f} MiB per card and "
+        f"{worker_bytes / MIB:.1f} MiB per worker.")
+  if available_bytes < card_bytes:
+    print("Warning: a single render may exceed the memory budget.")
+  return budget_jobs
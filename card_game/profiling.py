@@ -0,0 +1,232 @@
+# Profiles a whole run, including worker threads and processes.
+#
+# Two views are recorded. cProfile gives exact call counts and times per
+# function, and a sampler records the stack of every thread a few hundred times
+# a second for flamegraphs. cProfile only sees the thread that enabled it, so
+# work handed to other threads is wrapped with `profiled`. Worker processes
+# call `start_worker` and write their own files, which are merged at the end.
+
+import collections
+import contextlib
+import cProfile
+import functools
+import multiprocessing.util
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+#pylint: disable=too-many-instance-attributes
+#pylint: disable=global-statement
+
+# Seconds between stack samples.
+SAMPLE_SECONDS = 0.005
+# Modules whose functions are listed in the hot function report.
+HOT_MODULES = ("card_art", "body_text", "icons")
+NUM_HOT_FUNCTIONS = 15
+WORKER_DIR_NAME = "workers"
+
+# The profiler of this process, if one is running.
+_ACTIVE: Optional["Profiler"] = None
+
+
+def _get_frame_name(frame) -> str:
+  code = frame.f_code
+  return f"{pathlib.Path(code.co_filename).stem}.{code.co_name}"
+
+
+class Profiler():
+  """Collects cProfile stats and sampled stacks until finished."""
+
+  def __init__(self, profile_dir: pathlib.Path, name: str = "profile"):
+    self.profile_dir = profile_dir
+    self.name = name
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    # One cProfile per thread that ran profiled work.
+    self._thread_profiles: List[cProfile.Profile] = []
+    # Collapsed stack -> number of samples.
+    self._stacks: Dict[str, int] = collections.Counter()
+    self._stop_sampling = threading.Event()
+    self._sampler: Optional[threading.Thread] = None
+    self._start_time = None
+
+  def _get_thread_profile(self) -> cProfile.Profile:
+    profile = getattr(self._local, "profile", None)
+    if profile is None:
+      profile = cProfile.Profile()
+      self._local.profile = profile
+      self._local.depth = 0
+      with self._lock:
+        self._thread_profiles.append(profile)
+    return profile
+
+  def run(self, function: Callable, *args, **kwargs):
+    """Calls function with this thread's cProfile enabled."""
+    profile = self._get_thread_profile()
+    # Nested profiled calls are already being recorded.
+    if self._local.depth > 0:
+      return function(*args, **kwargs)
+    self._local.depth += 1
+    profile.enable()
+    try:
+      return function(*args, **kwargs)
+    finally:
+      profile.disable()
+      self._local.depth -= 1
+
+  def _start_sampler(self):
+    self._stop_sampling.clear()
+    self._sampler = threading.Thread(target=self._sample, daemon=True)
+    self._sampler.start()
+
+  def _stop_sampler(self):
+    self._stop_sampling.set()
+    self._sampler.join()
+
+  def _sample(self):
+    sampler_id = threading.get_ident()
+    while not self._stop_sampling.wait(SAMPLE_SECONDS):
+      frames = sys._current_frames()  #pylint: disable=protected-access
+      for thread_id, frame in frames.items():
+        if thread_id == sampler_id:
+          continue
+        names = []
+        while frame is not None:
+          names.append(_get_frame_name(frame))
+          frame = frame.f_back
+        self._stacks[";".join(reversed(names))] += 1
+
+  def start(self) -> "Profiler":
+    """Profiles the calling thread and starts sampling every thread."""
+    global _ACTIVE
+    assert _ACTIVE is None, "Only one profile can run at a time."
+    _ACTIVE = self
+    self._start_time = time.perf_counter()
+    self._get_thread_profile()
+    self._local.depth += 1
+    self._local.profile.enable()
+    self._start_sampler()
+    return self
+
+  def _stop(self) -> pstats.Stats:
+    global _ACTIVE
+    self._local.profile.disable()
+    self._local.depth -= 1
+    self._stop_sampler()
+    _ACTIVE = None
+    with self._lock:
+      profiles = list(self._thread_profiles)
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+      stats.add(profile)
+    return stats
+
+  def _write(self, stats: pstats.Stats,
+             output_dir: pathlib.Path) -> pathlib.Path:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stats_path = output_dir.joinpath(f"{self.name}.pstats")
+    stats.dump_stats(stats_path)
+    with output_dir.joinpath(f"{self.name}.collapsed").open(
+        "w", encoding="utf-8") as collapsed_file:
+      for stack, count in sorted(self._stacks.items()):
+        collapsed_file.write(f"{stack} {count}\n")
+    return stats_path
+
+  def finish(self):
+    """Merges in the workers, writes the outputs and reports hot functions.
+
+    Writes <name>.pstats, for pstats or snakeviz, and <name>.collapsed, for
+    flamegraph.pl or speedscope.
+    """
+    seconds = time.perf_counter() - self._start_time
+    stats = self._stop()
+    worker_dir = self.profile_dir.joinpath(WORKER_DIR_NAME)
+    worker_stats_paths = sorted(worker_dir.glob("*.pstats"))
+    for worker_stats_path in worker_stats_paths:
+      stats.add(str(worker_stats_path))
+      collapsed_path = worker_stats_path.with_suffix(".collapsed")
+      with collapsed_path.open(encoding="utf-8") as collapsed_file:
+        for line in collapsed_file:
+          stack, count = line.rsplit(" ", 1)
+          self._stacks[stack] += int(count)
+    stats_path = self._write(stats, self.profile_dir)
+    print(f"Profiled {seconds:.1f}s over {len(self._thread_profiles)} threads "
+          f"and {len(worker_stats_paths)} worker processes, wrote {stats_path} "
+          f"and {stats_path.with_suffix('.collapsed')}")
+    print_hot_functions(stats)
+
+  def finish_worker(self):
+    self._write(self._stop(), self.profile_dir.joinpath(WORKER_DIR_NAME))
+
+
+def profiled(function: Callable) -> Callable:
+  """Records calls of function on any thread while a profile is running."""
+
+  @functools.wraps(function)
+  def _wrapper(*args, **kwargs):
+    profiler = _ACTIVE
+    if profiler is None:
+      return function(*args, **kwargs)
+    return profiler.run(function, *args, **kwargs)
+
+  return _wrapper
+
+
+def start(profile_dir: pathlib.Path) -> Profiler:
+  """Profiles this process, until finish is called."""
+  for stale_path in profile_dir.joinpath(WORKER_DIR_NAME).glob("worker_*"):
+    stale_path.unlink()
+  return Profiler(profile_dir).start()
+
+
+def start_worker(profile_dir: pathlib.Path):
+  """Profiles a worker process until it exits, e.g. as a pool initializer."""
+  global _ACTIVE
+  # A forked worker inherits the profiler of its parent, which stopped
+  # sampling and would never be written.
+  _ACTIVE = None
+  profiler = Profiler(profile_dir, name=f"worker_{os.getpid()}").start()
+  # Pool workers skip atexit, but multiprocessing runs its finalizers.
+  multiprocessing.util.Finalize(None, profiler.finish_worker, exitpriority=10)
+
+
+@contextlib.contextmanager
+def sampling_paused() -> Iterator[None]:
+  """Stops the sampler thread of this process, e.g. while forking workers."""
+  profiler = _ACTIVE
+  if profiler is None:
+    yield
+    return
+  profiler._stop_sampler()  #pylint: disable=protected-access
+  try:
+    yield
+  finally:
+    profiler._start_sampler()  #pylint: disable=protected-access
+
+
+def get_active_profile_dir() -> Optional[pathlib.Path]:
+  """Where workers should write to, if this process is being profiled."""
+  return None if _ACTIVE is None else _ACTIVE.profile_dir
+
+
+def print_hot_functions(stats: pstats.Stats,
+                        modules: Sequence[str] = HOT_MODULES,
+                        num_functions: int = NUM_HOT_FUNCTIONS):
+  """Prints the functions of these modules that take the most time."""
+  rows = []
+  #pylint: disable=no-member
+  for (path, line, function), (_, num_calls, self_seconds, total_seconds,
+                               _) in stats.stats.items():
+    module = pathlib.Path(path).stem
+    if module in modules:
+      rows.append((self_seconds, total_seconds, num_calls,
+                   f"{module}.{function}:{line}"))
+  rows.sort(reverse=True)
+  print(f"Hottest functions in {', '.join(modules)}:")
+  print(f"  {'self s':>8} {'total s':>8} {'calls':>8}  function")
+  for self_seconds, total_seconds, num_calls, name in rows[:num_functions]:
+    print(f"  {self_seconds:8.3f} {total_seconds:8.3f} {num_calls:8d}  {name}")
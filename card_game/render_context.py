@@ -0,0 +1,145 @@
+# Resolution dependent layout metrics and font handles.
+
+import functools
+import pathlib
+
+from PIL import ImageFont
+
+from . import util
+
+#pylint: disable=too-many-instance-attributes
+#pylint: disable=too-many-statements
+#pylint: disable=too-few-public-methods
+
+# Resolutions and font sizes kept loaded. Titles shrink their font one size at a
+# time until they fit, so each resolution uses a few dozen sizes.
+CONTEXT_CACHE_SIZE = 8
+FONT_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(font_path: pathlib.Path, size: int) -> ImageFont.FreeTypeFont:
+  """Loads each font once per size, shared by every context."""
+  return ImageFont.truetype(str(font_path), size)
+
+
+class RenderContext():
+  """Everything about the card layout that depends on the resolution.
+
+  Unless specified, all sizes are in pixels. Use get_render_context, so that
+  one process can render print, screen and thumbnail outputs side by side
+  while sharing fonts.
+  """
+
+  def __init__(self, pixels_per_inch: int):
+    self.pixels_per_inch = pixels_per_inch
+
+    def _inches(inches: float) -> int:
+      return int(inches * pixels_per_inch)
+
+    # Card
+    self.card_width = _inches(2.7)
+    self.card_height = _inches(3.7)
+    self.card_margin = _inches(0.25)
+    self.card_padding = _inches(0.05)
+    # Trimmed from the edge of the finished card.
+    self.crop_border_width = _inches(0.1)
+    self.crop_corner_radius = _inches(1 / 8)
+    # Size of the finished card, once the border is cropped.
+    self.cropped_card_width = self.card_width - 2 * self.crop_border_width
+    self.cropped_card_height = self.card_height - 2 * self.crop_border_width
+    self.card_bb = [0, 0, self.card_width, self.card_height]
+
+    # Default icon params
+    self.icon_width = self.icon_height = _inches(0.3)
+    self.icon_font = get_font(util.LATO_FONT_PATH, int(self.icon_width * 0.75))
+    self.cost_icon_font = get_font(util.LATO_FONT_PATH,
+                                   int(self.icon_width * 0.9))
+    self.top_icon_x = self.top_icon_y = (self.card_margin +
+                                         self.icon_height // 2)
+    self.cost_coord = (self.top_icon_x, self.top_icon_y)
+
+    # Describes the max width of card contents
+    self.content_width = self.card_width - 2 * self.card_margin
+
+    # Card image parameters
+    self.card_image_bottom = _inches(2)
+    self.card_image_bb = [
+        self.card_margin,
+        self.card_margin,
+        self.card_width - self.card_margin,
+        self.card_image_bottom,
+    ]
+
+    # Body text background
+    self.body_text_bg_bb = [
+        self.card_margin,
+        self.card_image_bottom + self.card_padding,
+        self.card_margin + self.content_width,
+        self.card_height - self.card_margin,
+    ]
+
+    self.bottom_icon_y = (self.card_height - self.icon_width // 2 -
+                          self.card_margin)
+    self.icon_hor_margin = self.icon_width // 2 + self.card_margin
+    self.strength_coord = (self.icon_hor_margin, self.bottom_icon_y)
+    self.health_coord = (self.card_width - self.icon_hor_margin,
+                         self.bottom_icon_y)
+    self.mana_coord = (self.card_width // 2, self.bottom_icon_y)
+
+    # Title
+    self.title_bg_height = _inches(0.28)
+    self.max_title_width = int(self.card_width * 0.75)
+    self.title_font = get_font(util.LEAGUE_GOTHIC_FONT_PATH, _inches(0.2))
+    self.title_bg_radius = _inches(0.05)
+    self.title_bg_outline_width = _inches(0.025)
+
+    # Card attributes
+    self.attribute_font = get_font(util.LATO_FONT_PATH, _inches(0.1))
+    self.attribute_height = _inches(0.12)
+    self.attribute_bg_outline_width = _inches(0.015)
+    self.attribute_bottom = self.card_height
+    self.attribute_coord = (self.card_width / 2,
+                            self.card_image_bottom + self.card_padding // 2)
+    self.max_attribute_width = int(self.card_width * 0.6)
+    self.attribute_bg_radius = _inches(0.1)
+
+    # Card art and border
+    self.art_corner_radius = _inches(0.1)
+    self.border_width = _inches(0.2)
+    self.border_corner_radius = _inches(0.25)
+    self.bg_pattern_size = _inches(0.2)
+    self.card_back_title_font = get_font(util.LEAGUE_GOTHIC_FONT_PATH,
+                                         _inches(0.75))
+
+    # Body text
+    self.body_bg_radius = _inches(0.1)
+    self.body_text_margin = _inches(0.08)
+    self.flavor_text_margin = _inches(0.42)
+    self.text_height = _inches(0.125)
+    self.body_font = get_font(util.EB_GARAMOND_FONT_PATH, self.text_height)
+    self.flavor_text_height = _inches(0.12)
+    self.flavor_text_font = get_font(util.GARAMOND_ITALIC_FONT_PATH,
+                                     self.flavor_text_height)
+    self.token_padding_y = _inches(0.02)
+    self.token_padding_x = _inches(0.02)
+    self.cost_padding_x = _inches(0.05)
+    self.text_segment_padding_y = _inches(0.03)
+    self.text_segment_border_width = _inches(0.01)
+    self.text_segment_font = get_font(util.EB_GARAMOND_FONT_PATH, _inches(0.09))
+    self.text_segment_font_padding_y = int(1.2 * self.text_segment_font.size)
+    self.action_icon_padding = _inches(0.075)
+    # Icons inline with the body text.
+    self.text_icon_width = self.text_icon_height = self.text_height
+    self.text_icon_font = get_font(util.LATO_FONT_PATH,
+                                   int(self.text_height * 0.8))
+
+
+@functools.lru_cache(maxsize=CONTEXT_CACHE_SIZE)
+def get_render_context(pixels_per_inch: int) -> RenderContext:
+  return RenderContext(pixels_per_inch)
+
+
+def get_default_render_context() -> RenderContext:
+  """The context at the resolution from config.json."""
+  return get_render_context(util.PIXELS_PER_INCH)
@@ -0,0 +1,139 @@
+# Caches the rasterized text runs that recur across cards.
+#
+# A full set repeats the same keywords, card types, segment headers and icon
+# numbers thousands of times, and draw.text rasterizes each from scratch.
+# Here each run is drawn once per font, size and anchor into an alpha mask,
+# which later draws paste in the fill color with draw.bitmap. The pixels are the
+# same as draw.text, since both paste the glyph mask in the ink color, and the
+# mask of a run drawn at full intensity is the glyph mask itself.
+
+import collections
+import threading
+from typing import Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from . import colors, util
+
+#pylint: disable=too-many-arguments
+#pylint: disable=too-many-instance-attributes
+
+# Bytes of masks kept, per process. Masks are one byte per pixel.
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+
+def _draw_mask(font: ImageFont.FreeTypeFont, text: str, mode: str,
+               anchor: str) -> Tuple[Image, Tuple[int, int]]:
+  left, top, right, bottom = font.getbbox(text, mode, anchor=anchor)
+  mask = Image.new("L", (max(0, right - left), max(0, bottom - top)))
+  draw = ImageDraw.Draw(mask)
+  draw.fontmode = mode
+  draw.text((-left, -top), text, 255, font=font, anchor=anchor)
+  return mask, (left, top)
+
+
+class TextRunCache():
+  """LRU cache of text masks, bounded by their total size. Thread safe."""
+
+  def __init__(self, max_bytes: int = MAX_CACHE_BYTES):
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    # (font path, size, mode, anchor, text) -> (mask, offset)
+    self._masks: collections.OrderedDict = collections.OrderedDict()
+    self.num_bytes = 0
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_evictions = 0
+    # Processes whose lookups are counted, see merge.
+    self.num_processes = 1
+
+  def __getstate__(self):
+    # Only the counts, since the masks stay with the process that drew them.
+    state = self.__dict__.copy()
+    del state["_lock"]
+    state["_masks"] = collections.OrderedDict()
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+  def merge(self, other: "TextRunCache"):
+    """Adds the counts of the cache of a worker process."""
+    with self._lock:
+      self.num_bytes += other.num_bytes
+      self.num_hits += other.num_hits
+      self.num_misses += other.num_misses
+      self.num_evictions += other.num_evictions
+      self.num_processes += other.num_processes
+
+  def reset_counts(self):
+    """Starts counting afresh, e.g. in a forked worker, keeping the masks."""
+    with self._lock:
+      self.num_hits = 0
+      self.num_misses = 0
+      self.num_evictions = 0
+
+  def get_mask(self, font: ImageFont.FreeTypeFont, text: str, mode: str,
+               anchor: str) -> Tuple[Image, Tuple[int, int]]:
+    """The "L" mask of text and its offset from the anchor."""
+    key = (font.path, font.size, mode, anchor, text)
+    with self._lock:
+      entry = self._masks.get(key)
+      if entry is not None:
+        self._masks.move_to_end(key)
+        self.num_hits += 1
+        return entry
+      self.num_misses += 1
+    entry = _draw_mask(font, text, mode, anchor)
+    mask_bytes = entry[0].width * entry[0].height
+    with self._lock:
+      # A cap of zero disables the cache.
+      if (key not in self._masks and self.max_bytes > 0 and
+          mask_bytes <= self.max_bytes):
+        self._masks[key] = entry
+        self.num_bytes += mask_bytes
+        while self.num_bytes > self.max_bytes:
+          _, (evicted, _) = self._masks.popitem(last=False)
+          self.num_bytes -= evicted.width * evicted.height
+          self.num_evictions += 1
+    return entry
+
+  def get_hit_rate(self) -> float:
+    with self._lock:
+      num_lookups = self.num_hits + self.num_misses
+      return 0 if num_lookups == 0 else self.num_hits / num_lookups
+
+  def report(self):
+    hit_rate = self.get_hit_rate()
+    with self._lock:
+      if self.num_hits + self.num_misses == 0:
+        return
+      print(f"Text run cache: {hit_rate:.1%} hit rate over "
+            f"{self.num_hits + self.num_misses} runs in {self.num_processes} "
+            f"processes, {self.num_bytes / 1024:.0f} KiB of masks, "
+            f"{self.num_evictions} evicted")
+
+  def clear(self):
+    with self._lock:
+      self._masks.clear()
+      self.num_bytes = 0
+
+
+# Collects every text run drawn in this process.
+CACHE = TextRunCache()
+
+
+def draw_text(draw: ImageDraw.Draw,
+              xy: util.Coord,
+              text: str,
+              fill: colors.Color,
+              font: ImageFont.FreeTypeFont,
+              anchor: str = "la"):
+  """Draws like draw.text, from a cached mask of the text."""
+  if "\n" in text or not isinstance(font, ImageFont.FreeTypeFont):
+    draw.text(xy, text, fill, font=font, anchor=anchor)
+    return
+  mask, offset = CACHE.get_mask(font, text, draw.fontmode, anchor)
+  if mask.width > 0 and mask.height > 0:
+    draw.bitmap((xy[0] + offset[0], xy[1] + offset[1]), mask, fill)
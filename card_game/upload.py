@@ -1,28 +1,51 @@
+import collections
+import concurrent.futures
+import contextlib
 import dataclasses
 import ftplib
+import functools
+import io
 import pathlib
+import queue
+import threading
 import time
-from typing import List
+from typing import (BinaryIO, Callable, Dict, Iterable, Iterator, List,
+                    Optional, Tuple)
 
 from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
-from . import util
+from . import upload_manifest, util
 
 #pylint: disable=too-many-arguments
+#pylint: disable=too-many-locals
+#pylint: disable=too-many-instance-attributes
+#pylint: disable=too-many-statements
 
 UNTAP_URL = "https://untap.in/"
+# Seconds to wait for each step of the page to become ready.
 MAX_WAIT = 10
+# Seconds between checks of whether the page is ready.
+POLL_TIME = 0.05
 
 FTP_URL = "ftp.sybrandt.com"
+FTP_PORT = 21
 FTP_USER = "ftpuser"
-FTP_PASSWD_FILE = (pathlib.Path.home().joinpath(".local").joinpath(
-    "share").joinpath("card_game").joinpath("ftp_password"))
-
-SLEEP_TIME = 0.5
+FTP_PASSWD_FILE = util.LOCAL_PATH.joinpath("ftp_password")
+# Number of FTP sessions uploading images concurrently.
+FTP_POOL_SIZE = 4
+FTP_TRIES = 3
+
+# Cards buffered between the stages of upload_cards_pipelined.
+PIPELINE_QUEUE_SIZE = 4
+# Browser sessions adding cards to untap concurrently.
+UNTAP_SESSIONS = 1
+# Chrome profiles that keep each session logged in between runs.
+BROWSER_PROFILE_DIR = util.LOCAL_PATH.joinpath("browser_profiles")
 
 # Following the upload, you can search for our cards with the "set" search.
 
@@ -33,10 +56,99 @@ class UploadCardMetadata:
   desc: util.CardDesc
 
 
+@dataclasses.dataclass
+class FtpTarget:
+  """The FTP server that hosts the card images."""
+  password: str
+  host: str = FTP_URL
+  port: int = FTP_PORT
+  user: str = FTP_USER
+  # Where uploaded files are served from, defaults to http://<host>.
+  public_url: Optional[str] = None
+
+
+@dataclasses.dataclass
+class BrowserOptions:
+  """How the browsers that add cards to untap are run."""
+  # The cards are split between this many sessions, each logged in separately
+  # and running at the same time.
+  sessions: int = UNTAP_SESSIONS
+  headless: bool = False
+  # Where the logged in profiles are kept. If None, every run starts from a
+  # fresh profile and logs in again.
+  profile_dir: Optional[pathlib.Path] = BROWSER_PROFILE_DIR
+
+  def get_profile_path(self, untap_username: str,
+                       session_index: int) -> Optional[pathlib.Path]:
+    """Chrome locks a profile while it is open, so each session has its own."""
+    if self.profile_dir is None:
+      return None
+    return self.profile_dir.joinpath(untap_username, f"session_{session_index}")
+
+
+def _load_ftp_target() -> FtpTarget:
+  with open(FTP_PASSWD_FILE, "r", encoding="utf=8") as f:
+    return FtpTarget(password=f.read().strip())
+
+
+def _wait(driver, condition):
+  return WebDriverWait(driver, MAX_WAIT,
+                       poll_frequency=POLL_TIME).until(condition)
+
+
+def _clickable_with_text(css_selector: str, text: str):
+  """Waits for a displayed and enabled element with exactly this text."""
+
+  def _condition(driver):
+    for element in driver.find_elements_by_css_selector(css_selector):
+      try:
+        if (element.text == text and element.is_displayed() and
+            element.is_enabled()):
+          return element
+      except StaleElementReferenceException:
+        pass
+    return False
+
+  return _condition
+
+
+def _gone(element):
+  """Waits for the element to be hidden or removed from the page."""
+
+  def _condition(_):
+    try:
+      return not element.is_displayed()
+    except StaleElementReferenceException:
+      return True
+
+  return _condition
+
+
+def _displayed(css_selector: str):
+  """Waits for any displayed element matching the selector."""
+
+  def _condition(driver):
+    for element in driver.find_elements_by_css_selector(css_selector):
+      try:
+        if element.is_displayed():
+          return element
+      except StaleElementReferenceException:
+        pass
+    return False
+
+  return _condition
+
+
+def _is_logged_in(driver) -> bool:
+  """Whether the page skipped the login form, for a remembered session."""
+  element = _wait(driver, _displayed("#main, .body-deck-list button"))
+  return element.get_attribute("id") != "main"
+
+
 def _login(driver, username, password):
   # We are currently on the front page
-  form_element = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.ID, "main")))
+  form_element = _wait(driver, EC.visibility_of_element_located(
+      (By.ID, "main")))
   username_input, password_input = form_element.find_elements_by_tag_name(
       "input")
   login_button = form_element.find_element_by_tag_name("button")
@@ -51,101 +163,226 @@ def _login(driver, username, password):
 
 
 def _dismiss_notifications(driver):
-  # we are currently on the "new browser" screen for first-timers.
-  modal_element = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.CLASS_NAME, "input-style")))
-  dissmiss_link = modal_element.find_element_by_tag_name("a")
-  time.sleep(SLEEP_TIME)
+  # we are currently on the "new browser" screen for first-timers. A browser
+  # that untap already knows goes straight to the deck list.
+  first_element = _wait(driver,
+                        _displayed(".input-style a, .body-deck-list button"))
+  if first_element.tag_name != "a":
+    return
+  dissmiss_link = _wait(
+      driver, EC.element_to_be_clickable((By.CSS_SELECTOR, ".input-style a")))
   # Need to click dismiss and somewhere in the background.
   (webdriver.ActionChains(driver).click(dissmiss_link).perform())
+  _wait(driver, _gone(dissmiss_link))
 
 
 def _click_new_deck(driver):
-  decklists_element = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.CLASS_NAME, "body-deck-list")))
-  new_deck_button = decklists_element.find_element_by_tag_name("button")
+  new_deck_button = _wait(
+      driver,
+      EC.element_to_be_clickable((By.CSS_SELECTOR, ".body-deck-list button")))
   webdriver.ActionChains(driver).double_click(new_deck_button).perform()
 
 
 def _click_custom_deck(driver):
-  modal = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.CLASS_NAME, "container")))
-  deck_type_grid = modal.find_element_by_class_name("grid")
-
+  modal = _wait(driver,
+                EC.visibility_of_element_located((By.CLASS_NAME, "container")))
   deck_name_input = modal.find_element_by_tag_name("input")
   assert deck_name_input.get_attribute("type") == "text"
 
-  found_deck_label = None
-  for deck_type_label in deck_type_grid.find_elements_by_tag_name("label"):
-    if deck_type_label.text == "Custom CCG":
-      found_deck_label = deck_type_label
-  assert found_deck_label is not None
-
-  found_create_deck_button = None
-  for button in modal.find_elements_by_tag_name("button"):
-    if button.text == "Create Deck":
-      found_create_deck_button = button
-  assert found_create_deck_button is not None
+  found_deck_label = _wait(
+      driver, _clickable_with_text(".container .grid label", "Custom CCG"))
+  found_create_deck_button = _wait(
+      driver, _clickable_with_text(".container button", "Create Deck"))
 
   (webdriver.ActionChains(driver).double_click(deck_name_input).send_keys(
       time.asctime()).double_click(found_deck_label).double_click(
           found_create_deck_button).perform())
+  _wait(driver, _gone(found_create_deck_button))
 
 
 def _open_submenu(driver):
-  menu_icon = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.CLASS_NAME, "icon-menu")))
+  menu_icon = _wait(driver,
+                    EC.element_to_be_clickable((By.CLASS_NAME, "icon-menu")))
   (webdriver.ActionChains(driver).move_to_element(menu_icon).click().perform())
-  menu_overlay = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.ID, "sub-menu-overlay")))
-
-  add_card_option = None
-  for option in menu_overlay.find_elements_by_tag_name("span"):
-    if option.text == "Add Missing Card":
-      add_card_option = option
-      break
-  assert add_card_option is not None
+  add_card_option = _wait(
+      driver, _clickable_with_text("#sub-menu-overlay span",
+                                   "Add Missing Card"))
 
   # Click and open "I understand"
   webdriver.ActionChains(driver).click(add_card_option).perform()
 
 
 def _click_i_understand(driver):
-  i_understand_button = None
-  for button in driver.find_elements_by_tag_name("button"):
-    if button.text == "I Understand":
-      i_understand_button = button
-  assert i_understand_button is not None
+  i_understand_button = _wait(driver,
+                              _clickable_with_text("button", "I Understand"))
   webdriver.ActionChains(driver).click(i_understand_button).perform()
+  _wait(driver, _gone(i_understand_button))
 
 
 def _fill_card_contents(driver, title, set_name, image_url, card_back_url):
-  form = WebDriverWait(driver, MAX_WAIT).until(
-      EC.presence_of_element_located((By.ID, "add-card")))
+  form = _wait(driver, EC.visibility_of_element_located((By.ID, "add-card")))
   title_input, set_input, img_url_input, back_img_url_input = \
     form.find_elements_by_tag_name("input")
   _, card_type_select, _, _, _ = form.find_elements_by_tag_name("select")
 
-  add_card_button = None
-  for button in driver.find_elements_by_tag_name("button"):
-    if button.text == "Add Card":
-      add_card_button = button
-      break
-  assert add_card_button is not None
+  add_card_button = _wait(driver, _clickable_with_text("button", "Add Card"))
 
   (webdriver.ActionChains(driver).double_click(title_input).send_keys(title).
    double_click(set_input).send_keys(set_name).double_click(img_url_input).
    send_keys(image_url).double_click(back_img_url_input).send_keys(
        card_back_url).double_click(card_type_select).send_keys("c").send_keys(
            Keys.ENTER).double_click(add_card_button).perform())
-
-
-def _upload_image(ftp_session: ftplib.FTP,
-                  local_image_path: pathlib.Path) -> str:
-  """Returns the remote URL where to find this file."""
-  with open(local_image_path, 'rb') as data_file:
-    ftp_session.storbinary(f"STOR {local_image_path.name}", data_file)
-  return f"http://{FTP_URL}/{local_image_path.name}"
+  # The form closes once untap has accepted the card.
+  _wait(driver, _gone(form))
+
+
+class FtpSessionPool():
+  """A bounded pool of logged in FTP sessions that upload concurrently.
+
+  Sessions are opened on demand, up to `size`, and reused between files. A
+  session that fails is closed and replaced by a fresh one on the next
+  attempt. Use as a context manager so the sessions are closed afterwards.
+  """
+
+  def __init__(self,
+               password: str,
+               host: str = FTP_URL,
+               port: int = FTP_PORT,
+               user: str = FTP_USER,
+               size: int = FTP_POOL_SIZE,
+               tries: int = FTP_TRIES,
+               public_url: Optional[str] = None):
+    assert size > 0, "Must have at least one FTP session."
+    assert tries > 0, "Must try each upload at least once."
+    self.host = host
+    self.port = port
+    self.user = user
+    self.size = size
+    self.tries = tries
+    self.public_url = f"http://{host}" if public_url is None else public_url
+    self._password = password
+    self._idle_sessions = queue.LifoQueue()
+    # Limits the sessions borrowed at once. New sessions are only opened when
+    # none are idle, so this also bounds the sessions open at once.
+    self._open_slots = threading.BoundedSemaphore(size)
+    self._lock = threading.Lock()
+    self.num_connects = 0
+    self.num_retries = 0
+    self.num_files = 0
+    self.num_bytes = 0
+    self.seconds = 0
+
+  def _connect(self) -> ftplib.FTP:
+    ftp_session = ftplib.FTP_TLS()
+    try:
+      ftp_session.connect(self.host, self.port)
+      ftp_session.sendcmd(f"USER {self.user}")
+      ftp_session.sendcmd(f"PASS {self._password}")
+    except ftplib.all_errors:
+      ftp_session.close()
+      raise
+    with self._lock:
+      self.num_connects += 1
+    return ftp_session
+
+  @contextlib.contextmanager
+  def session(self) -> Iterator[ftplib.FTP]:
+    """Borrows a session, replacing it if it fails while borrowed."""
+    self._open_slots.acquire()
+    try:
+      ftp_session = self._idle_sessions.get_nowait()
+    except queue.Empty:
+      try:
+        ftp_session = self._connect()
+      except BaseException:
+        self._open_slots.release()
+        raise
+    try:
+      yield ftp_session
+    except BaseException:
+      ftp_session.close()
+      self._open_slots.release()
+      raise
+    self._idle_sessions.put(ftp_session)
+    self._open_slots.release()
+
+  def upload(self,
+             local_image_path: pathlib.Path,
+             remote_name: Optional[str] = None) -> str:
+    """Uploads the file, returning the remote URL where to find it.
+
+    The remote file keeps the local name unless remote_name is given.
+    """
+    if remote_name is None:
+      remote_name = local_image_path.name
+    return self._store(remote_name,
+                       functools.partial(open, local_image_path, "rb"),
+                       local_image_path.stat().st_size)
+
+  def upload_bytes(self, data: bytes, remote_name: str) -> str:
+    """Uploads an in-memory image, returning the remote URL."""
+    return self._store(remote_name, lambda: io.BytesIO(data), len(data))
+
+  def _store(self, remote_name: str, open_data: Callable[[], BinaryIO],
+             num_bytes: int) -> str:
+    for i in range(self.tries):
+      # Opened outside the retries, since local errors won't go away.
+      with open_data() as data_file:
+        try:
+          with self.session() as ftp_session:
+            ftp_session.storbinary(f"STOR {remote_name}", data_file)
+          break
+        except ftplib.all_errors as e:
+          print(f"Failed to upload {remote_name}: {e!r}")
+          if i == self.tries - 1:
+            raise
+          print("Trying again...")
+          with self._lock:
+            self.num_retries += 1
+    with self._lock:
+      self.num_files += 1
+      self.num_bytes += num_bytes
+    return f"{self.public_url}/{remote_name}"
+
+  def upload_all(self,
+                 local_image_paths: List[pathlib.Path],
+                 remote_names: Optional[List[str]] = None) -> List[str]:
+    """Uploads the files concurrently, returning URLs in the same order."""
+    if remote_names is None:
+      remote_names = [path.name for path in local_image_paths]
+    assert len(remote_names) == len(local_image_paths)
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=self.size) as pool:
+      urls = list(pool.map(self.upload, local_image_paths, remote_names))
+    with self._lock:
+      self.seconds += time.perf_counter() - start
+    return urls
+
+  def report(self):
+    with self._lock:
+      seconds = max(self.seconds, 1e-9)
+      print(f"Uploaded {self.num_files} files "
+            f"({self.num_bytes / 1024 / 1024:.1f} MiB) in {seconds:.1f}s "
+            f"over {self.size} sessions: {self.num_files / seconds:.1f} "
+            f"files/s, {self.num_bytes / 1024 / 1024 / seconds:.2f} MiB/s, "
+            f"{self.num_connects} connects, {self.num_retries} retries")
+
+  def close(self):
+    while True:
+      try:
+        ftp_session = self._idle_sessions.get_nowait()
+      except queue.Empty:
+        return
+      try:
+        ftp_session.quit()
+      except ftplib.all_errors:
+        ftp_session.close()
+
+  def __enter__(self) -> "FtpSessionPool":
+    return self
+
+  def __exit__(self, *_):
+    self.close()
 
 
 def _attempt(function, tries=3):
@@ -160,48 +397,375 @@ def _attempt(function, tries=3):
   return None
 
 
+def _open_untap_deck(selenium_driver_path: pathlib.Path, untap_url: str,
+                     untap_username: str, untap_password: str,
+                     browser: BrowserOptions, session_index: int,
+                     timings: util.StepTimings):
+  """Logs in if needed and creates the deck that cards are added from."""
+  options = webdriver.ChromeOptions()
+  if browser.headless:
+    options.add_argument("--headless")
+  profile_path = browser.get_profile_path(untap_username, session_index)
+  if profile_path is not None:
+    profile_path.mkdir(parents=True, exist_ok=True)
+    options.add_argument(f"--user-data-dir={profile_path}")
+  # If we go to sleep, the automated browser iterations may fail.
+  with timings.time("start browser"):
+    driver = webdriver.Chrome(executable_path=selenium_driver_path,
+                              options=options)
+    driver.get(untap_url)
+    driver.set_window_position(0, 0)
+    # The damn icons on the left hand side can cover up the buttons we need.
+    driver.set_window_size(1920, 1080)
+  with timings.time("check session"):
+    logged_in = _is_logged_in(driver)
+  if logged_in:
+    print(f"Reusing the untap session in {profile_path}")
+  else:
+    with timings.time("login"):
+      _login(driver, untap_username, untap_password)
+    with timings.time("dismiss notifications"):
+      _dismiss_notifications(driver)
+  with timings.time("create deck"):
+    _click_new_deck(driver)
+    _click_custom_deck(driver)
+  return driver
+
+
+def _add_card(driver, desc: util.CardDesc, card_set_name: str, card_link: str,
+              card_back_link: str, timings: util.StepTimings):
+  print(f"Adding '{desc.title}' from {card_link}")
+  with timings.time("card"):
+    with timings.time("open submenu"):
+      _attempt(lambda: _open_submenu(driver))
+    with timings.time("i understand"):
+      _attempt(lambda: _click_i_understand(driver))
+    with timings.time("fill card"):
+      _attempt(lambda: _fill_card_contents(driver, desc.title, card_set_name,
+                                           card_link, card_back_link))
+
+
+class _PipelineStopped(Exception):
+  """Raised inside a pipeline stage once another stage has failed."""
+
+
+def _put(stage_queue: queue.Queue, item, stop: threading.Event):
+  while not stop.is_set():
+    try:
+      stage_queue.put(item, timeout=POLL_TIME)
+      return
+    except queue.Full:
+      pass
+  raise _PipelineStopped()
+
+
+def _get(stage_queue: queue.Queue, stop: threading.Event):
+  while not stop.is_set():
+    try:
+      return stage_queue.get(timeout=POLL_TIME)
+    except queue.Empty:
+      pass
+  raise _PipelineStopped()
+
+
+def _card_back_link(desc: util.CardDesc, main_deck_back_link: str,
+                    memory_deck_back_link: str) -> str:
+  if desc.card_type == util.CardType.MEMORY:
+    return memory_deck_back_link
+  return main_deck_back_link
+
+
+# A card to add: its description, image content hash and image url.
+_CardToAdd = Tuple[util.CardDesc, str, str]
+
+
+def _add_cards_in_session(session_index: int,
+                          next_card: Callable[[], Optional[_CardToAdd]],
+                          selenium_driver_path: pathlib.Path, untap_url: str,
+                          untap_username: str, untap_password: str,
+                          manifest: upload_manifest.UploadManifest,
+                          main_deck_back_link: str, memory_deck_back_link: str,
+                          browser: BrowserOptions,
+                          timings: util.StepTimings) -> int:
+  """Adds cards from next_card until it returns None, in one browser.
+
+  Returns the number of cards added.
+  """
+  driver = None
+  num_added = 0
+  try:
+    while True:
+      card = next_card()
+      if card is None:
+        return num_added
+      desc, content_hash, url = card
+      # Only open the browser once there is a card to add.
+      if driver is None:
+        driver = _open_untap_deck(selenium_driver_path, untap_url,
+                                  untap_username, untap_password, browser,
+                                  session_index, timings)
+      _add_card(
+          driver, desc, manifest.card_set_name, url,
+          _card_back_link(desc, main_deck_back_link, memory_deck_back_link),
+          timings)
+      manifest.record_card(desc.title, content_hash, url,
+                           upload_manifest.STATUS_ADDED)
+      num_added += 1
+  finally:
+    if driver is not None:
+      driver.quit()
+
+
+def _run_untap_sessions(next_cards: List[Callable[[], Optional[_CardToAdd]]],
+                        *session_args) -> List[BaseException]:
+  """Runs one browser session per next_card function, at the same time.
+
+  A failed session does not stop the others. Its remaining cards stay
+  uploaded but not added, so a rerun adds them. Returns the errors.
+  """
+  errors = []
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=len(next_cards)) as executor:
+    futures = {
+        executor.submit(_add_cards_in_session, i, next_card, *session_args): i
+        for i, next_card in enumerate(next_cards)
+    }
+    for future in concurrent.futures.as_completed(futures):
+      try:
+        print(f"Untap session {futures[future]} added "
+              f"{future.result()} cards.")
+      except _PipelineStopped:
+        pass
+      except Exception as e:
+        print(f"Untap session {futures[future]} failed: {e!r}")
+        errors.append(e)
+  if len(errors) > 0:
+    print(f"{len(errors)} of {len(next_cards)} untap sessions failed, rerun "
+          "to add their remaining cards.")
+  return errors
+
+
+def _upload_missing_images(
+    image_paths: List[pathlib.Path], ftp_target: FtpTarget,
+    manifest: upload_manifest.UploadManifest) -> Dict[str, str]:
+  """Uploads images not yet on the server, returning content hash -> url."""
+  hash_to_path = {}
+  for image_path in image_paths:
+    hash_to_path[upload_manifest.hash_file(image_path)] = image_path
+  missing_hashes = [
+      content_hash for content_hash in hash_to_path
+      if manifest.get_url(content_hash) is None
+  ]
+  print(f"{len(hash_to_path) - len(missing_hashes)} images already uploaded, "
+        f"{len(missing_hashes)} to upload.")
+  if len(missing_hashes) > 0:
+    missing_paths = [hash_to_path[h] for h in missing_hashes]
+    with FtpSessionPool(ftp_target.password,
+                        host=ftp_target.host,
+                        port=ftp_target.port,
+                        user=ftp_target.user,
+                        public_url=ftp_target.public_url) as ftp_pool:
+      urls = ftp_pool.upload_all(missing_paths, [
+          upload_manifest.get_remote_name(h, p.suffix)
+          for h, p in zip(missing_hashes, missing_paths)
+      ])
+      ftp_pool.report()
+    for content_hash, url in zip(missing_hashes, urls):
+      manifest.record_image(content_hash, url)
+  return {h: manifest.get_url(h) for h in hash_to_path}
+
+
 def upload_cards(card_metadata: List[UploadCardMetadata],
-                 selenium_driver_path: pathlib.Path, card_set_name: str,
-                 untap_username: str, untap_password: str):
+                 selenium_driver_path: pathlib.Path,
+                 card_set_name: str,
+                 untap_username: str,
+                 untap_password: str,
+                 ftp_target: Optional[FtpTarget] = None,
+                 untap_url: str = UNTAP_URL,
+                 manifest_dir: pathlib.Path = upload_manifest.MANIFEST_DIR,
+                 browser: Optional[BrowserOptions] = None):
+  """Uploads the images and adds each card to untap.
+
+  Images already on the server and cards already added to this card set are
+  skipped, so rerunning an interrupted upload resumes where it stopped. The
+  FTP target defaults to the real server, using the password in
+  FTP_PASSWD_FILE. The cards are split evenly between the browser sessions.
+  """
   assert selenium_driver_path.is_file()
-  with open(FTP_PASSWD_FILE, "r", encoding="utf=8") as f:
-    ftp_pass = f.read().strip()
-  ftp_session = ftplib.FTP_TLS()
-  ftp_session.set_debuglevel(2)
-  ftp_session.connect(FTP_URL, 21)
-  ftp_session.sendcmd(f"USER {FTP_USER}")
-  ftp_session.sendcmd(f"PASS {ftp_pass}")
-
-  main_deck_back_link = _attempt(
-      lambda: _upload_image(ftp_session, util.MAIN_CARD_BACK_IMG_PATH))
-  memory_deck_back_link = _attempt(
-      lambda: _upload_image(ftp_session, util.MEMORY_CARD_BACK_IMG_PATH))
-
-  # If we go to sleep, the automated browser iterations may fail.
-  driver = webdriver.Chrome(executable_path=selenium_driver_path)
-  driver.get(UNTAP_URL)
-  driver.set_window_position(0, 0)
-  # The damn icons on the left hand side can cover up the buttons we need.
-  driver.set_window_size(1920, 1080)
-  _login(driver, untap_username, untap_password)
-  time.sleep(SLEEP_TIME)
-  _dismiss_notifications(driver)
-  time.sleep(SLEEP_TIME)
-  _click_new_deck(driver)
-  time.sleep(SLEEP_TIME)
-  _click_custom_deck(driver)
-  #pylint: disable=cell-var-from-loop
-  for card in card_metadata:
-    time.sleep(SLEEP_TIME)
-    card_link = _attempt(lambda: _upload_image(ftp_session, card.image_path))
-    print(f"Uploaded '{card.desc.title}' to {card_link}")
-    _attempt(lambda: _open_submenu(driver))
-    time.sleep(SLEEP_TIME)
-    _attempt(lambda: _click_i_understand(driver))
-    time.sleep(SLEEP_TIME)
-    card_back = (memory_deck_back_link if card.desc.card_type
-                 == util.CardType.MEMORY else main_deck_back_link)
-    _attempt(lambda: _fill_card_contents(driver, card.desc.title, card_set_name,
-                                         card_link, card_back))
-
-  ftp_session.close()
+  if browser is None:
+    browser = BrowserOptions()
+  assert browser.sessions > 0, "Must add cards with at least one browser."
+  if ftp_target is None:
+    ftp_target = _load_ftp_target()
+  manifest = upload_manifest.UploadManifest(card_set_name, manifest_dir)
+
+  # Images go up concurrently before the browser starts adding cards.
+  main_back_hash = upload_manifest.hash_file(util.MAIN_CARD_BACK_IMG_PATH)
+  memory_back_hash = upload_manifest.hash_file(util.MEMORY_CARD_BACK_IMG_PATH)
+  card_hashes = [
+      upload_manifest.hash_file(card.image_path) for card in card_metadata
+  ]
+  urls = _upload_missing_images(
+      [util.MAIN_CARD_BACK_IMG_PATH, util.MEMORY_CARD_BACK_IMG_PATH] +
+      [card.image_path for card in card_metadata], ftp_target, manifest)
+  main_deck_back_link = urls[main_back_hash]
+  memory_deck_back_link = urls[memory_back_hash]
+
+  cards_to_add = []
+  for card, card_hash in zip(card_metadata, card_hashes):
+    if manifest.is_added(card.desc.title, card_hash):
+      continue
+    manifest.record_card(card.desc.title, card_hash, urls[card_hash],
+                         upload_manifest.STATUS_UPLOADED)
+    cards_to_add.append((card, card_hash))
+  print(f"{len(card_metadata) - len(cards_to_add)} cards already in "
+        f"{card_set_name}, {len(cards_to_add)} to add.")
+  if len(cards_to_add) == 0:
+    return
+
+  timings = util.StepTimings()
+  num_sessions = min(browser.sessions, len(cards_to_add))
+  shards = [
+      iter([(card.desc, card_hash, urls[card_hash])
+            for card, card_hash in cards_to_add[i::num_sessions]])
+      for i in range(num_sessions)
+  ]
+  errors = _run_untap_sessions(
+      [functools.partial(next, shard, None) for shard in shards],
+      selenium_driver_path, untap_url, untap_username, untap_password, manifest,
+      main_deck_back_link, memory_deck_back_link, browser, timings)
+  timings.report("Untap step timings")
+  if len(errors) > 0:
+    raise errors[0]
+
+
+def upload_cards_pipelined(
+    descs: Iterable[util.CardDesc],
+    render: Callable[[util.CardDesc], bytes],
+    image_suffix: str,
+    selenium_driver_path: pathlib.Path,
+    card_set_name: str,
+    untap_username: str,
+    untap_password: str,
+    ftp_target: Optional[FtpTarget] = None,
+    untap_url: str = UNTAP_URL,
+    manifest_dir: pathlib.Path = upload_manifest.MANIFEST_DIR,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    browser: Optional[BrowserOptions] = None,
+    render_threads: int = 1):
+  """Renders, uploads and adds cards to untap as a three stage pipeline.
+
+  While the browser adds one card, the next is uploaded from memory and the
+  one after that is rendered, so nothing is written to disk. Bounded queues
+  connect the stages, so the run takes about as long as the slowest stage.
+  `render` returns the encoded image of a card, and is called on
+  render_threads threads at once, e.g. one per render worker. Skips work like
+  upload_cards. Each browser session takes the next uploaded card.
+  """
+  assert selenium_driver_path.is_file()
+  assert queue_size > 0, "Must buffer at least one card between stages."
+  assert render_threads > 0, "Must render on at least one thread."
+  if browser is None:
+    browser = BrowserOptions()
+  assert browser.sessions > 0, "Must add cards with at least one browser."
+  if ftp_target is None:
+    ftp_target = _load_ftp_target()
+  manifest = upload_manifest.UploadManifest(card_set_name, manifest_dir)
+  back_urls = _upload_missing_images(
+      [util.MAIN_CARD_BACK_IMG_PATH, util.MEMORY_CARD_BACK_IMG_PATH],
+      ftp_target, manifest)
+  main_deck_back_link = back_urls[upload_manifest.hash_file(
+      util.MAIN_CARD_BACK_IMG_PATH)]
+  memory_deck_back_link = back_urls[upload_manifest.hash_file(
+      util.MEMORY_CARD_BACK_IMG_PATH)]
+
+  timings = util.StepTimings()
+  rendered = queue.Queue(maxsize=queue_size)
+  uploaded = queue.Queue(maxsize=queue_size)
+  stop = threading.Event()
+  errors = []
+
+  def _put_rendered(desc: util.CardDesc, future: concurrent.futures.Future):
+    with timings.time("render"):
+      data = future.result()
+    _put(rendered, (desc, data), stop)
+
+  def _render_stage():
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=render_threads,
+        thread_name_prefix="pipeline_render") as executor:
+      # (desc, future) of the cards being rendered, in order.
+      rendering = collections.deque()
+      for desc in descs:
+        rendering.append((desc, executor.submit(render, desc)))
+        if len(rendering) >= render_threads:
+          _put_rendered(*rendering.popleft())
+      while len(rendering) > 0:
+        _put_rendered(*rendering.popleft())
+    _put(rendered, None, stop)
+
+  def _upload_stage(ftp_pool: FtpSessionPool):
+    while True:
+      item = _get(rendered, stop)
+      if item is None:
+        break
+      desc, data = item
+      content_hash = upload_manifest.hash_bytes(data)
+      if manifest.is_added(desc.title, content_hash):
+        print(f"Already added '{desc.title}'")
+        continue
+      url = manifest.get_url(content_hash)
+      if url is None:
+        with timings.time("upload"):
+          url = ftp_pool.upload_bytes(
+              data, upload_manifest.get_remote_name(content_hash, image_suffix))
+        manifest.record_image(content_hash, url)
+      manifest.record_card(desc.title, content_hash, url,
+                           upload_manifest.STATUS_UPLOADED)
+      _put(uploaded, (desc, content_hash, url), stop)
+    _put(uploaded, None, stop)
+
+  def _next_uploaded() -> Optional[_CardToAdd]:
+    # Time spent here means the browser is waiting on the other stages.
+    with timings.time("wait for upload"):
+      item = _get(uploaded, stop)
+    if item is None:
+      # Lets the other browser sessions see the end too.
+      _put(uploaded, None, stop)
+    return item
+
+  def _run_stage(stage: Callable, *args):
+    try:
+      stage(*args)
+    except _PipelineStopped:
+      pass
+    except BaseException as e:
+      errors.append(e)
+      stop.set()
+
+  with FtpSessionPool(ftp_target.password,
+                      host=ftp_target.host,
+                      port=ftp_target.port,
+                      user=ftp_target.user,
+                      public_url=ftp_target.public_url) as ftp_pool:
+    threads = [
+        threading.Thread(target=_run_stage, args=(_render_stage,)),
+        threading.Thread(target=_run_stage, args=(_upload_stage, ftp_pool)),
+    ]
+    for thread in threads:
+      thread.start()
+    try:
+      session_errors = _run_untap_sessions([_next_uploaded] * browser.sessions,
+                                           selenium_driver_path, untap_url,
+                                           untap_username, untap_password,
+                                           manifest, main_deck_back_link,
+                                           memory_deck_back_link, browser,
+                                           timings)
+    finally:
+      stop.set()
+      for thread in threads:
+        thread.join()
+  timings.report("Pipeline step timings")
+  errors.extend(session_errors)
+  if len(errors) > 0:
+    raise errors[0]
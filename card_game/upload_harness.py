@@ -0,0 +1,195 @@
+# Runs upload.upload_cards end to end against local stand-ins.
+#
+# Images go to a local_ftp.LocalFtpServer, and the browser drives a static
+# copy of the untap pages from resources/fake_untap.html. Reports cards/min,
+# so that the upload path can be benchmarked without credentials. For instance:
+#   python -m card_game.upload_harness --delay_ms 100 --ftp_latency 0.05
+
+import argparse
+import http.server
+import json
+import pathlib
+import tempfile
+import threading
+import time
+from typing import List
+
+from . import __main__ as card_game_main
+from . import encoding, local_ftp, render_context, upload, util
+
+#pylint: disable=too-many-arguments
+#pylint: disable=too-many-locals
+
+FAKE_UNTAP_PAGE_PATH = util.RESOURCE_DIR.joinpath("fake_untap.html")
+assert FAKE_UNTAP_PAGE_PATH.is_file()
+
+
+class _FakeUntapHandler(http.server.BaseHTTPRequestHandler):
+
+  def _send(self, status: int, content_type: str, body: bytes):
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def do_GET(self):
+    #pylint: disable=invalid-name
+    path = self.path.split("?", 1)[0]
+    if path == "/":
+      self._send(200, "text/html", FAKE_UNTAP_PAGE_PATH.read_bytes())
+      return
+    # Uploaded images are served back, like the real image host.
+    image_path = self.server.image_dir.joinpath(pathlib.Path(path).name)
+    if path.startswith("/images/") and image_path.is_file():
+      self._send(200, "image/png", image_path.read_bytes())
+      return
+    self._send(404, "text/plain", b"Not found")
+
+  def do_POST(self):
+    #pylint: disable=invalid-name
+    if self.path != "/cards":
+      self._send(404, "text/plain", b"Not found")
+      return
+    length = int(self.headers.get("Content-Length", 0))
+    self.server.add_card(json.loads(self.rfile.read(length)))
+    self._send(200, "application/json", b"{}")
+
+  def log_message(self, *_):
+    # Keeps the harness output readable.
+    pass
+
+
+class FakeUntapServer(local_ftp.BackgroundServer,
+                      http.server.ThreadingHTTPServer):
+  """Serves the fake untap page and records each card it adds."""
+
+  daemon_threads = True
+
+  def __init__(self, image_dir: pathlib.Path, delay_ms: int = 0):
+    super().__init__(("127.0.0.1", 0), _FakeUntapHandler)
+    self.image_dir = image_dir
+    self.delay_ms = delay_ms
+    self.added_cards = []
+    self._lock = threading.Lock()
+
+  @property
+  def base_url(self) -> str:
+    return f"http://127.0.0.1:{self.server_address[1]}"
+
+  @property
+  def url(self) -> str:
+    return f"{self.base_url}/?delay_ms={self.delay_ms}"
+
+  @property
+  def image_url(self) -> str:
+    return f"{self.base_url}/images"
+
+  def add_card(self, card: dict):
+    with self._lock:
+      self.added_cards.append(card)
+
+
+def run_harness(cards: List[util.CardDesc], selenium_driver_path: pathlib.Path,
+                delay_ms: int, ftp_latency: float, pipelined: bool,
+                browser: upload.BrowserOptions) -> float:
+  """Uploads the cards to fresh stand-ins, returning cards/min.
+
+  Rendering is timed too when pipelined, since it overlaps with the upload.
+  """
+  ctx = render_context.get_default_render_context()
+  output_profile = encoding.PROFILES["optimized_png"]
+
+  def _render(desc: util.CardDesc) -> bytes:
+    return encoding.encode_image(card_game_main.render_card_image(desc, ctx),
+                                 output_profile)
+
+  with tempfile.TemporaryDirectory() as temp_dir:
+    temp_dir = pathlib.Path(temp_dir)
+    image_dir = temp_dir.joinpath("img")
+    image_dir.mkdir()
+    card_metadata = []
+    if not pipelined:
+      card_metadata = [
+          upload.UploadCardMetadata(image_path=card_game_main.render_card(
+              desc,
+              output_dir=image_dir,
+              output_profile=output_profile,
+              ctx=ctx),
+                                    desc=desc) for desc in cards
+      ]
+    ftp_root = temp_dir.joinpath("ftp")
+    with local_ftp.LocalFtpServer(ftp_root, latency=ftp_latency) as ftp_server:
+      with FakeUntapServer(ftp_root, delay_ms) as untap_server:
+        ftp_target = upload.FtpTarget(password=local_ftp.DEFAULT_PASSWORD,
+                                      host="127.0.0.1",
+                                      port=ftp_server.port,
+                                      user=local_ftp.DEFAULT_USER,
+                                      public_url=untap_server.image_url)
+        start = time.perf_counter()
+        if pipelined:
+          upload.upload_cards_pipelined(
+              cards,
+              _render,
+              output_profile.suffix,
+              selenium_driver_path,
+              "HARNESS",
+              "harness_user",
+              "harness_password",
+              ftp_target=ftp_target,
+              untap_url=untap_server.url,
+              manifest_dir=temp_dir.joinpath("manifest"),
+              browser=browser)
+        else:
+          upload.upload_cards(card_metadata,
+                              selenium_driver_path,
+                              "HARNESS",
+                              "harness_user",
+                              "harness_password",
+                              ftp_target=ftp_target,
+                              untap_url=untap_server.url,
+                              manifest_dir=temp_dir.joinpath("manifest"),
+                              browser=browser)
+        seconds = time.perf_counter() - start
+        added_titles = sorted(c["title"] for c in untap_server.added_cards)
+  assert added_titles == sorted(desc.title for desc in cards), \
+    f"Fake untap received {added_titles}"
+  cards_per_min = len(cards) / seconds * 60
+  print(f"Uploaded {len(cards)} cards in {seconds:.1f}s: "
+        f"{cards_per_min:.1f} cards/min")
+  return cards_per_min
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--cards",
+                      type=pathlib.Path,
+                      default=util.SAMPLE_CARDS_PATH)
+  parser.add_argument("--selenium_driver_path",
+                      type=pathlib.Path,
+                      default="./drivers/chromedriver")
+  # Simulated time for each dialog of the fake page to appear.
+  parser.add_argument("--delay_ms", type=int, default=100)
+  # Simulated seconds added to each FTP upload.
+  parser.add_argument("--ftp_latency", type=float, default=0.05)
+  parser.add_argument("--pipelined", action="store_true")
+  parser.add_argument("--untap_sessions",
+                      type=int,
+                      default=upload.UNTAP_SESSIONS)
+  parser.add_argument("--headless", action="store_true")
+  # Runs after the first reuse the browser profiles, so they skip the login.
+  parser.add_argument("--runs", type=int, default=1)
+  args = parser.parse_args()
+  cards = util.load_card_descs(args.cards)
+  with tempfile.TemporaryDirectory() as profile_dir:
+    browser = upload.BrowserOptions(sessions=args.untap_sessions,
+                                    headless=args.headless,
+                                    profile_dir=pathlib.Path(profile_dir))
+    for run in range(args.runs):
+      print(f"Run {run + 1} of {args.runs}")
+      run_harness(cards, args.selenium_driver_path, args.delay_ms,
+                  args.ftp_latency, args.pipelined, browser)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,97 @@
+# Remembers what has already been uploaded, so that uploads are incremental.
+#
+# Images are shared between card sets and keyed by a hash of their contents.
+# Each card set also tracks which cards have been confirmed as added to
+# untap, so an interrupted set resumes from the last confirmed card.
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from . import util
+
+MANIFEST_DIR = util.LOCAL_PATH.joinpath("upload_manifest")
+IMAGES_MANIFEST_NAME = "images.json"
+
+# Per-card status within a card set.
+STATUS_UPLOADED = "uploaded"
+STATUS_ADDED = "added"
+
+
+def hash_bytes(data: bytes) -> str:
+  return hashlib.md5(data).hexdigest()
+
+
+def hash_file(path: pathlib.Path) -> str:
+  return hash_bytes(path.read_bytes())
+
+
+def get_remote_name(content_hash: str, suffix: str) -> str:
+  """Names images by content, so a changed card never reuses a stale URL."""
+  return f"{content_hash}{suffix}"
+
+
+def _load_json(path: pathlib.Path) -> Dict[str, Any]:
+  if not path.is_file():
+    return {}
+  with path.open(encoding="utf-8") as json_file:
+    return json.load(json_file)
+
+
+def _save_json(path: pathlib.Path, data: Dict[str, Any]):
+  path.parent.mkdir(parents=True, exist_ok=True)
+  # Write then rename, so that an interrupted run never leaves a partial file.
+  fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+  with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+    json.dump(data, tmp_file, indent=2, sort_keys=True)
+  os.replace(tmp_path, path)
+
+
+class UploadManifest():
+  """The uploaded images and the per-card status of one card set.
+
+  Every change is written to disk immediately.
+  """
+
+  def __init__(self,
+               card_set_name: str,
+               manifest_dir: pathlib.Path = MANIFEST_DIR):
+    assert "/" not in card_set_name, f"Invalid card set: {card_set_name}"
+    self.card_set_name = card_set_name
+    self.images_path = manifest_dir.joinpath(IMAGES_MANIFEST_NAME)
+    self.set_path = manifest_dir.joinpath(f"{card_set_name}.json")
+    # content hash -> remote url
+    self.images = _load_json(self.images_path)
+    # card title -> {"image_hash", "url", "status"}
+    self.cards = _load_json(self.set_path)
+    self._lock = threading.Lock()
+
+  def get_url(self, content_hash: str) -> Optional[str]:
+    with self._lock:
+      return self.images.get(content_hash, None)
+
+  def record_image(self, content_hash: str, url: str):
+    with self._lock:
+      self.images[content_hash] = url
+      _save_json(self.images_path, self.images)
+
+  def is_added(self, title: str, content_hash: str) -> bool:
+    """Whether this exact image was already added to untap for this set."""
+    with self._lock:
+      card = self.cards.get(title, None)
+      return (card is not None and card["status"] == STATUS_ADDED and
+              card["image_hash"] == content_hash)
+
+  def record_card(self, title: str, content_hash: str, url: str, status: str):
+    assert status in (STATUS_UPLOADED, STATUS_ADDED), f"Bad status: {status}"
+    with self._lock:
+      self.cards[title] = {
+          "image_hash": content_hash,
+          "url": url,
+          "status": status,
+      }
+      _save_json(self.set_path, self.cards)
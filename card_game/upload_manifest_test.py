@@ -0,0 +1,94 @@
+# Tests incremental uploads against the local FTP stand-in.
+#
+# Run from the project root, with either runner:
+#   python -m unittest card_game.upload_manifest_test
+#   python -m pytest card_game/upload_manifest_test.py
+
+import contextlib
+import io
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from card_game import local_ftp, upload, upload_manifest
+
+#pylint: disable=protected-access
+
+CARD_SET_NAME = "test_set"
+TITLE = "Fireball"
+
+
+class UploadManifestTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = pathlib.Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.manifest_dir = self.temp_dir.joinpath("manifest")
+    self.image_path = self.temp_dir.joinpath("fireball.png")
+    self.image_path.write_bytes(b"first version")
+
+  def _open_manifest(self) -> upload_manifest.UploadManifest:
+    return upload_manifest.UploadManifest(CARD_SET_NAME, self.manifest_dir)
+
+  def _upload(self, server: local_ftp.LocalFtpServer,
+              manifest: upload_manifest.UploadManifest):
+    ftp_target = upload.FtpTarget(password=server.password,
+                                  host="127.0.0.1",
+                                  port=server.port,
+                                  user=server.user)
+    with contextlib.redirect_stdout(io.StringIO()):
+      return upload._upload_missing_images([self.image_path], ftp_target,
+                                           manifest)
+
+  def test_unchanged_hash_is_skipped(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote")) as server:
+      first_urls = self._upload(server, self._open_manifest())
+      # A later run reads what was uploaded from disk.
+      second_urls = self._upload(server, self._open_manifest())
+    self.assertEqual(server.num_stored, 1)
+    self.assertEqual(second_urls, first_urls)
+
+  def test_changed_hash_is_uploaded(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote")) as server:
+      first_urls = self._upload(server, self._open_manifest())
+      self.image_path.write_bytes(b"second version")
+      second_urls = self._upload(server, self._open_manifest())
+    self.assertEqual(server.num_stored, 2)
+    content_hash = upload_manifest.hash_file(self.image_path)
+    self.assertNotIn(content_hash, first_urls)
+    remote_name = upload_manifest.get_remote_name(content_hash, ".png")
+    self.assertTrue(second_urls[content_hash].endswith(f"/{remote_name}"))
+    self.assertEqual(
+        server.root_dir.joinpath(remote_name).read_bytes(), b"second version")
+
+  def test_failed_upload_is_not_recorded(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote"),
+                                  drop_every=1) as server:
+      with self.assertRaises(EOFError):
+        self._upload(server, self._open_manifest())
+    content_hash = upload_manifest.hash_file(self.image_path)
+    self.assertIsNone(self._open_manifest().get_url(content_hash))
+    # The next run uploads it.
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote")) as server:
+      urls = self._upload(server, self._open_manifest())
+    self.assertEqual(server.num_stored, 1)
+    self.assertIsNotNone(urls[content_hash])
+
+  def test_changed_hash_is_added_again(self):
+    manifest = self._open_manifest()
+    old_hash = upload_manifest.hash_bytes(b"first version")
+    manifest.record_card(TITLE, old_hash, "http://host/old.png",
+                         upload_manifest.STATUS_UPLOADED)
+    # Uploaded but not yet confirmed on untap.
+    self.assertFalse(manifest.is_added(TITLE, old_hash))
+    manifest.record_card(TITLE, old_hash, "http://host/old.png",
+                         upload_manifest.STATUS_ADDED)
+    manifest = self._open_manifest()
+    self.assertTrue(manifest.is_added(TITLE, old_hash))
+    new_hash = upload_manifest.hash_bytes(b"second version")
+    self.assertFalse(manifest.is_added(TITLE, new_hash))
+
+
+if __name__ == "__main__":
+  unittest.main()
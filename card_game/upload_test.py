@@ -0,0 +1,73 @@
+# Tests the FTP upload pool against the local FTP stand-in.
+#
+# Run from the project root, with either runner:
+#   python -m unittest card_game.upload_test
+#   python -m pytest card_game/upload_test.py
+
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from card_game import local_ftp, upload
+
+NUM_FILES = 12
+
+
+class FtpSessionPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = pathlib.Path(tempfile.mkdtemp())
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.local_dir = self.temp_dir.joinpath("local")
+    self.local_dir.mkdir()
+    self.paths = []
+    for i in range(NUM_FILES):
+      path = self.local_dir.joinpath(f"card_{i}.png")
+      path.write_bytes(bytes([i]) * (1000 + i))
+      self.paths.append(path)
+
+  def _open_pool(self, server: local_ftp.LocalFtpServer,
+                 **kwargs) -> upload.FtpSessionPool:
+    ftp_pool = upload.FtpSessionPool(local_ftp.DEFAULT_PASSWORD,
+                                     host="127.0.0.1",
+                                     port=server.port,
+                                     **kwargs)
+    self.addCleanup(ftp_pool.close)
+    return ftp_pool
+
+  def test_dropped_connections_are_retried(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote"),
+                                  drop_every=3) as server:
+      ftp_pool = self._open_pool(server, size=3, tries=3)
+      urls = ftp_pool.upload_all(self.paths)
+    self.assertGreater(server.num_dropped, 0)
+    self.assertEqual(ftp_pool.num_retries, server.num_dropped)
+    # Every file arrived exactly once, whole.
+    self.assertEqual(server.num_stored, NUM_FILES)
+    for path, url in zip(self.paths, urls):
+      self.assertEqual(url, f"{ftp_pool.public_url}/{path.name}")
+      self.assertEqual(
+          server.root_dir.joinpath(path.name).read_bytes(), path.read_bytes())
+
+  def test_gives_up_after_tries(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote"),
+                                  drop_every=1) as server:
+      ftp_pool = self._open_pool(server, size=1, tries=2)
+      with self.assertRaises(EOFError):
+        ftp_pool.upload(self.paths[0])
+    self.assertEqual(server.num_dropped, 2)
+    self.assertEqual(server.num_stored, 0)
+
+  def test_local_errors_are_not_retried(self):
+    with local_ftp.LocalFtpServer(self.temp_dir.joinpath("remote")) as server:
+      ftp_pool = self._open_pool(server, tries=3)
+      # Exists, so it has a size, but can't be opened as a file.
+      with self.assertRaises(IsADirectoryError):
+        ftp_pool.upload(self.local_dir)
+    self.assertEqual(ftp_pool.num_retries, 0)
+    self.assertEqual(ftp_pool.num_connects, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,10 +1,13 @@
+import contextlib
 import dataclasses
 import enum
 import hashlib
 import json
 import math
 import pathlib
-from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from . import colors
 
@@ -12,14 +15,21 @@ from . import colors
 #pylint: disable=too-many-instance-attributes
 
 CONFIG_PATH = pathlib.Path("./config.json")
-if CONFIG_PATH.is_file():
+DEFAULT_PIXELS_PER_INCH = 100
+
+
+def load_config() -> Dict[str, Any]:
+  if not CONFIG_PATH.is_file():
+    return {}
   with open(CONFIG_PATH, "r", encoding="utf=8") as config_file:
-    GLOBAL_CONFIG = json.loads(config_file.read())
-  print("Loaded global config:", GLOBAL_CONFIG)
-else:
-  GLOBAL_CONFIG = {}
+    config = json.loads(config_file.read())
+  print("Loaded global config:", config)
+  return config
+
+
+GLOBAL_CONFIG = load_config()
 
-PIXELS_PER_INCH = GLOBAL_CONFIG.get("pixels_per_inch", 100)
+PIXELS_PER_INCH = GLOBAL_CONFIG.get("pixels_per_inch", DEFAULT_PIXELS_PER_INCH)
 
 FONT_DIR = pathlib.Path("./fonts")
 assert FONT_DIR.is_dir()
@@ -46,6 +56,12 @@ MAIN_CARD_BACK_IMG_PATH = RESOURCE_DIR.joinpath("card_back.png")
 assert MAIN_CARD_BACK_IMG_PATH.is_file()
 MEMORY_CARD_BACK_IMG_PATH = RESOURCE_DIR.joinpath("card_back_pentagon.png")
 assert MEMORY_CARD_BACK_IMG_PATH.is_file()
+# A handful of representative cards, used when there is no card database.
+SAMPLE_CARDS_PATH = RESOURCE_DIR.joinpath("sample_cards.json")
+
+# Per-user storage for credentials and caches that outlive a single run.
+LOCAL_PATH = pathlib.Path.home().joinpath(".local").joinpath("share").joinpath(
+    "card_game")
 
 Coord = Tuple[int, int]
 
@@ -187,12 +203,52 @@ def field_dict_to_card_desc(fields: Dict[str, Any]):
   )
 
 
+def load_card_descs(path: pathlib.Path) -> List[CardDesc]:
+  """Loads a json list of field dicts, as posted to the render server."""
+  with open(path, "r", encoding="utf-8") as json_file:
+    return [field_dict_to_card_desc(fields) for fields in json.load(json_file)]
+
+
 def sigmoid(x):
   sig = 1 / (1 + math.exp(-x))
   return sig
 
 
 def get_output_path(output_dir: pathlib.Path,
-                    card_desc: CardDesc) -> pathlib.Path:
+                    card_desc: CardDesc,
+                    suffix: str = ".png") -> pathlib.Path:
   assert output_dir.is_dir()
-  return output_dir.joinpath(f"{card_desc.hash_all()}.png")
+  return output_dir.joinpath(f"{card_desc.hash_all()}{suffix}")
+
+
+class StepTimings():
+  """Accumulates the wall time spent in each named step. Thread safe."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.counts = {}
+    self.seconds = {}
+    self.max_seconds = {}
+
+  def record(self, step: str, seconds: float):
+    with self._lock:
+      self.counts[step] = self.counts.get(step, 0) + 1
+      self.seconds[step] = self.seconds.get(step, 0) + seconds
+      self.max_seconds[step] = max(self.max_seconds.get(step, 0), seconds)
+
+  @contextlib.contextmanager
+  def time(self, step: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(step, time.perf_counter() - start)
+
+  def report(self, title: str):
+    with self._lock:
+      print(f"{title}:")
+      for step, count in self.counts.items():
+        print(f"  {step}: {count}x, "
+              f"{self.seconds[step] / count * 1000:.1f} ms avg, "
+              f"{self.max_seconds[step] * 1000:.1f} ms max, "
+              f"{self.seconds[step]:.2f}s total")
@@ -0,0 +1,182 @@
+# Re-renders decks whenever a deck, the card snapshot or config.json changes.
+#
+# The process stays up between edits, so fonts, icons, render contexts and the
+# card database are only loaded once. Each update only renders cards whose
+# description or resolution changed, and removes the images of cards that left
+# a deck. For instance:
+#   python -m card_game --watch --card_snapshot resources/sample_cards.json
+
+import pathlib
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from . import encoding, render_context, util, worker_pool
+
+#pylint: disable=too-many-arguments
+#pylint: disable=too-many-instance-attributes
+#pylint: disable=too-many-locals
+#pylint: disable=too-many-branches
+
+# Seconds between checks for changed files.
+POLL_SECONDS = 0.5
+# Edits closer together than this are rendered as a single update.
+DEBOUNCE_SECONDS = 0.5
+
+
+class DeckWatcher():
+  """Keeps output_dir/<deck name>/card_<idx> in sync with the watched files.
+
+  Cards come from card_snapshot, a json list like sample_cards.json, which is
+  reloaded when it changes. Without a snapshot, cards come from db, which is
+  only downloaded once.
+  """
+
+  def __init__(
+      self, deck_dir: pathlib.Path, output_dir: pathlib.Path,
+      load_decklist: Callable[[pathlib.Path, Any, bool], List[util.CardDesc]],
+      render_encoded: Callable[[util.CardDesc, int, encoding.OutputProfile],
+                               bytes], card_snapshot: Optional[pathlib.Path],
+      db: Any, output_profile: encoding.OutputProfile,
+      pool: worker_pool.RenderPool, ignore_decklist_counts: bool):
+    assert deck_dir.is_dir(), f"Directory not found: {deck_dir}"
+    assert (card_snapshot is None) != (db is None), \
+      "Must watch either a card snapshot or a card database."
+    self.deck_dir = deck_dir
+    self.output_dir = output_dir
+    self.load_decklist = load_decklist
+    self.render_encoded = render_encoded
+    self.card_snapshot = card_snapshot
+    self.db = db
+    self.output_profile = output_profile
+    self.pool = pool
+    self.ignore_decklist_counts = ignore_decklist_counts
+    self.ctx = None
+    # output path -> key of the card image written there.
+    self.written: Dict[pathlib.Path, str] = {}
+    # card key -> encoded image, for cards in the current decks.
+    self.encoded: Dict[str, bytes] = {}
+
+  def get_watched_paths(self) -> List[pathlib.Path]:
+    paths = sorted(self.deck_dir.glob("*.deck")) + [util.CONFIG_PATH]
+    if self.card_snapshot is not None:
+      paths.append(self.card_snapshot)
+    return paths
+
+  def _get_mtimes(self) -> Dict[pathlib.Path, int]:
+    mtimes = {}
+    for path in self.get_watched_paths():
+      try:
+        mtimes[path] = path.stat().st_mtime_ns
+      except FileNotFoundError:
+        # Deleted since the glob, the next poll catches up.
+        pass
+    return mtimes
+
+  def _get_key(self, desc: util.CardDesc) -> str:
+    return f"{desc.hash_all()}_{self.ctx.pixels_per_inch}"
+
+  def update(self, changed: Set[pathlib.Path]):
+    """Brings every deck's images up to date after these files changed."""
+    start = time.perf_counter()
+    if self.ctx is None or util.CONFIG_PATH in changed:
+      self.ctx = render_context.get_render_context(util.load_config().get(
+          "pixels_per_inch", util.DEFAULT_PIXELS_PER_INCH))
+    if self.card_snapshot is not None and (self.card_snapshot in changed or
+                                           self.db is None):
+      self.db = {
+          desc.title: desc for desc in util.load_card_descs(self.card_snapshot)
+      }
+
+    # Decks are cheap to parse, so all of them are checked every time.
+    wanted: Dict[pathlib.Path, util.CardDesc] = {}
+    kept_dirs = set()
+    for decklist in sorted(self.deck_dir.glob("*.deck")):
+      deck_output_dir = self.output_dir.joinpath(decklist.stem)
+      try:
+        cards = self.load_decklist(decklist, self.db,
+                                   self.ignore_decklist_counts)
+      except (AssertionError, ValueError) as e:
+        # Leaves the previous images while the deck is mid-edit.
+        print(f"Skipping {decklist}: {e}")
+        kept_dirs.add(deck_output_dir)
+        continue
+      for idx, desc in enumerate(cards):
+        wanted[deck_output_dir.joinpath(
+            f"card_{idx}{self.output_profile.suffix}")] = desc
+
+    num_removed = 0
+    for output_path in list(self.written):
+      if output_path not in wanted and output_path.parent not in kept_dirs:
+        output_path.unlink(missing_ok=True)
+        del self.written[output_path]
+        num_removed += 1
+
+    keys = {
+        output_path: self._get_key(desc)
+        for output_path, desc in wanted.items()
+    }
+    to_render = {}
+    for output_path, desc in wanted.items():
+      if keys[output_path] not in self.encoded:
+        to_render[keys[output_path]] = desc
+    futures = {
+        key: self.pool.submit(self.render_encoded, desc,
+                              self.ctx.pixels_per_inch, self.output_profile)
+        for key, desc in to_render.items()
+    }
+    for key, future in futures.items():
+      try:
+        self.encoded[key] = future.result()
+      except Exception as e:
+        print(f"Failed to render '{to_render[key].title}': {e!r}")
+
+    num_written = 0
+    for output_path, key in keys.items():
+      if key not in self.encoded:
+        continue
+      if self.written.get(output_path) == key and output_path.is_file():
+        continue
+      output_path.parent.mkdir(parents=True, exist_ok=True)
+      output_path.write_bytes(self.encoded[key])
+      self.written[output_path] = key
+      num_written += 1
+    # Forgets cards that are no longer in any deck.
+    wanted_keys = set(keys.values())
+    self.encoded = {
+        key: data for key, data in self.encoded.items() if key in wanted_keys
+    }
+    print(f"Rendered {len(to_render)} cards, wrote {num_written} images and "
+          f"removed {num_removed} at {self.ctx.pixels_per_inch} PPI in "
+          f"{time.perf_counter() - start:.2f}s.")
+
+  def run(self,
+          poll_seconds: float = POLL_SECONDS,
+          debounce_seconds: float = DEBOUNCE_SECONDS):
+    """Renders everything, then re-renders on every change until killed."""
+    mtimes = self._get_mtimes()
+    self.update(set(mtimes))
+    while True:
+      print(f"Watching {self.deck_dir}, {util.CONFIG_PATH}" +
+            ("" if self.card_snapshot is None else f", {self.card_snapshot}"))
+      new_mtimes = mtimes
+      while new_mtimes == mtimes:
+        time.sleep(poll_seconds)
+        new_mtimes = self._get_mtimes()
+      # Waits for a burst of edits, such as a save-all, to settle.
+      while True:
+        time.sleep(debounce_seconds)
+        settled_mtimes = self._get_mtimes()
+        if settled_mtimes == new_mtimes:
+          break
+        new_mtimes = settled_mtimes
+      changed = {
+          path for path in set(mtimes) | set(new_mtimes)
+          if mtimes.get(path) != new_mtimes.get(path)
+      }
+      mtimes = new_mtimes
+      print("Changed:", ", ".join(sorted(str(path) for path in changed)))
+      try:
+        self.update(changed)
+      except Exception as e:
+        # A half-written file should not end the session.
+        print(f"Update failed: {e!r}")
@@ -0,0 +1,211 @@
+# A pool of render processes that start with every render asset loaded.
+#
+# A plain process pool imports card_game afresh in each worker, which then loads
+# its own fonts, icons and cached art layers on its first cards. Here they are
+# loaded once, in this process, before the workers fork, so every worker starts
+# warm and shares those pages copy-on-write. Workers live as long as the pool,
+# so each task only pays for the render itself. Where fork is unavailable, each
+# worker warms up once as it starts instead.
+
+import concurrent.futures
+import concurrent.futures.process
+import dataclasses
+import gc
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from . import encoding, memory, profiling, render_context, text_cache, util
+
+#pylint: disable=global-statement
+
+
+def get_warm_up_cards() -> List[util.CardDesc]:
+  """Sample cards covering every card type, element and element pairing."""
+  samples = util.load_card_descs(util.SAMPLE_CARDS_PATH)
+  elements = list(util.Element)
+  cards = list(samples)
+  for idx, primary in enumerate(elements):
+    secondary = elements[(idx + 1) % len(elements)]
+    cards.append(
+        dataclasses.replace(samples[idx % len(samples)],
+                            primary_element=primary,
+                            secondary_element=secondary))
+  return cards
+
+
+def warm_up(render: Callable[[util.CardDesc, render_context.RenderContext],
+                             object], pixels_per_inch: List[int]):
+  """Fills the font, icon and art caches by rendering the warm up cards."""
+  for ppi in pixels_per_inch:
+    ctx = render_context.get_render_context(ppi)
+    for desc in get_warm_up_cards():
+      render(desc, ctx)
+
+
+# Synchronizes the workers of a pool as they report their stats, see
+# RenderPool.close.
+_STATS_BARRIER: Optional[threading.Barrier] = None
+# Seconds a worker waits for the others before giving up on reporting.
+STATS_TIMEOUT_SECONDS = 60
+
+
+@dataclasses.dataclass
+class WorkerStats:
+  pid: int
+  peak_rss_bytes: int
+  memory_stats: Optional[memory.MemoryStats]
+  text_stats: text_cache.TextRunCache
+  encode_stats: encoding.EncodeStats
+
+
+def _start_worker(profile_dir, warm_up_fn: Optional[Callable[[], None]],
+                  account_memory: bool, stats_barrier):
+  global _STATS_BARRIER
+  _STATS_BARRIER = stats_barrier
+  # Ctrl+C reaches the whole process group. The parent shuts the pool down.
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  # Forked workers inherit the accounting of the parent, whose numbers they
+  # could never report. They count their own, which the parent merges in.
+  memory.stop()
+  if account_memory:
+    memory.start()
+  text_cache.CACHE.reset_counts()
+  encoding.STATS.reset()
+  if profile_dir is not None:
+    profiling.start_worker(profile_dir)
+  if warm_up_fn is not None:
+    warm_up_fn()
+
+
+def _get_worker_stats() -> WorkerStats:
+  # Holds this worker until every worker took one of these tasks, so that
+  # each reports exactly once.
+  _STATS_BARRIER.wait(STATS_TIMEOUT_SECONDS)
+  return WorkerStats(os.getpid(), memory.get_process_peak_rss_bytes(),
+                     memory.get_active(), text_cache.CACHE, encoding.STATS)
+
+
+class RenderPool():
+  """Runs render tasks on `jobs` warm, long lived worker processes.
+
+  With a single job, tasks run in the calling thread and nothing is warmed up
+  ahead of time. Functions and arguments must be picklable, e.g. module level
+  functions and functools.partial of them. Workers that die, e.g. when killed
+  for running out of memory, fail their tasks and are replaced. Closing the
+  pool adds the memory, text cache and encode stats of the workers to those of
+  this process.
+  """
+
+  def __init__(self, jobs: int, warm_up_fn: Callable[[], None]):
+    assert jobs > 0, "Must render with at least one job."
+    self.jobs = jobs
+    self._warm_up_fn = warm_up_fn
+    self._forked = "fork" in multiprocessing.get_all_start_methods()
+    self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+    self._stats_barrier = None
+    self._restart_lock = threading.Lock()
+    if jobs == 1:
+      return
+    start = time.perf_counter()
+    if self._forked:
+      warm_up_fn()
+      # Keeps the collector of each worker from touching, and so copying, the
+      # pages of everything loaded so far.
+      gc.collect()
+      gc.freeze()
+    self._start_workers()
+    print(f"Started {jobs} warm render workers in "
+          f"{time.perf_counter() - start:.1f}s.")
+
+  def _start_workers(self):
+    mp_context = multiprocessing.get_context("fork" if self._forked else None)
+    self._stats_barrier = mp_context.Barrier(self.jobs)
+    # Forking copies only the calling thread, so no other thread may hold a
+    # lock at that moment. The profile sampler is the one thread started
+    # before the pool.
+    with profiling.sampling_paused():
+      self._executor = concurrent.futures.ProcessPoolExecutor(
+          max_workers=self.jobs,
+          mp_context=mp_context,
+          initializer=_start_worker,
+          initargs=(profiling.get_active_profile_dir(),
+                    None if self._forked else self._warm_up_fn,
+                    memory.get_active() is not None, self._stats_barrier))
+      # Starts every worker now, before the caller starts threads of its own.
+      for future in [
+          self._executor.submit(os.getpid) for _ in range(self.jobs)
+      ]:
+        future.result()
+
+  def _restart_workers(self,
+                       broken_executor: concurrent.futures.ProcessPoolExecutor):
+    with self._restart_lock:
+      # Another thread may have restarted them already.
+      if self._executor is not broken_executor:
+        return
+      print("A render worker died, e.g. from running out of memory. "
+            f"Restarting {self.jobs} render workers.")
+      broken_executor.shutdown(wait=False)
+      self._start_workers()
+
+  def submit(self, function: Callable, *args) -> concurrent.futures.Future:
+    executor = self._executor
+    if executor is not None:
+      try:
+        return executor.submit(function, *args)
+      except concurrent.futures.process.BrokenProcessPool:
+        self._restart_workers(executor)
+        return self._executor.submit(function, *args)
+    future = concurrent.futures.Future()
+    try:
+      future.set_result(function(*args))
+    except Exception as e:
+      future.set_exception(e)
+    return future
+
+  def map(self, function: Callable, *iterables: Iterable) -> Iterator:
+    """Like the builtin map, over the workers. Raises the first error."""
+    executor = self._executor
+    if executor is None:
+      return map(function, *iterables)
+    try:
+      return executor.map(function, *iterables)
+    except concurrent.futures.process.BrokenProcessPool:
+      self._restart_workers(executor)
+      return self._executor.map(function, *iterables)
+
+  def _merge_worker_stats(self):
+    try:
+      worker_stats = [
+          future.result() for future in
+          [self._executor.submit(_get_worker_stats) for _ in range(self.jobs)]
+      ]
+    except (concurrent.futures.process.BrokenProcessPool,
+            threading.BrokenBarrierError) as e:
+      print(f"Stats of the render workers are missing: {e!r}")
+      return
+    active_memory = memory.get_active()
+    for stats in worker_stats:
+      if active_memory is not None and stats.memory_stats is not None:
+        active_memory.merge(stats.memory_stats, f"worker {stats.pid}",
+                            stats.peak_rss_bytes)
+      text_cache.CACHE.merge(stats.text_stats)
+      encoding.STATS.merge(stats.encode_stats)
+
+  def close(self):
+    if self._executor is not None:
+      try:
+        self._merge_worker_stats()
+      finally:
+        self._executor.shutdown()
+        self._executor = None
+
+  def __enter__(self) -> "RenderPool":
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
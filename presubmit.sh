@@ -44,8 +44,9 @@ if [[ $? -ne 0 ]]; then
 fi
 
 phase "linting"
-# Exits nonzero if code quality score is less than `fail-under`.
-pylint --jobs=0 --fail-under=10 --indent-string="  " \
+# Exits nonzero if code quality score is less than `fail-under`. The project
+# root is on the path so the tests' `from card_game import ...` resolves.
+PYTHONPATH=. pylint --jobs=0 --fail-under=10 --indent-string="  " \
   --max-line-length=80 \
   --good-names="i,j,id,x,y,im,bb,c,x1,x2,y1,y2,t,v,db,f,e" \
   --disable=missing-docstring,broad-except\
@@ -54,4 +55,13 @@ if [[ $? -ne 0 ]]; then
   error "Linter errors."
 fi
 
+phase "testing"
+# card_game has no __init__.py, so the tests are named as modules.
+TEST_MODULES=$(ls "$PACKAGE_DIR"/*_test.py | sed -e 's#^\./##' -e 's#/#.#' \
+  -e 's#\.py$##')
+python -m unittest $TEST_MODULES
+if [[ $? -ne 0 ]]; then
+  error "Test failures."
+fi
+
 phase "Success!"